@@ -0,0 +1,171 @@
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Automatic batching of requests issued close together in time.
+
+Requests submitted to an AutoBatcher are collected for a short window, or
+until a full batch has been collected, and then sent as a single
+BatchHttpRequest. Each caller gets its own Future back:
+
+  batcher = AutoBatcher(http=http)
+  futures = [batcher.submit(service.events().list(calendarId=c))
+             for c in calendar_ids]
+  results = [f.result() for f in futures]
+"""
+
+import sys
+import threading
+
+from apiclient import futures
+from apiclient.http import BatchHttpRequest
+from apiclient.http import MAX_BATCH_SIZE
+from oauth2client import util
+
+DEFAULT_WINDOW = 0.01
+
+
+class AutoBatcher(object):
+  """Collects HttpRequests and sends them as BatchHttpRequests."""
+
+  @util.positional(1)
+  def __init__(self, http=None, window=DEFAULT_WINDOW,
+               max_batch_size=MAX_BATCH_SIZE, batch_uri=None, pool=None):
+    """Constructor.
+
+    Args:
+      http: httplib2.Http, the http object to send the batches with. If None
+        then the pool's per-thread http object is used, or else the http object
+        of the first request in each batch.
+      window: float, seconds to wait after the first request of a batch for
+        more requests to arrive.
+      max_batch_size: int, a batch is sent as soon as it holds this many
+        requests. May not be larger than MAX_BATCH_SIZE.
+      batch_uri: string, URI to send batch requests to.
+      pool: apiclient.futures.WorkerPool, the pool to send batches on. If None
+        then the process wide default pool is used.
+    """
+    if not 0 < max_batch_size <= MAX_BATCH_SIZE:
+      raise ValueError('max_batch_size must be between 1 and %d.' %
+                       MAX_BATCH_SIZE)
+    self._http = http
+    self._window = window
+    self._max_batch_size = max_batch_size
+    self._batch_uri = batch_uri
+    self._pool = pool
+    self._lock = threading.Lock()
+    self._pending = []
+    self._timer = None
+    self._closed = False
+
+  def _get_pool(self):
+    if self._pool is None:
+      return futures.default_pool()
+    return self._pool
+
+  def submit(self, request):
+    """Add a request to the next batch.
+
+    Media requests can't be batched and are executed on their own.
+
+    Args:
+      request: HttpRequest, the request to send.
+
+    Returns:
+      An apiclient.futures.Future whose result() is the deserialized response,
+      or raises the HttpError returned for this request.
+
+    Raises:
+      RuntimeError if the batcher has been closed.
+    """
+    if request.resumable is not None:
+      return request.execute_async(http=self._http, pool=self._get_pool())
+
+    future = futures.Future()
+    with self._lock:
+      if self._closed:
+        raise RuntimeError('Cannot submit to an AutoBatcher after close.')
+      self._pending.append((request, future))
+      if len(self._pending) >= self._max_batch_size:
+        batch = self._take_pending()
+      else:
+        batch = None
+        if self._timer is None:
+          self._timer = threading.Timer(self._window, self.flush)
+          self._timer.daemon = True
+          self._timer.start()
+    if batch:
+      self._send(batch)
+    return future
+
+  def _take_pending(self):
+    """Remove and return the pending requests. Must hold the lock."""
+    batch = self._pending
+    self._pending = []
+    if self._timer is not None:
+      self._timer.cancel()
+      self._timer = None
+    return batch
+
+  def flush(self):
+    """Send the requests collected so far without waiting for the window."""
+    with self._lock:
+      batch = self._take_pending()
+    if batch:
+      self._send(batch)
+
+  def close(self):
+    """Send any pending requests and stop accepting new ones."""
+    with self._lock:
+      self._closed = True
+    self.flush()
+
+  def _send(self, batch):
+    """Send a list of (request, future) pairs as one BatchHttpRequest."""
+    batch_request = BatchHttpRequest(batch_uri=self._batch_uri)
+    added = 0
+    for request, future in batch:
+      if future.set_running_or_notify_cancel():
+        batch_request.add(request, callback=self._make_callback(future))
+        added += 1
+    if not added:
+      return
+
+    def fail(exception, traceback):
+      for _, future in batch:
+        if not future.done():
+          future.set_exception(exception, traceback)
+
+    def on_done(batch_future):
+      exception, traceback = batch_future.exception_info()
+      if exception is not None:
+        fail(exception, traceback)
+
+    try:
+      batch_future = batch_request.execute_async(http=self._http,
+                                                 pool=self._get_pool())
+    except Exception, e:
+      # Such as a pool that has been shut down. Nothing will run the batch.
+      fail(e, sys.exc_info()[2])
+      return
+    batch_future.add_done_callback(on_done)
+
+  def _make_callback(self, future):
+
+    def callback(request_id, response, exception):
+      if exception is not None:
+        future.set_exception(exception)
+      else:
+        future.set_result(response)
+
+    return callback
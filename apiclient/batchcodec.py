@@ -0,0 +1,267 @@
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Writer and parser for the multipart/mixed bodies of batch requests.
+
+BatchHttpRequest used to build batch bodies out of email.mime objects and to
+parse responses with email.parser.FeedParser. This module produces the same
+bytes as the email package did by joining strings directly, and parses
+responses by scanning for boundaries, yielding each part as soon as it has
+been found.
+"""
+
+import random
+import re
+import sys
+import urlparse
+
+import httplib2
+
+from apiclient.errors import BatchError
+
+# The email package escapes lines of a payload that start with 'From '.
+_FROM_RE = re.compile(r'^From ', re.MULTILINE)
+
+# Boundaries are built like email.generator does.
+_BOUNDARY_FORMAT = '%%0%dd' % len(repr(sys.maxint - 1))
+
+
+def _mangle_from(payload):
+  if 'From ' in payload:
+    return _FROM_RE.sub('>From ', payload)
+  return payload
+
+
+def serialize_request(method, uri, headers, body):
+  """Serialize a request as an application/http document.
+
+  Args:
+    method: string, the HTTP method.
+    uri: string, the absolute URI of the request.
+    headers: dict, the request headers.
+    body: string, the request body, or None.
+
+  Returns:
+    The request as a string.
+  """
+  parsed = urlparse.urlparse(uri)
+  request_line = parsed.path
+  if parsed.params:
+    request_line += ';' + parsed.params
+  if parsed.query:
+    request_line += '?' + parsed.query
+  status_line = method + ' ' + request_line + ' HTTP/1.1\n'
+
+  major, minor = headers.get('content-type', 'application/json').split('/')
+  lines = ['Content-Type: %s/%s' % (major, minor), 'MIME-Version: 1.0']
+  for key, value in headers.iteritems():
+    if key != 'content-type':
+      lines.append('%s: %s' % (key, value))
+  lines.append('Host: %s' % parsed.netloc)
+
+  if body is None:
+    return status_line.encode('utf-8') + '\n'.join(lines)
+  lines.append('content-length: %d' % len(body))
+  lines.append('')
+  lines.append('')
+  return status_line.encode('utf-8') + '\n'.join(lines) + _mangle_from(body)
+
+
+def _make_boundary(text):
+  """Create a boundary that doesn't appear as a delimiter line in text."""
+  boundary = '=' * 15 + _BOUNDARY_FORMAT % random.randrange(sys.maxint) + '=='
+  if '--' + boundary not in text:
+    return boundary
+  b = boundary
+  counter = 0
+  while re.search('^--' + re.escape(b) + '(--)?$', text, re.MULTILINE):
+    b = boundary + '.' + str(counter)
+    counter += 1
+  return b
+
+
+def write_mixed(parts):
+  """Build the body of a batch request.
+
+  Args:
+    parts: list of (content_id, payload) pairs, where payload is a request
+      from serialize_request().
+
+  Returns:
+    (body, boundary): the multipart/mixed body as a string, and its boundary.
+  """
+  texts = []
+  for content_id, payload in parts:
+    texts.append(
+        'Content-Type: application/http\n'
+        'MIME-Version: 1.0\n'
+        'Content-Transfer-Encoding: binary\n'
+        'Content-ID: %s\n'
+        '\n' % content_id + _mangle_from(payload))
+  boundary = _make_boundary('\n'.join(texts))
+  delimiter = '\n--' + boundary + '\n'
+  return ('--' + boundary + '\n' + delimiter.join(texts) +
+          '\n--' + boundary + '--\n'), boundary
+
+
+def _parse_headers(text, pos):
+  """Parse header lines up to the first empty line.
+
+  Args:
+    text: string, the text to parse.
+    pos: int, the offset of the first header line.
+
+  Returns:
+    (headers, pos): a list of (name, value) pairs, and the offset of the body
+    that follows the empty line.
+  """
+  headers = []
+  end = len(text)
+  while pos < end:
+    eol = text.find('\n', pos)
+    if eol < 0:
+      eol = end
+    line = text[pos:eol]
+    if line.endswith('\r'):
+      line = line[:-1]
+    if not line:
+      return headers, eol + 1
+    if line[0] in ' \t' and headers:
+      # A continuation of the previous header.
+      name, value = headers[-1]
+      headers[-1] = (name, value + '\n' + line)
+    else:
+      colon = line.find(':')
+      if colon <= 0:
+        # Not a header, so the body starts here.
+        return headers, pos
+      headers.append((line[:colon], line[colon + 1:].lstrip()))
+    pos = eol + 1
+  return headers, end
+
+
+def parse_response(payload):
+  """Parse an application/http response.
+
+  Args:
+    payload: string, the status line, headers and body of the response.
+
+  Returns:
+    A pair (resp, content), such as would be returned from httplib2.request.
+  """
+  eol = payload.find('\n')
+  if eol < 0:
+    eol = len(payload)
+  protocol, status, reason = payload[:eol].rstrip('\r').split(' ', 2)
+  headers, pos = _parse_headers(payload, eol + 1)
+
+  info = {}
+  for name, value in headers:
+    info[name.lower()] = value
+  info['status'] = status
+  resp = httplib2.Response(info)
+  resp.reason = reason
+  resp.version = int(protocol.split('/', 1)[1].replace('.', ''))
+
+  return resp, payload[pos:]
+
+
+def _boundary_from_content_type(content_type):
+  """Find the boundary parameter of a multipart content type, or None."""
+  params = content_type.split(';')
+  if not params[0].strip().lower().startswith('multipart/'):
+    return None
+  for param in params[1:]:
+    name, _, value = param.partition('=')
+    if name.strip().lower() == 'boundary':
+      value = value.strip()
+      if len(value) > 1 and value[0] == value[-1] == '"':
+        value = value[1:-1]
+      return value.rstrip() or None
+  return None
+
+
+def _find_delimiter(content, delimiter, pos):
+  """Find the next line of content that is a boundary delimiter.
+
+  Returns:
+    The offset of the delimiter, or -1.
+  """
+  end = len(content)
+  while True:
+    if pos == 0 and content.startswith(delimiter):
+      found = 0
+    else:
+      found = content.find('\n' + delimiter, max(pos - 1, 0))
+      if found < 0:
+        return -1
+      found += 1
+    after = found + len(delimiter)
+    if (after >= end or content[after] in '\r\n \t' or
+        content.startswith('--', after)):
+      return found
+    pos = after
+
+
+def iter_mixed(content, content_type):
+  """Parse the parts of a multipart/mixed batch response.
+
+  Parts are yielded as soon as they have been scanned, so the caller may
+  handle each one before the rest of the body is looked at.
+
+  Args:
+    content: string, the body of the batch response.
+    content_type: string, the content-type header of the batch response.
+
+  Yields:
+    (content_id, payload) for every part, where content_id is the value of
+    the part's Content-ID header, or None, and payload is its body.
+
+  Raises:
+    apiclient.errors.BatchError if the response isn't multipart.
+  """
+  boundary = _boundary_from_content_type(content_type)
+  delimiter = '--' + (boundary or '')
+  pos = -1
+  if boundary:
+    pos = _find_delimiter(content, delimiter, 0)
+  if pos < 0:
+    raise BatchError('Response not in multipart/mixed format.',
+                     content=content)
+
+  while not content.startswith('--', pos + len(delimiter)):
+    eol = content.find('\n', pos)
+    if eol < 0:
+      return
+    start = eol + 1
+    pos = _find_delimiter(content, delimiter, start)
+    if pos < 0:
+      part = content[start:]
+    else:
+      # The line break before a delimiter belongs to the delimiter.
+      end = max(start, pos - 1)
+      if end > start and content[end - 1] == '\r':
+        end -= 1
+      part = content[start:end]
+
+    headers, body = _parse_headers(part, 0)
+    content_id = None
+    for name, value in headers:
+      if name.lower() == 'content-id':
+        content_id = value
+        break
+    yield content_id, part[body:]
+
+    if pos < 0:
+      return
@@ -0,0 +1,301 @@
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Per-host circuit breakers.
+
+When a backend is degraded every request to it still waits for a socket
+timeout or a string of retries. A CircuitBreaker tracks the outcome of the
+recent requests to each scheme and authority, and once too many of them have
+failed or been slow it opens the circuit for that host: requests then fail at
+once with apiclient.errors.CircuitOpenError, or are answered from the
+response cache with data that may be stale. After open_seconds a few probe
+requests are let through, and the circuit closes again if they succeed:
+
+  from apiclient import http
+  from apiclient.breaker import CircuitBreaker
+
+  def alert(host, old_state, new_state):
+    logging.error('Circuit for %s is now %s', host, new_state)
+
+  http.circuit_breaker = CircuitBreaker(failure_rate=0.5,
+                                        slow_call_seconds=5.0,
+                                        listeners=[alert])
+
+Requests made by HttpRequest, MediaIoBaseDownload and BatchHttpRequest all go
+through the breaker. A failure is a 5xx response or a transport error; other
+errors mean the host is answering and count as successes.
+"""
+
+import collections
+import logging
+import threading
+import time
+import urlparse
+
+from apiclient.errors import CircuitOpenError
+from apiclient.retry import TRANSPORT_EXCEPTIONS
+from oauth2client import util
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+def host_key(uri):
+  """The scheme and authority of a URI, which circuits are kept for."""
+  parsed = urlparse.urlsplit(uri)
+  return '%s://%s' % (parsed.scheme, parsed.netloc.lower())
+
+
+class _Circuit(object):
+  """The state of the circuit for one host."""
+
+  def __init__(self, window):
+    self.state = CLOSED
+    # (failed, slow) for the most recent requests.
+    self.outcomes = collections.deque(maxlen=window)
+    self.opened_at = None
+    self.probes_in_flight = 0
+    self.probes_succeeded = 0
+    self.requests = 0
+    self.failures = 0
+    self.rejected = 0
+    self.stale = 0
+    self.opened = 0
+
+
+class CircuitBreaker(object):
+  """Opens the circuit to a host when its requests fail or are slow."""
+
+  @util.positional(1)
+  def __init__(self, failure_rate=0.5, slow_call_seconds=None,
+               slow_call_rate=0.5, window=20, min_calls=10, open_seconds=30.0,
+               half_open_calls=1, serve_stale=True, listeners=None):
+    """Constructor.
+
+    Args:
+      failure_rate: float, the fraction of failed requests in the window at
+        which the circuit opens.
+      slow_call_seconds: float, requests taking longer than this are slow.
+        None disables the latency threshold.
+      slow_call_rate: float, the fraction of slow requests in the window at
+        which the circuit opens.
+      window: int, the number of recent requests to each host considered.
+      min_calls: int, the circuit is never opened on fewer requests than this.
+      open_seconds: float, how long an open circuit rejects requests before
+        letting probes through.
+      half_open_calls: int, the number of probes that must succeed to close
+        the circuit. Only this many are in flight at once.
+      serve_stale: bool, whether HttpRequest.execute() answers a rejected GET
+        from apiclient.http.response_cache, when it has an entry for it,
+        instead of raising CircuitOpenError.
+      listeners: list of callables, each called as fn(host, old_state,
+        new_state) whenever a circuit changes state.
+    """
+    self._failure_rate = failure_rate
+    self._slow_call_seconds = slow_call_seconds
+    self._slow_call_rate = slow_call_rate
+    self._window = window
+    self._min_calls = max(1, min_calls)
+    self._open_seconds = open_seconds
+    self._half_open_calls = max(1, half_open_calls)
+    self.serve_stale = serve_stale
+    self._listeners = list(listeners or [])
+    self._lock = threading.Lock()
+    self._circuits = {}
+
+    # Stubs for testing.
+    self._clock = time.time
+
+  def add_listener(self, listener):
+    """Call listener(host, old_state, new_state) on every state change."""
+    with self._lock:
+      self._listeners.append(listener)
+
+  def _circuit(self, host):
+    """Get the circuit of a host. Must hold the lock."""
+    circuit = self._circuits.get(host)
+    if circuit is None:
+      circuit = _Circuit(self._window)
+      self._circuits[host] = circuit
+    return circuit
+
+  def _transition(self, host, circuit, state, changes):
+    """Change the state of a circuit. Must hold the lock.
+
+    The change is appended to changes, for listeners to be told once the
+    lock has been released.
+    """
+    if circuit.state == state:
+      return
+    changes.append((host, circuit.state, state))
+    circuit.state = state
+    if state == OPEN:
+      circuit.opened += 1
+      circuit.opened_at = self._clock()
+    elif state == HALF_OPEN:
+      circuit.probes_in_flight = 0
+      circuit.probes_succeeded = 0
+    else:
+      circuit.outcomes.clear()
+
+  def _notify(self, changes):
+    if not changes:
+      return
+    with self._lock:
+      listeners = list(self._listeners)
+    for host, old_state, new_state in changes:
+      if new_state == OPEN:
+        logger.warning('Circuit for %s opened.', host)
+      else:
+        logger.info('Circuit for %s is %s.', host, new_state)
+      for listener in listeners:
+        try:
+          listener(host, old_state, new_state)
+        except Exception:
+          logger.exception('Exception calling circuit breaker listener.')
+
+  def _admit(self, host):
+    """Let a request through, or raise CircuitOpenError.
+
+    Returns:
+      True if the request is a probe of a half-open circuit.
+    """
+    changes = []
+    try:
+      with self._lock:
+        circuit = self._circuit(host)
+        if circuit.state == OPEN:
+          wait = circuit.opened_at + self._open_seconds - self._clock()
+          if wait > 0:
+            circuit.rejected += 1
+            raise CircuitOpenError(host, wait)
+          self._transition(host, circuit, HALF_OPEN, changes)
+        if circuit.state == HALF_OPEN:
+          if (circuit.probes_in_flight + circuit.probes_succeeded >=
+              self._half_open_calls):
+            circuit.rejected += 1
+            raise CircuitOpenError(host, 0.0)
+          circuit.probes_in_flight += 1
+          return True
+        circuit.requests += 1
+        return False
+    finally:
+      self._notify(changes)
+
+  def _record(self, host, probe, failed, latency):
+    slow = (self._slow_call_seconds is not None and
+            latency > self._slow_call_seconds)
+    changes = []
+    with self._lock:
+      circuit = self._circuit(host)
+      if failed:
+        circuit.failures += 1
+      if probe:
+        # Another probe may already have reopened or closed the circuit.
+        if circuit.state != HALF_OPEN:
+          pass
+        elif failed or slow:
+          self._transition(host, circuit, OPEN, changes)
+        else:
+          circuit.probes_in_flight -= 1
+          circuit.probes_succeeded += 1
+          if circuit.probes_succeeded >= self._half_open_calls:
+            self._transition(host, circuit, CLOSED, changes)
+      elif circuit.state == CLOSED:
+        circuit.outcomes.append((failed, slow))
+        calls = len(circuit.outcomes)
+        if calls >= self._min_calls:
+          failures = sum(1 for f, _ in circuit.outcomes if f)
+          slow_calls = sum(1 for _, s in circuit.outcomes if s)
+          if (failures >= self._failure_rate * calls or
+              (self._slow_call_seconds is not None and
+               slow_calls >= self._slow_call_rate * calls)):
+            self._transition(host, circuit, OPEN, changes)
+    self._notify(changes)
+
+  def _release_probe(self, host):
+    """Let another probe through in place of one that proved nothing."""
+    with self._lock:
+      circuit = self._circuit(host)
+      if circuit.state == HALF_OPEN:
+        circuit.probes_in_flight -= 1
+
+  def call(self, uri, send):
+    """Make a request through the circuit of its host.
+
+    Args:
+      uri: string, the URI of the request.
+      send: callable, makes the request and returns (resp, content).
+
+    Returns:
+      The (resp, content) pair returned by send.
+
+    Raises:
+      apiclient.errors.CircuitOpenError if the circuit is open.
+      Any exception raised by send.
+    """
+    host = host_key(uri)
+    probe = self._admit(host)
+    start = self._clock()
+    try:
+      resp, content = send()
+    except TRANSPORT_EXCEPTIONS:
+      self._record(host, probe, True, self._clock() - start)
+      raise
+    except:
+      # Not the host's fault, so it proves nothing either way, but a probe
+      # must not stay in flight forever.
+      if probe:
+        self._release_probe(host)
+      raise
+    self._record(host, probe, resp.status >= 500, self._clock() - start)
+    return resp, content
+
+  def state(self, uri):
+    """The state of the circuit of a URI's host: CLOSED, OPEN or HALF_OPEN."""
+    with self._lock:
+      circuit = self._circuits.get(host_key(uri))
+      if circuit is None:
+        return CLOSED
+      return circuit.state
+
+  def record_stale(self, host):
+    """Count a rejected request that was answered from the cache."""
+    with self._lock:
+      self._circuit(host).stale += 1
+
+  def stats(self):
+    """Counters for every host.
+
+    Returns:
+      A dict from host to a dict with its 'state', the number of 'requests'
+      let through while closed, 'failures', requests 'rejected' while open,
+      rejected requests answered with 'stale' data, and the number of times
+      the circuit has 'opened'.
+    """
+    with self._lock:
+      result = {}
+      for host, circuit in self._circuits.iteritems():
+        result[host] = {
+            'state': circuit.state,
+            'requests': circuit.requests,
+            'failures': circuit.failures,
+            'rejected': circuit.rejected,
+            'stale': circuit.stale,
+            'opened': circuit.opened,
+            }
+      return result
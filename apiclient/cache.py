@@ -0,0 +1,196 @@
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A cache of deserialized responses that is revalidated with ETags.
+
+Once a response carrying an ETag is cached, later identical requests are sent
+with an If-None-Match header and a 304 Not Modified response is answered with
+the cached object, without downloading or deserializing the body again:
+
+  from apiclient import http
+  from apiclient.cache import ResponseCache
+
+  http.response_cache = ResponseCache(max_bytes=10*1024*1024)
+
+The cached objects are shared between callers and must be treated as
+read-only. max_bytes bounds the memory the deserialized objects take, as
+measured by object_size(), not the length of the response bodies, which is
+several times smaller.
+"""
+
+import collections
+import sys
+import threading
+
+DEFAULT_MAX_BYTES = 4*1024*1024
+
+
+class CacheEntry(object):
+  """A cached response.
+
+  Attributes:
+    etag: string, the ETag of the response.
+    value: object, the deserialized response body.
+    size: int, the memory value takes, in bytes.
+  """
+
+  def __init__(self, etag, value, size):
+    self.etag = etag
+    self.value = value
+    self.size = size
+
+
+def object_size(value):
+  """Estimate the memory a deserialized JSON value takes.
+
+  Adds up sys.getsizeof() of every dict, list and scalar reachable from
+  value, counting objects shared within it, such as interned strings, once.
+
+  Args:
+    value: object, a deserialized response body.
+
+  Returns:
+    The size in bytes.
+  """
+  seen = set()
+  size = 0
+  stack = [value]
+  while stack:
+    item = stack.pop()
+    if id(item) in seen:
+      continue
+    seen.add(id(item))
+    size += sys.getsizeof(item)
+    if isinstance(item, dict):
+      # dict's own methods, so that measuring an apiclient.fieldmask
+      # TrackedDict doesn't count as reading it.
+      stack.extend(dict.iterkeys(item))
+      stack.extend(dict.itervalues(item))
+    elif isinstance(item, list):
+      stack.extend(item)
+  return size
+
+
+def cache_key(method_id, uri, identity=None):
+  """Build the cache key for a request.
+
+  The query parameters are sorted so that requests differing only in the
+  order of their parameters share an entry.
+
+  Args:
+    method_id: string, the id of the API method, such as
+      'calendar.events.list'.
+    uri: string, the request URI.
+    identity: hashable, identifies the credentials the request is sent with.
+
+  Returns:
+    A hashable key.
+  """
+  if '?' in uri:
+    path, query = uri.split('?', 1)
+    params = tuple(sorted(p for p in query.split('&') if p))
+  else:
+    path = uri
+    params = ()
+  return (method_id, path, params, identity)
+
+
+class ResponseCache(object):
+  """An LRU cache of deserialized responses bounded by their total size."""
+
+  def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+    """Constructor.
+
+    Args:
+      max_bytes: int, the maximum total memory of the cached responses, as
+        measured by object_size(). The least recently used entries are
+        evicted to stay under it.
+    """
+    self._max_bytes = max_bytes
+    self._entries = collections.OrderedDict()
+    self._bytes = 0
+    self._lock = threading.Lock()
+    self._hits = 0
+    self._misses = 0
+    self._evictions = 0
+
+  def get(self, key):
+    """Look up an entry and mark it as the most recently used.
+
+    Returns:
+      The CacheEntry for key, or None.
+    """
+    with self._lock:
+      entry = self._entries.pop(key, None)
+      if entry is not None:
+        self._entries[key] = entry
+      return entry
+
+  def put(self, key, etag, value, size=None):
+    """Store a response, evicting older entries as needed.
+
+    Responses larger than max_bytes are not stored.
+
+    Args:
+      key: hashable, from cache_key().
+      etag: string, the ETag of the response.
+      value: object, the deserialized response body.
+      size: int, the memory value takes, in bytes. Measured with
+        object_size() if None.
+    """
+    if size is None:
+      size = object_size(value)
+    with self._lock:
+      old = self._entries.pop(key, None)
+      if old is not None:
+        self._bytes -= old.size
+      if size > self._max_bytes:
+        return
+      self._entries[key] = CacheEntry(etag, value, size)
+      self._bytes += size
+      while self._bytes > self._max_bytes:
+        _, evicted = self._entries.popitem(last=False)
+        self._bytes -= evicted.size
+        self._evictions += 1
+
+  def record(self, hit):
+    """Count a revalidation as a hit (not modified) or a miss."""
+    with self._lock:
+      if hit:
+        self._hits += 1
+      else:
+        self._misses += 1
+
+  def clear(self):
+    """Remove every entry."""
+    with self._lock:
+      self._entries.clear()
+      self._bytes = 0
+
+  def stats(self):
+    """Counters for this cache.
+
+    Returns:
+      A dict with the number of 'entries', the memory they take in 'bytes',
+      the number of 'hits' answered from the cache, 'misses' that had to be
+      deserialized, and 'evictions'.
+    """
+    with self._lock:
+      return {
+          'entries': len(self._entries),
+          'bytes': self._bytes,
+          'hits': self._hits,
+          'misses': self._misses,
+          'evictions': self._evictions,
+          }
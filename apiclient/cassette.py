@@ -0,0 +1,261 @@
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Record HTTP traffic to a cassette file and replay it without a network.
+
+Like HttpMock, both classes act like an httplib2.Http. A CassetteRecorder
+wraps a real transport and records every exchange with its latency:
+
+  recorder = CassetteRecorder(credentials.authorize(httplib2.Http()))
+  service = build('calendar', 'v3', http=recorder)
+  service.events().list(calendarId='primary').execute()
+  recorder.save('calendar.json')
+
+A CassettePlayer answers requests from the cassette, waiting for the recorded
+latency, a constant one, or one drawn from a distribution. It is thread-safe
+and waits outside of its lock, so concurrent requests overlap the way they
+would against a server:
+
+  player = CassettePlayer('calendar.json',
+                          latency=lognormal_latency(median=0.08, sigma=0.5))
+  service = build('calendar', 'v3', http=player)
+
+Authorization headers are not recorded.
+"""
+
+import base64
+import collections
+import math
+import random
+import threading
+import time
+
+import httplib2
+
+from apiclient.cache import cache_key
+from apiclient.errors import UnrecordedRequestError
+from oauth2client import util
+from oauth2client.anyjson import simplejson
+
+CASSETTE_VERSION = 1
+
+# Replay with the latency each exchange was recorded with.
+RECORDED = 'recorded'
+
+# Request headers that are never written to a cassette.
+REDACTED_HEADERS = frozenset(['authorization', 'proxy-authorization'])
+
+
+def _body_to_string(body):
+  """Read a request body that may be a stream or a buffer into a string."""
+  if body is None:
+    return None
+  if hasattr(body, 'read'):
+    return body.read()
+  return str(body)
+
+
+def _encode(data):
+  """Encode a body for JSON, as text if possible and base64 otherwise."""
+  if data is None:
+    return None
+  try:
+    return {'text': data.decode('utf-8')}
+  except UnicodeDecodeError:
+    return {'base64': base64.b64encode(data)}
+
+
+def _decode(value):
+  if value is None:
+    return None
+  if 'base64' in value:
+    return base64.b64decode(value['base64'])
+  return value['text'].encode('utf-8')
+
+
+def _match_key(method, uri, body, match_body):
+  key = (method,) + cache_key(None, uri)[1:3]
+  if match_body:
+    key += (body,)
+  return key
+
+
+def lognormal_latency(median, sigma=0.5, rand=None):
+  """A synthetic latency distribution for CassettePlayer.
+
+  Args:
+    median: float, the median latency in seconds.
+    sigma: float, the standard deviation of the logarithm of the latency.
+      Larger values give a longer tail.
+    rand: random.Random, the source of randomness. Pass a seeded one for
+      repeatable runs.
+
+  Returns:
+    A callable that takes the recorded latency and returns the latency to
+    replay with.
+  """
+  if rand is None:
+    rand = random.Random()
+  mu = math.log(median)
+
+  def latency(recorded):
+    return rand.lognormvariate(mu, sigma)
+
+  return latency
+
+
+class CassetteRecorder(object):
+  """Records the exchanges made through a transport."""
+
+  def __init__(self, http):
+    """Constructor.
+
+    Args:
+      http: httplib2.Http, the transport to record, or something that acts
+        like it.
+    """
+    self._http = http
+    self._lock = threading.Lock()
+    self.interactions = []
+
+  def request(self, uri,
+              method='GET',
+              body=None,
+              headers=None,
+              redirections=httplib2.DEFAULT_MAX_REDIRECTS,
+              connection_type=None):
+    body = _body_to_string(body)
+    start = time.time()
+    resp, content = self._http.request(
+        uri, method=method, body=body, headers=headers,
+        redirections=redirections, connection_type=connection_type)
+    latency = time.time() - start
+
+    recorded_headers = {}
+    for name, value in (headers or {}).iteritems():
+      if name.lower() not in REDACTED_HEADERS:
+        recorded_headers[name] = value
+    interaction = {
+        'request': {
+            'uri': uri,
+            'method': method,
+            'headers': recorded_headers,
+            'body': _encode(body),
+            },
+        'response': {
+            'headers': dict(resp),
+            'content': _encode(content),
+            },
+        'latency': latency,
+        }
+    with self._lock:
+      self.interactions.append(interaction)
+    return resp, content
+
+  def save(self, filename):
+    """Write the recorded exchanges to a cassette file.
+
+    Args:
+      filename: string, the path of the cassette.
+    """
+    with self._lock:
+      data = {
+          'version': CASSETTE_VERSION,
+          'interactions': list(self.interactions),
+          }
+    f = open(filename, 'wb')
+    try:
+      f.write(simplejson.dumps(data, indent=1, sort_keys=True))
+    finally:
+      f.close()
+
+
+class CassettePlayer(object):
+  """Answers requests with the responses recorded in a cassette.
+
+  Requests are matched on their method and URI, with the query parameters in
+  any order, and optionally on their body. Responses recorded for the same
+  request are replayed in the order they were recorded.
+  """
+
+  @util.positional(2)
+  def __init__(self, filename, latency=RECORDED, repeat=True, match_body=False):
+    """Constructor.
+
+    Args:
+      filename: string, the path of a cassette written by CassetteRecorder.
+      latency: RECORDED to wait as long as each exchange took when it was
+        recorded, a number of seconds to wait for every request, or a callable
+        that takes the recorded latency and returns the one to wait for, such
+        as lognormal_latency().
+      repeat: bool, if True start over from the first response once all the
+        responses to a request have been replayed. Otherwise raise
+        UnrecordedRequestError.
+      match_body: bool, whether requests must also have the recorded body.
+    """
+    f = open(filename, 'rb')
+    try:
+      data = simplejson.load(f)
+    finally:
+      f.close()
+    if data.get('version') != CASSETTE_VERSION:
+      raise ValueError('Unsupported cassette version: %s' %
+                       data.get('version'))
+
+    self._latency = latency
+    self._repeat = repeat
+    self._match_body = match_body
+    self._lock = threading.Lock()
+    self._responses = collections.defaultdict(list)
+    self._next = {}
+    for interaction in data['interactions']:
+      request = interaction['request']
+      key = _match_key(request['method'], request['uri'],
+                       _decode(request['body']), match_body)
+      response = interaction['response']
+      self._responses[key].append((response['headers'],
+                                   _decode(response['content']),
+                                   interaction['latency']))
+    self.requests = 0
+
+    # Stubs for testing.
+    self._sleep = time.sleep
+
+  def _delay(self, recorded):
+    if self._latency == RECORDED:
+      return recorded
+    if callable(self._latency):
+      return self._latency(recorded)
+    return self._latency
+
+  def request(self, uri,
+              method='GET',
+              body=None,
+              headers=None,
+              redirections=httplib2.DEFAULT_MAX_REDIRECTS,
+              connection_type=None):
+    body = _body_to_string(body)
+    key = _match_key(method, uri, body, self._match_body)
+    with self._lock:
+      responses = self._responses.get(key)
+      index = self._next.get(key, 0)
+      if not responses or (index >= len(responses) and not self._repeat):
+        raise UnrecordedRequestError(method, uri)
+      response_headers, content, recorded = responses[index % len(responses)]
+      self._next[key] = index + 1
+      self.requests += 1
+      delay = self._delay(recorded)
+    if delay > 0:
+      self._sleep(delay)
+    return httplib2.Response(response_headers), content
@@ -0,0 +1,167 @@
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Coalescing of identical requests that are in flight at the same time.
+
+When several threads issue the same GET at once only the first one goes out
+over the wire, the others wait for it and share its response:
+
+  from apiclient import http
+  from apiclient.coalesce import RequestCoalescer
+
+  http.request_coalescer = RequestCoalescer()
+
+Requests are only merged if they have the same method, URI, credentials and
+headers. Each waiter gets its own copy of the response headers. A waiter
+gives up when its own deadline passes, and if the request it waited for ran
+out of time against another caller's deadline, it sends the request itself.
+"""
+
+import sys
+import threading
+
+from apiclient.errors import DeadlineExceededError
+
+
+def auth_identity(http, headers):
+  """Identify the credentials a request is sent with.
+
+  Args:
+    http: httplib2.Http, the transport the request is sent with.
+    headers: dict, the request headers.
+
+  Returns:
+    A hashable value that is equal for two requests only if they are
+    authorized the same way.
+  """
+  request = getattr(http, 'request', None)
+  credentials = getattr(request, 'credentials', None)
+  if credentials is not None:
+    return ('credentials', id(credentials))
+  for name, value in (headers or {}).iteritems():
+    if name.lower() == 'authorization':
+      return ('authorization', value)
+  return None
+
+
+def coalesce_key(method, uri, http, headers):
+  """Build the key under which identical requests are merged.
+
+  Any request header, such as Accept or If-None-Match, may change the
+  response, so all of them are part of the key.
+
+  Args:
+    method: string, the HTTP method.
+    uri: string, the request URI.
+    http: httplib2.Http, the transport the request is sent with.
+    headers: dict, the request headers.
+
+  Returns:
+    A hashable value that is equal for two requests only if either one's
+    response can stand in for the other's.
+  """
+  return (method, uri, auth_identity(http, headers),
+          frozenset((name.lower(), value)
+                    for name, value in (headers or {}).iteritems()))
+
+
+class _Call(object):
+  """A request that is in flight, and its outcome once it completes."""
+
+  def __init__(self):
+    self.event = threading.Event()
+    self.result = None
+    self.exc_info = None
+
+
+class RequestCoalescer(object):
+  """Merges concurrent calls that share a key into a single call."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._calls = {}
+    self._executed = 0
+    self._coalesced = 0
+
+  def do(self, key, fn, copy_result=None, deadline=None):
+    """Call fn, or wait for the call with the same key already in flight.
+
+    Args:
+      key: hashable, identifies calls that are interchangeable.
+      fn: callable, takes no arguments and makes the call.
+      copy_result: callable, takes the value returned by fn and returns a
+        copy of it for a caller that waited, so that callers can't see each
+        other's changes to it. None shares the value itself.
+      deadline: apiclient.deadline.Deadline, how long this caller waits for
+        a call already in flight. None waits for as long as it takes.
+
+    Returns:
+      The value returned by fn, for this call or for the one it was merged
+      into.
+
+    Raises:
+      apiclient.errors.DeadlineExceededError if the deadline passed while
+        waiting.
+      Any exception raised by fn, in every caller that shared the call,
+        except a DeadlineExceededError, after which a caller that waited
+        calls fn itself.
+    """
+    while True:
+      with self._lock:
+        call = self._calls.get(key)
+        if call is None:
+          call = _Call()
+          self._calls[key] = call
+          self._executed += 1
+          break
+        self._coalesced += 1
+
+      if deadline is None:
+        call.event.wait()
+      elif not call.event.wait(deadline.remaining()):
+        raise DeadlineExceededError(
+            'Deadline exceeded waiting for an identical request')
+      if call.exc_info is None:
+        if copy_result is not None:
+          return copy_result(call.result)
+        return call.result
+      # The deadline of the caller that made the call, not this one's.
+      if not issubclass(call.exc_info[0], DeadlineExceededError):
+        raise call.exc_info[0], call.exc_info[1], call.exc_info[2]
+
+    try:
+      call.result = fn()
+    except:
+      call.exc_info = sys.exc_info()
+      raise
+    finally:
+      with self._lock:
+        del self._calls[key]
+      call.event.set()
+    return call.result
+
+  def stats(self):
+    """Counters for the calls made through this coalescer.
+
+    Returns:
+      A dict with the number of calls 'executed', the number of calls
+      'coalesced' into one that was already in flight, and the number of keys
+      currently 'in_flight'.
+    """
+    with self._lock:
+      return {
+          'executed': self._executed,
+          'coalesced': self._coalesced,
+          'in_flight': len(self._calls),
+          }
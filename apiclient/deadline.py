@@ -0,0 +1,175 @@
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Deadlines that bound the total time spent on a request.
+
+A Deadline is created once and passed to every call that works towards the
+same result, such as all the pages of a list or all the chunks of an upload:
+
+  deadline = Deadline(50)
+  for page in service.events().list_iter_pages(request, num_retries=5,
+                                                deadline=deadline):
+    ...
+
+While a deadline is in force the socket timeouts of the http object are
+capped to the time remaining, which also bounds an OAuth 2.0 token refresh
+made through the same http object, and retries whose wait would outlast the
+deadline are skipped. Once the deadline has passed, calls raise
+apiclient.errors.DeadlineExceededError instead of sending anything more.
+
+The timeouts are set on the http object itself, which every thread using it
+shares. Deadline.call() holds a lock on the http object while they are
+capped, so calls with deadlines take turns on it, but a request made on the
+same http object without a deadline from another thread meanwhile would see
+the capped timeout. httplib2.Http isn't thread-safe anyway: give each thread
+its own, as the http_factory of apiclient.futures.WorkerPool does.
+"""
+
+import socket
+import threading
+import time
+import weakref
+
+from apiclient.errors import DeadlineExceededError
+
+# Socket timeouts are never set below this, since zero makes sockets
+# non-blocking.
+_MIN_TIMEOUT = 0.001
+
+# A lock for each http object whose timeouts are being capped.
+_http_locks = weakref.WeakKeyDictionary()
+_http_locks_lock = threading.Lock()
+
+
+def to_deadline(value):
+  """Accept a Deadline, a number of seconds from now, or None.
+
+  Args:
+    value: Deadline, float, int or None.
+
+  Returns:
+    A Deadline, or None.
+  """
+  if value is None or isinstance(value, Deadline):
+    return value
+  return Deadline(value)
+
+
+def _http_lock(http):
+  """The lock held while the timeouts of http are capped."""
+  with _http_locks_lock:
+    lock = _http_locks.get(http)
+    if lock is None:
+      # Reentrant, since a capped call may make another on the same object.
+      lock = threading.RLock()
+      _http_locks[http] = lock
+    return lock
+
+
+def _set_timeout(http, timeout):
+  """Set the socket timeout of http and of the connections it has open."""
+  http.timeout = timeout
+  for conn in getattr(http, 'connections', {}).values():
+    conn.timeout = timeout
+    sock = getattr(conn, 'sock', None)
+    if sock is not None:
+      if timeout is None:
+        sock.settimeout(socket.getdefaulttimeout())
+      else:
+        sock.settimeout(timeout)
+
+
+class Deadline(object):
+  """A point in time by which a request, with all its retries, must be done."""
+
+  def __init__(self, seconds, clock=time.time):
+    """Constructor.
+
+    Args:
+      seconds: float, the time allowed from now, in seconds.
+      clock: callable, returns the current time in seconds.
+    """
+    self._clock = clock
+    self.expires = clock() + seconds
+
+  def remaining(self):
+    """The number of seconds left, never less than zero."""
+    return max(0.0, self.expires - self._clock())
+
+  def expired(self):
+    return self._clock() >= self.expires
+
+  def allows(self, delay):
+    """Whether time is left for an attempt after waiting delay seconds."""
+    return delay < self.remaining()
+
+  def check(self, description='request'):
+    """Raise if the deadline has passed.
+
+    Args:
+      description: string, what was about to be done, for the error message.
+
+    Raises:
+      apiclient.errors.DeadlineExceededError if the deadline has passed.
+    """
+    if self.expired():
+      raise DeadlineExceededError('Deadline exceeded before %s' % description)
+
+  def call(self, http, fn, description='request'):
+    """Call fn with the socket timeouts of http capped to the time left.
+
+    Other calls on the same http object wait until fn has returned and the
+    timeouts are restored.
+
+    Args:
+      http: httplib2.Http, the http object fn makes requests with. Objects
+        without a timeout, such as HttpMock, are left alone.
+      fn: callable, takes no arguments.
+      description: string, what fn does, for error messages.
+
+    Returns:
+      The value returned by fn.
+
+    Raises:
+      apiclient.errors.DeadlineExceededError if the deadline has passed
+        before fn is called, or fn timed out because it passed.
+    """
+    self.check(description)
+    if not hasattr(http, 'timeout'):
+      return fn()
+    with _http_lock(http):
+      self.check(description)
+      return self._call_capped(http, fn, description)
+
+  def _call_capped(self, http, fn, description):
+    """Call fn with the timeouts capped. Must hold the lock of http."""
+    saved = http.timeout
+    timeout = max(self.remaining(), _MIN_TIMEOUT)
+    # Whether the deadline, rather than the http object's own timeout, is
+    # what a socket.timeout would have run into.
+    capped = saved is None or timeout < saved
+    if not capped:
+      timeout = saved
+    _set_timeout(http, timeout)
+    try:
+      return fn()
+    except socket.timeout:
+      # The socket may time out a moment before the clock says the deadline
+      # has passed.
+      if capped or self.expired():
+        raise DeadlineExceededError('Deadline exceeded during %s'
+                                    % description)
+      raise
+    finally:
+      _set_timeout(http, saved)
@@ -35,14 +35,8 @@ import logging
 import mimetypes
 import os
 import re
-import urllib
 import urlparse
 
-try:
-  from urlparse import parse_qsl
-except ImportError:
-  from cgi import parse_qsl
-
 # Third-party imports
 import httplib2
 import mimeparse
@@ -61,6 +55,9 @@ from apiclient.http import MediaUpload
 from apiclient.model import JsonModel
 from apiclient.model import MediaModel
 from apiclient.model import RawModel
+from apiclient.paging import iter_items
+from apiclient.paging import iter_pages
+from apiclient.paging import next_page_request
 from apiclient.schema import Schemas
 from oauth2client.anyjson import simplejson
 from oauth2client.util import _add_query_parameter
@@ -146,7 +143,8 @@ def build(serviceName,
           discoveryServiceUrl=DISCOVERY_URI,
           developerKey=None,
           model=None,
-          requestBuilder=HttpRequest):
+          requestBuilder=HttpRequest,
+          methodModels=None):
   """Construct a Resource for interacting with an API.
 
   Construct a Resource object for interacting with an API. The serviceName and
@@ -166,6 +164,9 @@ def build(serviceName,
     model: apiclient.Model, converts to and from the wire format.
     requestBuilder: apiclient.http.HttpRequest, encapsulator for an HTTP
       request.
+    methodModels: dict, maps the ids of API methods, such as
+      'calendar.events.list', to the apiclient.Model to use for them in place
+      of model.
 
   Returns:
     A Resource object with methods for interacting with the service.
@@ -204,7 +205,8 @@ def build(serviceName,
     raise InvalidJsonError()
 
   return build_from_document(content, base=discoveryServiceUrl, http=http,
-      developerKey=developerKey, model=model, requestBuilder=requestBuilder)
+      developerKey=developerKey, model=model, requestBuilder=requestBuilder,
+      methodModels=methodModels)
 
 
 @positional(1)
@@ -215,7 +217,8 @@ def build_from_document(
     http=None,
     developerKey=None,
     model=None,
-    requestBuilder=HttpRequest):
+    requestBuilder=HttpRequest,
+    methodModels=None):
   """Create a Resource for interacting with an API.
 
   Same as `build()`, but constructs the Resource object from a discovery
@@ -236,6 +239,8 @@ def build_from_document(
     model: Model class instance that serializes and de-serializes requests and
       responses.
     requestBuilder: Takes an http request and packages it up to be executed.
+    methodModels: dict, maps the ids of API methods to the Model to use for
+      them in place of model.
 
   Returns:
     A Resource object with methods for interacting with the service.
@@ -254,7 +259,8 @@ def build_from_document(
     model = JsonModel('dataWrapper' in features)
   return Resource(http=http, baseUrl=base, model=model,
                   developerKey=developerKey, requestBuilder=requestBuilder,
-                  resourceDesc=service, rootDesc=service, schema=schema)
+                  resourceDesc=service, rootDesc=service, schema=schema,
+                  methodModels=methodModels)
 
 
 def _cast(value, schema_type):
@@ -629,7 +635,7 @@ def createMethod(methodName, methodDesc, rootDesc, schema):
     if self._developerKey:
       actual_query_params['key'] = self._developerKey
 
-    model = self._model
+    model = self._methodModels.get(methodId, self._model)
     if methodName.endswith('_media'):
       model = MediaModel()
     elif 'response' not in methodDesc:
@@ -696,7 +702,8 @@ def createMethod(methodName, methodDesc, rootDesc, schema):
           msg = MIMENonMultipart(*media_upload.mimetype().split('/'))
           msg['Content-Transfer-Encoding'] = 'binary'
 
-          payload = media_upload.getbytes(0, media_upload.size())
+          # The payload may be a buffer, which the email package can't write.
+          payload = str(media_upload.getbytes(0, media_upload.size()))
           msg.set_payload(payload)
           msgRoot.attach(msg)
           body = msgRoot.as_string()
@@ -794,38 +801,65 @@ Returns:
   A request object that you can call 'execute()' on to request the next
   page. Returns None if there are no more items in the collection.
     """
-    # Retrieve nextPageToken from previous_response
-    # Use as pageToken in previous_request to create new request.
+    return next_page_request(previous_request, previous_response)
+
+  return (methodName, methodNext)
 
-    if 'nextPageToken' not in previous_response:
-      return None
 
-    request = copy.copy(previous_request)
+def createPageIteratorMethods(methodName):
+  """Creates the _iter_pages and _iter_items methods for attaching to a
+  Resource.
 
-    pageToken = previous_response['nextPageToken']
-    parsed = list(urlparse.urlparse(request.uri))
-    q = parse_qsl(parsed[4])
+  Args:
+    methodName: string, name of the list method to iterate over.
 
-    # Find and remove old 'pageToken' value from URI
-    newq = [(key, value) for (key, value) in q if key != 'pageToken']
-    newq.append(('pageToken', pageToken))
-    parsed[4] = urllib.urlencode(newq)
-    uri = urlparse.urlunparse(parsed)
+  Returns:
+    A list of (methodName, method) pairs.
+  """
 
-    request.uri = uri
+  def methodIterPages(self, request, prefetch=1, http=None, num_retries=0,
+                      pool=None, deadline=None):
+    """Iterates over the responses for every page of a list request.
 
-    logger.info('URL being requested: %s' % uri)
+The next page is fetched in the background while the current one is consumed.
 
-    return request
+Args:
+  request: The request for the first page. (required)
+  prefetch: The number of pages to fetch ahead, or 0 to fetch each page only
+    when it is needed.
+  http: httplib2.Http, used in place of the one the request was built with.
+  num_retries: Integer, number of times to retry 500's for each page.
+  pool: apiclient.futures.WorkerPool, the pool to fetch pages on.
+  deadline: apiclient.deadline.Deadline or a number of seconds, the time by
+    which every page must have been fetched.
 
-  return (methodName, methodNext)
+Returns:
+  A generator of the deserialized response for each page.
+    """
+    return iter_pages(request, prefetch=prefetch, http=http,
+                      num_retries=num_retries, pool=pool, deadline=deadline)
+
+  def methodIterItems(self, request, prefetch=1, http=None, num_retries=0,
+                      pool=None, deadline=None):
+    """Iterates over the items of every page of a list request.
+
+Takes the same arguments as the _iter_pages method.
+
+Returns:
+  A generator of the items from each page, in order.
+    """
+    return iter_items(request, prefetch=prefetch, http=http,
+                      num_retries=num_retries, pool=pool, deadline=deadline)
+
+  return [(fix_method_name(methodName + '_iter_pages'), methodIterPages),
+          (fix_method_name(methodName + '_iter_items'), methodIterItems)]
 
 
 class Resource(object):
   """A class for interacting with a resource."""
 
   def __init__(self, http, baseUrl, model, requestBuilder, developerKey,
-               resourceDesc, rootDesc, schema):
+               resourceDesc, rootDesc, schema, methodModels=None):
     """Build a Resource from the API description.
 
     Args:
@@ -842,12 +876,15 @@ class Resource(object):
           is considered a resource.
       rootDesc: object, the entire deserialized discovery document.
       schema: object, mapping of schema names to schema descriptions.
+      methodModels: dict, maps the ids of API methods to the apiclient.Model
+          to use for them in place of model.
     """
     self._dynamic_attrs = []
 
     self._http = http
     self._baseUrl = baseUrl
     self._model = model
+    self._methodModels = methodModels or {}
     self._developerKey = developerKey
     self._requestBuilder = requestBuilder
     self._resourceDesc = resourceDesc
@@ -928,7 +965,7 @@ class Resource(object):
                           model=self._model, developerKey=self._developerKey,
                           requestBuilder=self._requestBuilder,
                           resourceDesc=methodDesc, rootDesc=rootDesc,
-                          schema=schema)
+                          schema=schema, methodModels=self._methodModels)
 
         setattr(methodResource, '__doc__', 'A collection resource.')
         setattr(methodResource, '__is_resource__', True)
@@ -957,3 +994,7 @@ class Resource(object):
             fixedMethodName, method = createNextMethod(methodName + '_next')
             self._set_dynamic_attr(fixedMethodName,
                                    method.__get__(self, self.__class__))
+            for fixedMethodName, method in createPageIteratorMethods(
+                methodName):
+              self._set_dynamic_attr(fixedMethodName,
+                                     method.__get__(self, self.__class__))
@@ -138,3 +138,44 @@ class UnexpectedBodyError(Error):
     """Constructor for an UnexpectedMethodError."""
     super(UnexpectedBodyError, self).__init__(
         'Expected: [%s] - Provided: [%s]' % (expected, provided))
+
+
+class CancelledError(Error):
+  """The Future was cancelled before it completed."""
+  pass
+
+
+class TimeoutError(Error):
+  """The Future did not complete within the given timeout."""
+  pass
+
+
+class UnrecordedRequestError(Error):
+  """Exception raised by CassettePlayer on requests it has no recording of."""
+
+  def __init__(self, method, uri):
+    """Constructor for an UnrecordedRequestError."""
+    super(UnrecordedRequestError, self).__init__(
+        'No recorded response for %s %s' % (method, uri))
+
+
+class DeadlineExceededError(Error):
+  """The deadline of a request passed before the request could complete."""
+  pass
+
+
+class CircuitOpenError(Error):
+  """Requests to a host are being refused because its circuit is open."""
+
+  def __init__(self, host, retry_after):
+    """Constructor.
+
+    Args:
+      host: string, the scheme and authority of the host.
+      retry_after: float, the number of seconds until probe requests are
+        let through again.
+    """
+    super(CircuitOpenError, self).__init__(
+        'Circuit for %s is open, retry after %.1fs' % (host, retry_after))
+    self.host = host
+    self.retry_after = retry_after
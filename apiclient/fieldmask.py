@@ -0,0 +1,496 @@
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Partial response field masks learned from what the application reads.
+
+Few callers pass fields=, so whole resources are downloaded even when only a
+handful of their properties are used. A FieldMaskTracker notes which fields
+of the responses to each API method the application reads, and once it has
+seen warmup responses to a method, sends later requests to it with a fields
+mask naming just those:
+
+  from apiclient import http
+  from apiclient.fieldmask import FieldMaskTracker
+
+  def unlisted(method_id, field):
+    logging.error('%s read %s, which its field mask left out', method_id,
+                  field)
+
+  http.field_masks = FieldMaskTracker(warmup=10, listeners=[unlisted])
+
+Responses are returned with every object as a TrackedDict, which notes the
+keys looked up in it. Iterating over an object or copying it counts as
+reading all of its fields. JsonModel builds the TrackedDicts as it parses the
+body, when its codec has an object_pairs_hook; other responses are copied
+into them.
+
+Masks are learned from the reads of earlier responses, so code that starts
+reading a field it didn't read during the warmup gets a WRONG VALUE for the
+response being read: the field is missing from it, so the read raises
+KeyError, get() returns the default and 'in' is False, as if the server had
+no value for it. The read is logged, counted in stats() and passed to the
+listeners, and the field is added to the mask of later requests, but nothing
+can correct the response already received. Only enable masks for code whose
+reads are the same from one response to the next, and use a listener to
+learn when a read has been given a wrong value.
+
+Reads made through dict's C API, such as json.dumps(response) or
+dict(response), can't be seen, so code doing that shouldn't enable masks.
+Requests that carry their own fields parameter, batches, and media downloads
+are left alone.
+"""
+
+import logging
+import threading
+import urllib
+import urlparse
+
+from oauth2client import util
+
+logger = logging.getLogger(__name__)
+
+# The number of responses to a method seen in full before its requests are
+# masked.
+DEFAULT_WARMUP = 10
+
+
+class TrackedDict(dict):
+  """A JSON object of a response that notes which of its fields are read."""
+
+  __slots__ = ('_recorder', '_path')
+
+  def __init__(self, recorder, path, items):
+    """Constructor.
+
+    Args:
+      recorder: _Recorder, notes the reads.
+      path: tuple, the keys leading to this object from the top of the
+        response. None until _Recorder.wrap() sets it.
+      items: list of (key, value) pairs, the fields of the object.
+    """
+    dict.__init__(self, items)
+    self._recorder = recorder
+    self._path = path
+
+  def __getitem__(self, key):
+    self._recorder.read(self._path, key, dict.__contains__(self, key))
+    return dict.__getitem__(self, key)
+
+  def get(self, key, default=None):
+    self._recorder.read(self._path, key, dict.__contains__(self, key))
+    return dict.get(self, key, default)
+
+  def __contains__(self, key):
+    present = dict.__contains__(self, key)
+    self._recorder.read(self._path, key, present)
+    return present
+
+  has_key = __contains__
+
+  def setdefault(self, key, default=None):
+    self._recorder.read(self._path, key, dict.__contains__(self, key))
+    return dict.setdefault(self, key, default)
+
+  def pop(self, key, *args):
+    self._recorder.read(self._path, key, dict.__contains__(self, key))
+    return dict.pop(self, key, *args)
+
+  def _read_all(self):
+    self._recorder.read_all(self._path)
+
+  def __iter__(self):
+    self._read_all()
+    return dict.__iter__(self)
+
+  def keys(self):
+    self._read_all()
+    return dict.keys(self)
+
+  def values(self):
+    self._read_all()
+    return dict.values(self)
+
+  def items(self):
+    self._read_all()
+    return dict.items(self)
+
+  def iterkeys(self):
+    self._read_all()
+    return dict.iterkeys(self)
+
+  def itervalues(self):
+    self._read_all()
+    return dict.itervalues(self)
+
+  def iteritems(self):
+    self._read_all()
+    return dict.iteritems(self)
+
+  def copy(self):
+    self._read_all()
+    return dict(dict.items(self))
+
+  def __reduce__(self):
+    # Pickled and copied as a plain dict.
+    self._read_all()
+    return (dict, (dict.items(self),))
+
+
+def _insert(tree, path, whole):
+  """Add a field to a mask tree.
+
+  A tree maps each field name to the tree of the fields wanted inside it.
+  An empty tree asks for the whole field, as does None, which also stops
+  any fields being added inside it.
+  """
+  node = tree
+  for i, key in enumerate(path):
+    if key in node and node[key] is None:
+      return
+    if whole and i == len(path) - 1:
+      node[key] = None
+      return
+    node = node.setdefault(key, {})
+
+
+def _covers(tree, path):
+  """Whether the mask tree asks for the field at path."""
+  node = tree
+  for key in path:
+    if not node:
+      return True
+    if key not in node:
+      return False
+    node = node[key]
+  return True
+
+
+def _render(tree):
+  """Write a mask tree in the syntax of the fields parameter."""
+  parts = []
+  for key in sorted(tree):
+    child = tree[key]
+    if not child:
+      parts.append(key)
+    elif len(child) == 1:
+      parts.append('%s/%s' % (key, _render(child)))
+    else:
+      parts.append('%s(%s)' % (key, _render(child)))
+  return ','.join(parts)
+
+
+def _query_value(uri, name):
+  """The value of the first query parameter of uri called name, or None."""
+  for key, value in urlparse.parse_qsl(urlparse.urlparse(uri).query):
+    if key == name:
+      return value
+  return None
+
+
+def _replace_fields(uri, fields):
+  """Return uri with its fields query parameter set to fields, or removed.
+
+  The other query parameters are kept exactly as they were.
+  """
+  fragment = ''
+  if '#' in uri:
+    uri, fragment = uri.split('#', 1)
+    fragment = '#' + fragment
+  if '?' in uri:
+    base, query = uri.split('?', 1)
+    params = [p for p in query.split('&')
+              if p and not p.startswith('fields=')]
+  else:
+    base = uri
+    params = []
+  if fields:
+    params.append(urllib.urlencode({'fields': fields}))
+  if not params:
+    return base + fragment
+  return '%s?%s%s' % (base, '&'.join(params), fragment)
+
+
+class _MethodFields(object):
+  """What has been learned about the responses to one method."""
+
+  def __init__(self):
+    self.responses = 0
+    self.masked = 0
+    self.unlisted = 0
+    # The paths of the fields read, as tuples of keys, and of the objects
+    # used whole.
+    self.reads = set()
+    self.wholes = set()
+    # The fields not in the mask that have been reported.
+    self.reported = set()
+    # The masks sent, so that they aren't taken for the caller's own.
+    self.issued = set()
+    self.tree = None
+    self.mask = None
+    self.changed = False
+
+  def update_mask(self):
+    """Rebuild the mask from the fields read, if they have changed."""
+    if not self.changed:
+      return
+    self.changed = False
+    if () in self.wholes or not self.reads:
+      self.tree = None
+      self.mask = None
+      return
+    tree = {}
+    for path in self.reads:
+      _insert(tree, path, False)
+    for path in self.wholes:
+      _insert(tree, path, True)
+    self.tree = tree
+    self.mask = _render(tree)
+
+
+class _Recorder(object):
+  """Notes the fields read from one response."""
+
+  def __init__(self, tracker, method_id, state, tree):
+    self._tracker = tracker
+    self._method_id = method_id
+    self._state = state
+    # The mask tree the request was sent with, or None.
+    self._tree = tree
+
+  def read(self, path, key, present):
+    """Note that the field key of the object at path was looked up."""
+    if path is None:
+      # Read by the model while parsing, before wrap() hands it out.
+      return
+    path = path + (key,)
+    if (not present and self._tree is not None and
+        not _covers(self._tree, path)):
+      self._tracker._unlisted(self._method_id, self._state, path)
+    if path not in self._state.reads:
+      self._tracker._add(self._state, path, False)
+
+  def read_all(self, path):
+    """Note that every field of the object at path was read."""
+    if path is None:
+      return
+    if self._tree is not None:
+      node = self._tree
+      for key in path:
+        node = node.get(key) if node else None
+      if node:
+        self._tracker._unlisted(self._method_id, self._state, path)
+    if path not in self._state.wholes:
+      self._tracker._add(self._state, path, True)
+
+  def object_pairs_hook(self, pairs):
+    """Build a JSON object of the response as a TrackedDict.
+
+    Passed to the codec by the model, so that the response doesn't have to
+    be copied into TrackedDicts once parsed. wrap() must then be called on
+    the whole response.
+    """
+    return TrackedDict(self, None, pairs)
+
+  def wrap(self, value):
+    """Make the objects of a deserialized response note their reads.
+
+    Args:
+      value: object, the deserialized response.
+
+    Returns:
+      value with every dict a TrackedDict of this recorder, or value itself
+      if it isn't a JSON object. Objects built by object_pairs_hook() are
+      kept, and any others are copied.
+    """
+    if not isinstance(value, dict):
+      return value
+    self._tracker._count_response(self._state)
+    if value.__class__ is TrackedDict and value._recorder is self:
+      self._set_paths(value)
+      return value
+    return self._wrap(value, ())
+
+  def _set_paths(self, root):
+    """Give the TrackedDicts built by object_pairs_hook() their paths."""
+    stack = [(root, ())]
+    while stack:
+      value, path = stack.pop()
+      if value.__class__ is TrackedDict:
+        value._path = path
+        for key, item in dict.iteritems(value):
+          if isinstance(item, (dict, list)):
+            stack.append((item, path + (key,)))
+      elif isinstance(value, list):
+        # The items of an array share the path of the array in a mask.
+        for item in value:
+          if isinstance(item, (dict, list)):
+            stack.append((item, path))
+
+  def _wrap(self, value, path):
+    if isinstance(value, dict):
+      # dict's own iteritems(), so that copying a TrackedDict of another
+      # response doesn't count as reading it.
+      return TrackedDict(self, path, [(key, self._wrap(item, path + (key,)))
+                                      for key, item in dict.iteritems(value)])
+    if isinstance(value, list):
+      # The items of an array share the path of the array in a mask.
+      return [self._wrap(item, path) for item in value]
+    return value
+
+  def postproc(self, postproc):
+    """Make a request's postproc build its response out of TrackedDicts.
+
+    Args:
+      postproc: callable, the postproc of the request.
+
+    Returns:
+      A postproc that parses with object_pairs_hook(), if postproc is the
+      response() of a model that can, otherwise postproc itself.
+    """
+    model = getattr(postproc, 'im_self', None)
+    hooked_response = getattr(model, 'hooked_response', None)
+    if hooked_response is None or postproc.__name__ != 'response':
+      return postproc
+    return hooked_response(self.object_pairs_hook) or postproc
+
+
+class FieldMaskTracker(object):
+  """Learns the fields read from the responses to each method, and masks."""
+
+  @util.positional(1)
+  def __init__(self, warmup=DEFAULT_WARMUP, listeners=None):
+    """Constructor.
+
+    Args:
+      warmup: int, the number of responses to a method that are fetched in
+        full, to learn the fields read, before its requests are masked.
+      listeners: list of callables, each called as
+        listener(method_id, field) the first time the application reads a
+        field of a method's responses that a mask left out. field is written
+        as in a mask, such as 'items/location'.
+    """
+    self._warmup = warmup
+    self._listeners = list(listeners or [])
+    self._lock = threading.Lock()
+    self._methods = {}
+
+  def add_listener(self, listener):
+    """Call listener(method_id, field) when a field left out is read."""
+    with self._lock:
+      self._listeners.append(listener)
+
+  def _method(self, method_id):
+    """Get the state of a method. Must hold the lock."""
+    state = self._methods.get(method_id)
+    if state is None:
+      state = _MethodFields()
+      self._methods[method_id] = state
+    return state
+
+  def prepare(self, method_id, uri):
+    """Add the mask learned for a method to a request for it.
+
+    Args:
+      method_id: string, the id of the API method, such as
+        'calendar.events.list'.
+      uri: string, the request URI.
+
+    Returns:
+      (uri, recorder): the URI to send, carrying the method's mask once it
+      has one, and the object whose wrap() makes the deserialized response
+      note the fields read from it. recorder is None if the response isn't
+      to be tracked, because the caller asked for their own fields or for
+      media.
+    """
+    if _query_value(uri, 'alt') not in (None, 'json'):
+      return uri, None
+    fields = _query_value(uri, 'fields')
+    with self._lock:
+      state = self._method(method_id)
+      if fields is not None and fields not in state.issued:
+        return uri, None
+      tree = None
+      mask = None
+      if state.responses >= self._warmup:
+        state.update_mask()
+        tree = state.tree
+        mask = state.mask
+        if mask is not None:
+          state.issued.add(mask)
+          state.masked += 1
+    if mask != fields:
+      uri = _replace_fields(uri, mask)
+    return uri, _Recorder(self, method_id, state, tree)
+
+  def _count_response(self, state):
+    with self._lock:
+      state.responses += 1
+
+  def _add(self, state, path, whole):
+    with self._lock:
+      if whole:
+        state.wholes.add(path)
+      else:
+        state.reads.add(path)
+      state.changed = True
+
+  def _unlisted(self, method_id, state, path):
+    """Report a read of a field that the mask of the response left out."""
+    field = '/'.join(path) or '*'
+    with self._lock:
+      state.unlisted += 1
+      if path in state.reported:
+        return
+      state.reported.add(path)
+      listeners = list(self._listeners)
+    logger.warning('%s read %s, which its field mask left out; it will be '
+                   'added to the mask.', method_id, field)
+    for listener in listeners:
+      try:
+        listener(method_id, field)
+      except Exception:
+        logger.exception('Exception calling field mask listener.')
+
+  def mask(self, method_id):
+    """The fields mask sent with requests to a method, or None."""
+    with self._lock:
+      state = self._methods.get(method_id)
+      if state is None or state.responses < self._warmup:
+        return None
+      state.update_mask()
+      return state.mask
+
+  def stats(self):
+    """Get statistics about the masks.
+
+    Returns:
+      A dict mapping each method id seen to a dict with the number of
+      'responses' tracked, the number of requests sent 'masked', the current
+      'mask' or None, and the number of 'unlisted' reads of fields a mask
+      left out.
+    """
+    with self._lock:
+      result = {}
+      for method_id, state in self._methods.iteritems():
+        mask = None
+        if state.responses >= self._warmup:
+          state.update_mask()
+          mask = state.mask
+        result[method_id] = {
+            'responses': state.responses,
+            'masked': state.masked,
+            'mask': mask,
+            'unlisted': state.unlisted,
+            }
+      return result
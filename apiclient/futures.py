@@ -0,0 +1,370 @@
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Futures and a bounded worker pool for asynchronous request execution.
+
+The Future class follows the interface of concurrent.futures.Future, which
+isn't available in Python 2, so that code written against it ports over
+unchanged. The WorkerPool runs blocking calls, such as HttpRequest.execute(),
+on a fixed number of threads so that a single caller can have many requests in
+flight at once.
+
+httplib2.Http objects are not thread-safe. Pass an http_factory to the
+WorkerPool to give every worker thread its own transport:
+
+  pool = WorkerPool(max_workers=20,
+                    http_factory=lambda: credentials.authorize(httplib2.Http()))
+  futures = [service.events().list(calendarId=c).execute_async(pool=pool)
+             for c in calendar_ids]
+  results = [f.result() for f in futures]
+"""
+
+import Queue
+import logging
+import sys
+import threading
+
+from apiclient.errors import CancelledError
+from apiclient.errors import TimeoutError
+from oauth2client import util
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 10
+
+_PENDING = 'PENDING'
+_RUNNING = 'RUNNING'
+_CANCELLED = 'CANCELLED'
+_FINISHED = 'FINISHED'
+
+
+class Future(object):
+  """The result of an asynchronous computation."""
+
+  def __init__(self):
+    self._condition = threading.Condition()
+    self._state = _PENDING
+    self._result = None
+    self._exc_info = None
+    self._callbacks = []
+
+  def _invoke_callbacks(self):
+    for callback in self._callbacks:
+      try:
+        callback(self)
+      except Exception:
+        logger.exception('Exception calling callback for %r', self)
+
+  def cancel(self):
+    """Cancel the future if it hasn't started running.
+
+    Returns:
+      True if the future was cancelled, False if it is running or done.
+    """
+    with self._condition:
+      if self._state in (_RUNNING, _FINISHED):
+        return False
+      if self._state == _CANCELLED:
+        return True
+      self._state = _CANCELLED
+      self._condition.notify_all()
+    self._invoke_callbacks()
+    return True
+
+  def cancelled(self):
+    """Return True if the future was cancelled."""
+    return self._state == _CANCELLED
+
+  def running(self):
+    """Return True if the future is currently executing."""
+    return self._state == _RUNNING
+
+  def done(self):
+    """Return True if the future was cancelled or finished executing."""
+    return self._state in (_CANCELLED, _FINISHED)
+
+  def _wait(self, timeout):
+    with self._condition:
+      if self._state not in (_CANCELLED, _FINISHED):
+        self._condition.wait(timeout)
+      if self._state == _CANCELLED:
+        raise CancelledError()
+      if self._state != _FINISHED:
+        raise TimeoutError()
+
+  def result(self, timeout=None):
+    """Return the value of the computation, waiting for it if needed.
+
+    Args:
+      timeout: float, seconds to wait, or None to wait forever.
+
+    Returns:
+      The value returned by the computation.
+
+    Raises:
+      apiclient.errors.CancelledError if the future was cancelled.
+      apiclient.errors.TimeoutError if the future didn't finish in time.
+      Any exception raised by the computation, with its original traceback.
+    """
+    self._wait(timeout)
+    if self._exc_info is not None:
+      raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+    return self._result
+
+  def exception(self, timeout=None):
+    """Return the exception raised by the computation, or None.
+
+    Args:
+      timeout: float, seconds to wait, or None to wait forever.
+
+    Raises:
+      apiclient.errors.CancelledError if the future was cancelled.
+      apiclient.errors.TimeoutError if the future didn't finish in time.
+    """
+    self._wait(timeout)
+    if self._exc_info is not None:
+      return self._exc_info[1]
+    return None
+
+  def exception_info(self, timeout=None):
+    """Return the exception raised by the computation and its traceback.
+
+    Args:
+      timeout: float, seconds to wait, or None to wait forever.
+
+    Returns:
+      (exception, traceback), or (None, None) if the computation succeeded.
+
+    Raises:
+      apiclient.errors.CancelledError if the future was cancelled.
+      apiclient.errors.TimeoutError if the future didn't finish in time.
+    """
+    self._wait(timeout)
+    if self._exc_info is not None:
+      return self._exc_info[1], self._exc_info[2]
+    return None, None
+
+  def add_done_callback(self, fn):
+    """Attach a callable to be called with the future when it is done.
+
+    If the future is already done then fn is called immediately.
+
+    Args:
+      fn: callable, takes the future as its only argument.
+    """
+    with self._condition:
+      if self._state not in (_CANCELLED, _FINISHED):
+        self._callbacks.append(fn)
+        return
+    try:
+      fn(self)
+    except Exception:
+      logger.exception('Exception calling callback for %r', self)
+
+  def set_running_or_notify_cancel(self):
+    """Mark the future as running.
+
+    Returns:
+      False if the future was cancelled and should not be run, True otherwise.
+    """
+    with self._condition:
+      if self._state == _CANCELLED:
+        return False
+      self._state = _RUNNING
+      return True
+
+  def set_result(self, result):
+    """Set the result of the future and wake up any waiters."""
+    with self._condition:
+      self._result = result
+      self._state = _FINISHED
+      self._condition.notify_all()
+    self._invoke_callbacks()
+
+  def set_exception(self, exception, traceback=None):
+    """Set an exception as the outcome of the future.
+
+    Args:
+      exception: Exception, the exception raised by the computation.
+      traceback: traceback, optional traceback to re-raise the exception with.
+    """
+    with self._condition:
+      self._exc_info = (type(exception), exception, traceback)
+      self._state = _FINISHED
+      self._condition.notify_all()
+    self._invoke_callbacks()
+
+
+def run_in_future(future, fn, *args, **kwargs):
+  """Run fn and store its outcome in future, unless future was cancelled."""
+  if not future.set_running_or_notify_cancel():
+    return
+  try:
+    result = fn(*args, **kwargs)
+  except Exception, e:
+    future.set_exception(e, sys.exc_info()[2])
+  else:
+    future.set_result(result)
+
+
+def wait_first(futures, timeout=None):
+  """Wait until at least one of the futures is done.
+
+  Args:
+    futures: list of Future.
+    timeout: float, seconds to wait, or None to wait forever.
+
+  Returns:
+    The first Future found to be done, or None if the timeout expired.
+  """
+  event = threading.Event()
+  for f in futures:
+    f.add_done_callback(lambda _: event.set())
+  event.wait(timeout)
+  for f in futures:
+    if f.done():
+      return f
+  return None
+
+
+class WorkerPool(object):
+  """A bounded pool of worker threads that run callables and return Futures.
+
+  Worker threads are started lazily, up to max_workers, and are daemon threads
+  so that an idle pool never keeps the process alive.
+  """
+
+  @util.positional(1)
+  def __init__(self, max_workers=DEFAULT_MAX_WORKERS, http_factory=None,
+               max_queue=0):
+    """Constructor.
+
+    Args:
+      max_workers: int, the maximum number of threads to run at once.
+      http_factory: callable, returns a new httplib2.Http, or something that
+        acts like it. If given, each worker thread builds its own transport
+        with it, which is then used for requests that are run on the pool
+        without an explicit http object.
+      max_queue: int, the maximum number of submitted but not yet started
+        calls. submit() blocks while the queue is full. Zero means unbounded.
+    """
+    if max_workers <= 0:
+      raise ValueError('max_workers must be greater than 0.')
+    self._max_workers = max_workers
+    self._http_factory = http_factory
+    self._queue = Queue.Queue(max_queue)
+    self._threads = []
+    self._lock = threading.Lock()
+    self._local = threading.local()
+    self._shutdown = False
+
+  def _worker(self):
+    self._local.in_pool = True
+    while True:
+      item = self._queue.get()
+      if item is None:
+        return
+      future, fn, args, kwargs = item
+      run_in_future(future, fn, *args, **kwargs)
+      del item, future, fn, args, kwargs
+
+  def _adjust_thread_count(self):
+    if len(self._threads) < self._max_workers:
+      t = threading.Thread(target=self._worker)
+      t.daemon = True
+      t.start()
+      self._threads.append(t)
+
+  def submit(self, fn, *args, **kwargs):
+    """Schedule fn(*args, **kwargs) to run on a worker thread.
+
+    Returns:
+      A Future representing the pending call.
+
+    Raises:
+      RuntimeError if the pool has been shut down.
+    """
+    future = Future()
+    with self._lock:
+      if self._shutdown:
+        raise RuntimeError('Cannot submit to a WorkerPool after shutdown.')
+      self._adjust_thread_count()
+    self._queue.put((future, fn, args, kwargs))
+    return future
+
+  def http(self, default=None):
+    """The transport to use on the current thread.
+
+    Args:
+      default: httplib2.Http, returned when the pool has no http_factory or
+        when called from outside of the pool.
+
+    Returns:
+      The calling worker thread's own httplib2.Http, creating it on first use,
+      or default.
+    """
+    if self._http_factory is None or not getattr(self._local, 'in_pool',
+                                                 False):
+      return default
+    http = getattr(self._local, 'http', None)
+    if http is None:
+      http = self._http_factory()
+      self._local.http = http
+    return http
+
+  def shutdown(self, wait=True):
+    """Stop accepting work and let the worker threads exit.
+
+    Calls that were already submitted still run.
+
+    Args:
+      wait: bool, if True block until all worker threads have exited.
+    """
+    with self._lock:
+      self._shutdown = True
+      threads = list(self._threads)
+    for _ in threads:
+      self._queue.put(None)
+    if wait:
+      for t in threads:
+        t.join()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def default_pool():
+  """The process wide WorkerPool used when no pool is given.
+
+  Returns:
+    A WorkerPool with DEFAULT_MAX_WORKERS threads, created on first use.
+  """
+  global _default_pool
+  with _default_pool_lock:
+    if _default_pool is None:
+      _default_pool = WorkerPool()
+    return _default_pool
+
+
+def set_default_pool(pool):
+  """Replace the process wide WorkerPool.
+
+  Args:
+    pool: WorkerPool, the pool to use when no pool is given, or None to
+      create a default one on next use.
+  """
+  global _default_pool
+  with _default_pool_lock:
+    _default_pool = pool
@@ -0,0 +1,257 @@
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Hedging of slow GET requests.
+
+Tail latency is often caused by a few slow responses rather than by the
+typical one. A RequestHedger sends a duplicate of a GET request that hasn't
+been answered within a delay, by default the 95th percentile of the latencies
+observed for the same API method, and returns whichever response arrives
+first. The other attempt is abandoned. A RetryBudget caps the extra load the
+duplicates add:
+
+  from apiclient import http
+  from apiclient.hedge import RequestHedger
+
+  http.request_hedger = RequestHedger(
+      lambda: credentials.authorize(httplib2.Http()))
+
+Both attempts of a hedged request run on the hedger's worker threads, each
+with its own transport from http_factory, so that they are sent on separate
+connections and the slower one can be left to finish on its own. Requests are
+only hedged when those transports are authorized the same way as the
+caller's, which means http_factory must authorize with the same credentials
+object; any other request is sent once, on the caller's http object.
+"""
+
+import collections
+import threading
+import time
+
+from apiclient import futures
+from apiclient.coalesce import auth_identity
+from apiclient.retry import RetryBudget
+from oauth2client import util
+
+DEFAULT_PERCENTILE = 0.95
+
+# The number of latencies kept per key, and the number needed before
+# requests with that key are hedged.
+DEFAULT_WINDOW = 1000
+DEFAULT_MIN_SAMPLES = 20
+
+DEFAULT_MAX_WORKERS = 16
+
+# The percentile is recomputed after this many new latencies.
+_RECOMPUTE_EVERY = 16
+
+
+class _LatencyWindow(object):
+  """The most recent latencies of one key, and a cached percentile."""
+
+  def __init__(self, size):
+    self.samples = collections.deque(maxlen=size)
+    self.since_computed = 0
+    self.delay = None
+
+
+class RequestHedger(object):
+  """Sends a second copy of requests that are slower than usual."""
+
+  @util.positional(2)
+  def __init__(self, http_factory, delay=None,
+               percentile=DEFAULT_PERCENTILE, min_delay=0.0, max_delay=None,
+               budget=None, window=DEFAULT_WINDOW,
+               min_samples=DEFAULT_MIN_SAMPLES,
+               max_workers=DEFAULT_MAX_WORKERS):
+    """Constructor.
+
+    Args:
+      http_factory: callable, returns a new httplib2.Http, or something that
+        acts like it, for each worker thread. Only requests whose http object
+        is authorized the same way, with the same credentials object or the
+        same Authorization header, are hedged.
+      delay: float, the number of seconds to wait for a response before
+        hedging. If None, the delay is the observed percentile of latencies.
+      percentile: float, in (0, 1), the percentile of observed latencies to
+        hedge after when no fixed delay is given.
+      min_delay: float, the shortest delay to hedge after, in seconds.
+      max_delay: float, the longest delay to hedge after, in seconds, or None.
+      budget: apiclient.retry.RetryBudget, limits hedges to a fraction of the
+        requests made. Defaults to one allowing 5% extra load.
+      window: int, the number of recent latencies kept for each API method.
+      min_samples: int, the number of latencies that must have been observed
+        for an API method before its requests are hedged.
+      max_workers: int, the maximum number of attempts in flight at once.
+    """
+    if not 0 < percentile < 1:
+      raise ValueError('percentile must be between 0 and 1.')
+    if budget is None:
+      budget = RetryBudget(ratio=0.05, min_retries=5)
+    self._delay = delay
+    self._percentile = percentile
+    self._min_delay = min_delay
+    self._max_delay = max_delay
+    self.budget = budget
+    self._window = window
+    self._min_samples = min_samples
+    self._http_factory = http_factory
+    self._pool = futures.WorkerPool(max_workers=max_workers,
+                                    http_factory=http_factory)
+    # A transport from http_factory, kept to compare its authorization with
+    # the caller's.
+    self._sample_http = None
+    self._lock = threading.Lock()
+    self._windows = {}
+    self._requests = 0
+    self._hedged = 0
+    self._hedge_wins = 0
+    self._mismatched = 0
+
+  def _same_authorization(self, http, headers):
+    """Whether the hedger's transports authorize like the caller's http."""
+    with self._lock:
+      sample = self._sample_http
+    if sample is None:
+      sample = self._http_factory()
+      with self._lock:
+        self._sample_http = sample
+    return auth_identity(sample, headers) == auth_identity(http, headers)
+
+  def _record(self, key, latency):
+    with self._lock:
+      window = self._windows.get(key)
+      if window is None:
+        window = _LatencyWindow(self._window)
+        self._windows[key] = window
+      window.samples.append(latency)
+      window.since_computed += 1
+
+  def delay(self, key=None):
+    """The number of seconds to wait before hedging a request.
+
+    Args:
+      key: hashable, the API method id of the request.
+
+    Returns:
+      The delay, or None if too few latencies have been observed yet.
+    """
+    if self._delay is not None:
+      delay = self._delay
+    else:
+      with self._lock:
+        window = self._windows.get(key)
+        if window is None or len(window.samples) < self._min_samples:
+          return None
+        if window.delay is None or window.since_computed >= _RECOMPUTE_EVERY:
+          ordered = sorted(window.samples)
+          window.delay = ordered[min(len(ordered) - 1,
+                                     int(len(ordered) * self._percentile))]
+          window.since_computed = 0
+        delay = window.delay
+    delay = max(delay, self._min_delay)
+    if self._max_delay is not None:
+      delay = min(delay, self._max_delay)
+    return delay
+
+  def _attempt(self, send, key):
+    start = time.time()
+    result = send(self._pool.http())
+    self._record(key, time.time() - start)
+    return result
+
+  def request(self, send, http, key=None, headers=None):
+    """Make a request, hedging it if it is slow to be answered.
+
+    Args:
+      send: callable, takes an httplib2.Http, makes one attempt with it and
+        returns (resp, content). Must be idempotent.
+      http: httplib2.Http, the caller's transport. Used on the calling thread
+        while too few latencies are known to hedge, and whenever the
+        hedger's transports aren't authorized the same way.
+      key: hashable, the API method id of the request. Latencies are tracked
+        separately for each key.
+      headers: dict, the request headers, which may carry its
+        authorization.
+
+    Returns:
+      The (resp, content) pair of the first attempt to complete.
+
+    Raises:
+      The exception of the last attempt if every attempt raised one.
+    """
+    with self._lock:
+      self._requests += 1
+    self.budget.record_request()
+    delay = self.delay(key)
+    if delay is not None and not self._same_authorization(http, headers):
+      with self._lock:
+        self._mismatched += 1
+      return send(http)
+    if delay is None:
+      start = time.time()
+      result = send(http)
+      self._record(key, time.time() - start)
+      return result
+
+    primary = self._pool.submit(self._attempt, send, key)
+    if (futures.wait_first([primary], timeout=delay) is not None or
+        not self.budget.try_spend()):
+      return primary.result()
+
+    with self._lock:
+      self._hedged += 1
+    hedge = self._pool.submit(self._attempt, send, key)
+    pending = [primary, hedge]
+    while True:
+      first = futures.wait_first(pending)
+      pending.remove(first)
+      if first.exception() is None or not pending:
+        break
+    # The loser can't be interrupted once it is running. Its response is
+    # dropped when it arrives.
+    for attempt in pending:
+      attempt.cancel()
+    if first is hedge and first.exception() is None:
+      with self._lock:
+        self._hedge_wins += 1
+    return first.result()
+
+  def stats(self):
+    """Counters for the requests made through this hedger.
+
+    Returns:
+      A dict with the number of 'requests', the number 'hedged' by sending a
+      duplicate, the number of 'hedge_wins' where the duplicate answered
+      first, the number of hedges the budget refused ('exhausted'), and the
+      number of requests sent unhedged on the caller's http because it is
+      authorized differently from the hedger's transports ('mismatched').
+    """
+    with self._lock:
+      stats = {
+          'requests': self._requests,
+          'hedged': self._hedged,
+          'hedge_wins': self._hedge_wins,
+          'mismatched': self._mismatched,
+          }
+    stats['exhausted'] = self.budget.stats()['exhausted']
+    return stats
+
+  def shutdown(self, wait=True):
+    """Stop the hedger's worker threads.
+
+    Args:
+      wait: bool, if True block until attempts in flight have completed.
+    """
+    self._pool.shutdown(wait=wait)
@@ -29,47 +29,203 @@ import httplib2
 import logging
 import mimeparse
 import mimetypes
+import mmap
 import os
 import random
 import sys
+import threading
 import time
 import urllib
 import urlparse
 import uuid
 
-from email.generator import Generator
-from email.mime.multipart import MIMEMultipart
-from email.mime.nonmultipart import MIMENonMultipart
-from email.parser import FeedParser
 from errors import BatchError
+from errors import CircuitOpenError
+from errors import DeadlineExceededError
 from errors import HttpError
 from errors import InvalidChunkSizeError
 from errors import ResumableUploadError
 from errors import UnexpectedBodyError
 from errors import UnexpectedMethodError
 from model import JsonModel
+from model import StreamingListResponse
+from apiclient import batchcodec
+from apiclient import futures
+from apiclient.cache import cache_key
+from apiclient.coalesce import auth_identity
+from apiclient.coalesce import coalesce_key
+from apiclient.deadline import to_deadline
+from apiclient.ratelimit import rate_limit_key
+from apiclient.retry import RetryPolicy
 from oauth2client import util
 from oauth2client.anyjson import simplejson
 
 
 DEFAULT_CHUNK_SIZE = 512*1024
 
+DEFAULT_DOWNLOAD_PARALLELISM = 4
+
+# Chunks of a resumable upload, except the last, must be a multiple of this.
+CHUNK_GRANULARITY = 256*1024
+
+# Bounds and target duration of the chunks of an adaptive resumable upload.
+MAX_ADAPTIVE_CHUNK_SIZE = 64*1024*1024
+ADAPTIVE_CHUNK_SECONDS = 4.0
+
 MAX_URI_LENGTH = 2048
 
+# The maximum number of requests the server accepts in a single batch.
+MAX_BATCH_SIZE = 1000
+
+# An apiclient.coalesce.RequestCoalescer that HttpRequest.execute() sends GET
+# requests through, so that identical requests in flight at the same time are
+# only made once. None disables coalescing.
+request_coalescer = None
+
+# An apiclient.cache.ResponseCache that HttpRequest.execute() stores
+# deserialized GET responses carrying an ETag in, and revalidates them against
+# with If-None-Match. None disables the cache.
+response_cache = None
+
+# An apiclient.ratelimit.QuotaScheduler that paces every request made by
+# HttpRequest, MediaIoBaseDownload and BatchHttpRequest. None disables client
+# side rate limiting.
+rate_limiter = None
+
+# An apiclient.hedge.RequestHedger that HttpRequest.execute() sends GET
+# requests through, so that a duplicate is sent of any request that is slower
+# than usual. None disables hedging.
+request_hedger = None
+
+# An apiclient.breaker.CircuitBreaker that every request made by HttpRequest,
+# MediaIoBaseDownload and BatchHttpRequest goes through, so that requests to a
+# failing host are refused at once. None disables circuit breaking.
+circuit_breaker = None
+
+# An apiclient.fieldmask.FieldMaskTracker that HttpRequest.execute() learns
+# which response fields the application reads through, so that it can ask for
+# just those with a fields mask. None disables field masks.
+field_masks = None
+
+# The apiclient.retry.RetryPolicy used by every retry loop, and for
+# re-sending failed requests of a batch. Its RetryBudget, if it is given one,
+# is shared by all of them.
+retry_policy = RetryPolicy()
+
+
+def _acquire(limiter, key, deadline, description):
+  """Wait for the rate limiter, but not past the deadline, if any.
+
+  Args:
+    limiter: apiclient.ratelimit.QuotaScheduler, the rate limiter.
+    key: hashable, from rate_limit_key().
+    deadline: apiclient.deadline.Deadline or None.
+    description: string, the request waiting, for the error message.
+
+  Raises:
+    apiclient.errors.DeadlineExceededError if the deadline has passed, or
+      would pass during the wait.
+  """
+  if deadline is None:
+    limiter.acquire(key)
+    return
+  deadline.check(description)
+  if limiter.acquire(key, max_wait=deadline.remaining()) is None:
+    raise DeadlineExceededError(
+        'Deadline would pass waiting for the rate limiter before %s'
+        % description)
+
+
+def _paced_request(http, method_id, uri, method='GET', body=None,
+                   headers=None, deadline=None):
+  """Make a request through the circuit breaker and rate limiter, if set.
+
+  Args:
+    http: httplib2.Http, the http object to make the request with.
+    method_id: string, the id of the API method being called, or None.
+    uri: string, the absolute URI to send the request to.
+    method: string, the HTTP method to use.
+    body: string, the request body.
+    headers: dict, the request headers.
+    deadline: apiclient.deadline.Deadline, caps the socket timeouts of http.
+
+  Returns:
+    The (resp, content) pair returned by http.request().
+
+  Raises:
+    apiclient.errors.DeadlineExceededError if the deadline passes first,
+      or would pass while waiting for the rate limiter.
+    apiclient.errors.CircuitOpenError if the circuit of the host is open.
+  """
+  description = '%s %s' % (method, uri)
+  # The wait for the rate limiter comes before the circuit breaker starts
+  # timing the request, so that pacing isn't taken for a slow host, and
+  # before the deadline locks http, so that other threads can use it.
+  limiter = rate_limiter
+  if limiter is not None:
+    key = rate_limit_key(method_id, auth_identity(http, headers))
+    _acquire(limiter, key, deadline, description)
+  send = lambda: http.request(uri, method=method, body=body, headers=headers)
+  breaker = circuit_breaker
+  if breaker is not None:
+    send_once = lambda: breaker.call(uri, send)
+  else:
+    send_once = send
+  if deadline is not None:
+    resp, content = deadline.call(http, send_once, description=description)
+  else:
+    resp, content = send_once()
+  if limiter is not None:
+    limiter.feedback(key, resp, content)
+  return resp, content
+
+
+def _adapt_chunksize(chunksize, sent, elapsed, retried):
+  """Pick the size of the next chunk of an adaptive resumable upload.
+
+  The size doubles while chunks take less than half of ADAPTIVE_CHUNK_SECONDS,
+  without exceeding what the measured throughput sends in that time. It is
+  halved after a retry or a failure, and cut to the measured throughput when
+  a chunk takes more than twice that time.
+
+  Args:
+    chunksize: int, the size of the chunk that was sent.
+    sent: int, the number of bytes sent in the chunk.
+    elapsed: float, seconds taken to send the chunk.
+    retried: bool, whether the chunk failed or had to be retried.
+
+  Returns:
+    The size of the next chunk, a multiple of CHUNK_GRANULARITY.
+  """
+  if retried:
+    chunksize //= 2
+  elif elapsed > 2 * ADAPTIVE_CHUNK_SECONDS:
+    chunksize = sent / elapsed * ADAPTIVE_CHUNK_SECONDS
+  elif sent >= chunksize and elapsed < ADAPTIVE_CHUNK_SECONDS / 2:
+    if elapsed > 0:
+      chunksize = min(2 * chunksize, sent / elapsed * ADAPTIVE_CHUNK_SECONDS)
+    else:
+      chunksize *= 2
+  chunksize = int(chunksize) // CHUNK_GRANULARITY * CHUNK_GRANULARITY
+  return max(CHUNK_GRANULARITY, min(MAX_ADAPTIVE_CHUNK_SIZE, chunksize))
+
 
 class MediaUploadProgress(object):
   """Status of a resumable upload."""
 
-  def __init__(self, resumable_progress, total_size):
+  def __init__(self, resumable_progress, total_size, chunksize=None):
     """Constructor.
 
     Args:
       resumable_progress: int, bytes sent so far.
       total_size: int, total bytes in complete upload, or None if the total
         upload size isn't known ahead of time.
+      chunksize: int, the size of the next chunk to be sent, or None if it
+        isn't known.
     """
     self.resumable_progress = resumable_progress
     self.total_size = total_size
+    self.chunksize = chunksize
 
   def progress(self):
     """Percent of upload completed, as a float.
@@ -274,6 +430,8 @@ class MediaIoBaseUpload(MediaUpload):
   also avoids loading the entire file into memory before sending it. Note that
   Google App Engine has a 5MB limit on request size, so you should never set
   your chunksize larger than 5MB, or to -1.
+
+  Use MediaStreamUpload for pipes and other streams that can't seek.
   """
 
   @util.positional(3)
@@ -399,11 +557,19 @@ class MediaFileUpload(MediaIoBaseUpload):
   also avoids loading the entire file into memory before sending it. Note that
   Google App Engine has a 5MB limit on request size, so you should never set
   your chunksize larger than 5MB, or to -1.
+
+  With use_mmap=True each chunk is memory mapped from the file and handed to
+  the transport as a read-only buffer over the mapping, so chunks aren't
+  copied into new strings. A chunk is unmapped once the transport has sent it
+  and dropped the buffer:
+
+    media = MediaFileUpload('cow.png', mimetype='image/png',
+      chunksize=8*1024*1024, resumable=True, use_mmap=True)
   """
 
   @util.positional(2)
   def __init__(self, filename, mimetype=None, chunksize=DEFAULT_CHUNK_SIZE,
-               resumable=False):
+               resumable=False, use_mmap=False):
     """Constructor.
 
     Args:
@@ -417,6 +583,8 @@ class MediaFileUpload(MediaIoBaseUpload):
         or to -1.
       resumable: bool, True if this is a resumable upload. False means upload
         in a single request.
+      use_mmap: bool, True to memory map each chunk of the file and upload
+        buffers over the mapping instead of strings read from the file.
     """
     self._filename = filename
     fd = open(self._filename, 'rb')
@@ -424,6 +592,43 @@ class MediaFileUpload(MediaIoBaseUpload):
       (mimetype, encoding) = mimetypes.guess_type(filename)
     super(MediaFileUpload, self).__init__(fd, mimetype, chunksize=chunksize,
                                           resumable=resumable)
+    self._use_mmap = use_mmap
+
+  def getbytes(self, begin, length):
+    """Get bytes from the media.
+
+    Args:
+      begin: int, offset from beginning of file.
+      length: int, number of bytes to read, starting at begin.
+
+    Returns:
+      A string of bytes read, or a read-only buffer over the memory mapped
+      file if use_mmap was set. May be shorter than length if EOF was reached
+      first.
+    """
+    if not self._use_mmap:
+      return super(MediaFileUpload, self).getbytes(begin, length)
+    begin = min(begin, self._size)
+    if length < 0 or begin + length > self._size:
+      length = self._size - begin
+    if not length:
+      return ''
+    # Mappings must start at a multiple of the allocation granularity.
+    offset = begin - begin % mmap.ALLOCATIONGRANULARITY
+    chunk = mmap.mmap(self._fd.fileno(), begin - offset + length,
+                      access=mmap.ACCESS_READ, offset=offset)
+    return buffer(chunk, begin - offset, length)
+
+  def has_stream(self):
+    """Does the underlying upload support a streaming interface.
+
+    Memory mapped chunks are uploaded with getbytes() instead.
+
+    Returns:
+      True if the call to stream() will return an instance of a seekable io.Base
+      subclass.
+    """
+    return not self._use_mmap
 
   def to_json(self):
     """Creating a JSON representation of an instance of MediaFileUpload.
@@ -438,7 +643,8 @@ class MediaFileUpload(MediaIoBaseUpload):
   def from_json(s):
     d = simplejson.loads(s)
     return MediaFileUpload(d['_filename'], mimetype=d['_mimetype'],
-                           chunksize=d['_chunksize'], resumable=d['_resumable'])
+                           chunksize=d['_chunksize'], resumable=d['_resumable'],
+                           use_mmap=d.get('_use_mmap', False))
 
 
 class MediaInMemoryUpload(MediaIoBaseUpload):
@@ -470,6 +676,156 @@ class MediaInMemoryUpload(MediaIoBaseUpload):
                                               resumable=resumable)
 
 
+class MediaStreamUpload(MediaUpload):
+  """A resumable MediaUpload read once from a pipe or an iterator.
+
+  The source doesn't have to be seekable, so generated data can be uploaded
+  as it is produced rather than written to a temporary file first:
+
+    proc = subprocess.Popen(['gzip', '-c', 'export.csv'],
+                            stdout=subprocess.PIPE)
+    media = MediaStreamUpload(proc.stdout, mimetype='application/gzip')
+    request = farm.animals().insert(name='export.csv.gz', media_body=media)
+    response = None
+    while response is None:
+      status, response = request.next_chunk(num_retries=3)
+
+  The size of the media is unknown until the source runs out, so chunks are
+  sent with an unknown total length. Only the bytes the server hasn't
+  acknowledged yet are kept, to be sent again after a failure, so memory use
+  stays around one chunk however large the stream is.
+  """
+
+  @util.positional(3)
+  def __init__(self, source, mimetype, chunksize=DEFAULT_CHUNK_SIZE):
+    """Constructor.
+
+    Args:
+      source: a file-like object with read(), such as a pipe, or an iterable
+        of strings, such as a generator.
+      mimetype: string, Mime-type of the media.
+      chunksize: int, the media is uploaded in chunks of this many bytes. Must
+        be a multiple of CHUNK_GRANULARITY.
+    """
+    super(MediaStreamUpload, self).__init__()
+    if chunksize <= 0 or chunksize % CHUNK_GRANULARITY:
+      raise InvalidChunkSizeError()
+    if hasattr(source, 'read'):
+      self._read = source.read
+      self._pieces = None
+    else:
+      self._read = None
+      self._pieces = iter(source)
+    self._mimetype = mimetype
+    self._chunksize = chunksize
+    # The unacknowledged bytes, starting at offset _begin of the media.
+    self._buffer = bytearray()
+    self._begin = 0
+    self._size = None
+
+  def chunksize(self):
+    return self._chunksize
+
+  def mimetype(self):
+    return self._mimetype
+
+  def size(self):
+    """Size of upload.
+
+    Returns:
+      Size of the body, or None until the source has run out.
+    """
+    return self._size
+
+  def resumable(self):
+    return True
+
+  def _fill(self, end):
+    """Read from the source until the buffer reaches offset end or EOF."""
+    while self._size is None and self._begin + len(self._buffer) < end:
+      if self._read is not None:
+        data = self._read(end - self._begin - len(self._buffer))
+      else:
+        data = ''
+        while not data and self._pieces is not None:
+          try:
+            data = self._pieces.next()
+          except StopIteration:
+            self._pieces = None
+      if not data:
+        self._size = self._begin + len(self._buffer)
+      else:
+        self._buffer.extend(data)
+
+  def getbytes(self, begin, length):
+    """Get bytes from the media.
+
+    Bytes before begin are taken to be acknowledged by the server and are
+    dropped.
+
+    Args:
+      begin: int, offset from beginning of the media.
+      length: int, number of bytes to read, starting at begin.
+
+    Returns:
+      A read-only buffer over the bytes read, valid until the next call.
+      Shorter than length if the source ran out first.
+
+    Raises:
+      ValueError if the bytes at begin have already been dropped.
+    """
+    if begin < self._begin:
+      raise ValueError('Bytes from offset %d of the stream have already been '
+                       'dropped.' % begin)
+    del self._buffer[:begin - self._begin]
+    self._begin = begin
+    # Read one byte ahead, so that a last chunk of exactly length bytes is
+    # known to be the last and is sent with the total size.
+    self._fill(begin + length + 1)
+    return buffer(self._buffer, 0, length)
+
+  def to_json(self):
+    """This upload type is not serializable."""
+    raise NotImplementedError('MediaStreamUpload is not serializable.')
+
+
+def _range_start(resp):
+  """The offset of the first byte of a partial response, or None.
+
+  Args:
+    resp: httplib2.Response, a 206 response.
+
+  Returns:
+    The first offset of its Content-Range, or None if it has none or it is
+    malformed.
+  """
+  unit, _, byte_range = resp.get('content-range', '').strip().partition(' ')
+  if unit.lower() != 'bytes':
+    return None
+  first = byte_range.split('-', 1)[0].strip()
+  if not first.isdigit():
+    return None
+  return int(first)
+
+
+class _DownloadRange(object):
+  """A byte range of a parallel download and how much of it is written."""
+
+  def __init__(self, begin, end):
+    """Constructor.
+
+    Args:
+      begin: int, offset of the first byte of the range.
+      end: int, offset just past the last byte of the range.
+    """
+    self.begin = begin
+    self.end = end
+    self.progress = begin
+
+  def done(self):
+    return self.progress >= self.end
+
+
 class MediaIoBaseDownload(object):
   """"Download media resources.
 
@@ -488,6 +844,13 @@ class MediaIoBaseDownload(object):
       if status:
         print "Download %d%%." % int(status.progress() * 100)
     print "Download Complete!"
+
+  Large downloads can instead fetch several chunks at once and write each at
+  its offset. The stream must then be seekable:
+
+    fh = io.FileIO('cow.png', mode='wb')
+    downloader = MediaIoBaseDownload(fh, request, chunksize=1024*1024)
+    downloader.download_parallel(parallelism=8, http_factory=httplib2.Http)
   """
 
   @util.positional(3)
@@ -509,19 +872,30 @@ class MediaIoBaseDownload(object):
     self._total_size = None
     self._done = False
 
+    # The ranges of a parallel download, and the stream position of the
+    # first byte of the media.
+    self._ranges = None
+    self._base = None
+    self._write_lock = threading.Lock()
+    # Held while a range is fetched with the request's own http object.
+    self._http_lock = threading.Lock()
+
     # Stubs for testing.
     self._sleep = time.sleep
     self._rand = random.random
 
   @util.positional(1)
-  def next_chunk(self, num_retries=0):
+  def next_chunk(self, num_retries=0, deadline=None):
     """Get the next chunk of the download.
 
     Args:
-      num_retries: Integer, number of times to retry 500's with randomized
-            exponential backoff. If all retries fail, the raised HttpError
-            represents the last request. If zero (default), we attempt the
-            request only once.
+      num_retries: Integer, number of times to retry errors allowed by
+            retry_policy, 500's and rate limit errors by default, with
+            jittered backoff or as long as Retry-After asks. If all retries
+            fail, the raised HttpError represents the last request. If zero
+            (default), we attempt the request only once.
+      deadline: apiclient.deadline.Deadline or a number of seconds, the time
+            by which the chunk must have been fetched, retries included.
 
     Returns:
       (status, done): (MediaDownloadStatus, boolean)
@@ -530,24 +904,21 @@ class MediaIoBaseDownload(object):
 
     Raises:
       apiclient.errors.HttpError if the response was not a 2xx.
+      apiclient.errors.DeadlineExceededError if the deadline passed.
       httplib2.HttpLib2Error if a transport error has occured.
     """
+    deadline = to_deadline(deadline)
     headers = {
         'range': 'bytes=%d-%d' % (
             self._progress, self._progress + self._chunksize)
         }
     http = self._request.http
 
-    for retry_num in xrange(num_retries + 1):
-      if retry_num > 0:
-        self._sleep(self._rand() * 2**retry_num)
-        logging.warning(
-            'Retry #%d for media download: GET %s, following status: %d'
-            % (retry_num, self._uri, resp.status))
-
-      resp, content = http.request(self._uri, headers=headers)
-      if resp.status < 500:
-        break
+    resp, content = retry_policy.run(
+        lambda: _paced_request(http, self._request.methodId, self._uri,
+                               headers=headers, deadline=deadline),
+        num_retries, self._sleep, self._rand,
+        description='media download: GET %s' % self._uri, deadline=deadline)
 
     if resp.status in [200, 206]:
       if 'content-location' in resp and resp['content-location'] != self._uri:
@@ -566,6 +937,145 @@ class MediaIoBaseDownload(object):
     else:
       raise HttpError(resp, content, uri=self._uri)
 
+  @util.positional(1)
+  def download_parallel(self, parallelism=DEFAULT_DOWNLOAD_PARALLELISM,
+                        num_retries=0, http_factory=None, pool=None,
+                        deadline=None):
+    """Download the rest of the media, fetching several chunks at once.
+
+    The first chunk is fetched on its own to learn the size of the media. The
+    rest is split into ranges of chunksize bytes that are fetched concurrently
+    and written at their offsets in the stream. Each range keeps its own
+    progress, so when some ranges fail the error is raised once the others
+    have completed, and calling download_parallel() again fetches only the
+    missing bytes.
+
+    If the server doesn't report the size of the media the first response is
+    taken to hold all of it. A range response is only written once its
+    Content-Range shows that it starts at the offset asked for.
+
+    Args:
+      parallelism: int, the number of ranges fetched at once when no pool is
+        given.
+      num_retries: Integer, number of times to retry each range request, as
+        for next_chunk().
+      http_factory: callable, returns a new httplib2.Http for each thread
+        fetching ranges.
+      pool: apiclient.futures.WorkerPool, the pool to fetch ranges on. Its
+        per-thread http object is used when no http_factory is given. With
+        neither, httplib2.Http isn't thread-safe, so the ranges are fetched
+        one at a time with the request's http object.
+      deadline: apiclient.deadline.Deadline or a number of seconds, the time
+        by which the whole download must have completed.
+
+    Returns:
+      MediaDownloadProgress of the completed download.
+
+    Raises:
+      apiclient.errors.HttpError if the response to a range was not a 2xx.
+      apiclient.errors.DeadlineExceededError if the deadline passed.
+      httplib2.HttpLib2Error if a transport error has occured.
+    """
+    deadline = to_deadline(deadline)
+    if self._ranges is None:
+      if self._total_size is None:
+        self.next_chunk(num_retries=num_retries, deadline=deadline)
+      if self._total_size is None:
+        # The server ignored the range and sent the whole media.
+        self._total_size = self._progress
+        self._done = True
+      if self._done:
+        return MediaDownloadProgress(self._progress, self._total_size)
+      self._base = self._fd.tell() - self._progress
+      self._ranges = []
+      for begin in xrange(self._progress, self._total_size, self._chunksize):
+        self._ranges.append(_DownloadRange(
+            begin, min(begin + self._chunksize, self._total_size)))
+
+    own_pool = None
+    if pool is None:
+      if http_factory is None:
+        parallelism = 1
+      own_pool = futures.WorkerPool(max_workers=parallelism,
+                                    http_factory=http_factory)
+      pool = own_pool
+    if http_factory is not None:
+      local = threading.local()
+
+      def thread_http():
+        http = getattr(local, 'http', None)
+        if http is None:
+          http = local.http = http_factory()
+        return http
+    else:
+      thread_http = lambda: pool.http(None)
+    try:
+      pending = [(r, pool.submit(self._fetch_range, r, thread_http,
+                                 num_retries, deadline))
+                 for r in self._ranges if not r.done()]
+      exc_info = None
+      for _, future in pending:
+        try:
+          future.result()
+        except Exception:
+          if exc_info is None:
+            exc_info = sys.exc_info()
+    finally:
+      if own_pool is not None:
+        own_pool.shutdown()
+
+    self._progress = self._total_size - sum(
+        r.end - r.progress for r in self._ranges)
+    if exc_info is not None:
+      raise exc_info[0], exc_info[1], exc_info[2]
+    self._done = True
+    self._fd.seek(self._base + self._total_size)
+    return MediaDownloadProgress(self._progress, self._total_size)
+
+  def _fetch_range(self, download_range, thread_http, num_retries,
+                   deadline):
+    """Fetch the missing bytes of a range and write them at their offset.
+
+    Args:
+      download_range: _DownloadRange, the range to fetch.
+      thread_http: callable, returns the calling thread's own httplib2.Http,
+        or None to share the request's, one fetch at a time.
+      num_retries: Integer, number of times to retry each request.
+      deadline: apiclient.deadline.Deadline or None.
+    """
+    http = thread_http()
+    lock = None
+    if http is None:
+      http = self._request.http
+      lock = self._http_lock
+
+    def send():
+      if lock is None:
+        return _paced_request(http, self._request.methodId, self._uri,
+                              headers=headers, deadline=deadline)
+      with lock:
+        return _paced_request(http, self._request.methodId, self._uri,
+                              headers=headers, deadline=deadline)
+
+    while not download_range.done():
+      headers = {
+          'range': 'bytes=%d-%d' % (download_range.progress,
+                                    download_range.end - 1)
+          }
+      resp, content = retry_policy.run(
+          send, num_retries, self._sleep, self._rand,
+          description='media download: GET %s %s' % (self._uri,
+                                                     headers['range']),
+          deadline=deadline)
+      if (resp.status != 206 or not content or
+          _range_start(resp) != download_range.progress):
+        raise HttpError(resp, content, uri=self._uri)
+      content = content[:download_range.end - download_range.progress]
+      with self._write_lock:
+        self._fd.seek(self._base + download_range.progress)
+        self._fd.write(content)
+      download_range.progress += len(content)
+
 
 class _StreamSlice(object):
   """Truncated stream.
@@ -575,6 +1085,9 @@ class _StreamSlice(object):
   stream can be passed to httplib in place of the string of data to send. The
   problem is that httplib just blindly reads to the end of the stream. This
   wrapper presents a virtual stream that only reads to the end of the chunk.
+
+  The slice assumes nothing else moves the stream while it is read, and counts
+  the bytes left instead of calling tell() on every read.
   """
 
   def __init__(self, stream, begin, chunksize):
@@ -588,6 +1101,7 @@ class _StreamSlice(object):
     self._stream = stream
     self._begin = begin
     self._chunksize = chunksize
+    self._remaining = chunksize
     self._stream.seek(begin)
 
   def read(self, n=-1):
@@ -599,12 +1113,13 @@ class _StreamSlice(object):
     Returns:
       A string of length 'n', or less if EOF is reached.
     """
-    # The data left available to read sits in [cur, end)
-    cur = self._stream.tell()
-    end = self._begin + self._chunksize
-    if n == -1 or cur + n > end:
-      n = end - cur
-    return self._stream.read(n)
+    if n < 0 or n > self._remaining:
+      n = self._remaining
+    if n == 0:
+      return ''
+    data = self._stream.read(n)
+    self._remaining -= len(data)
+    return data
 
 
 class HttpRequest(object):
@@ -655,21 +1170,29 @@ class HttpRequest(object):
     # The bytes that have been uploaded.
     self.resumable_progress = 0
 
+    # The size of the next chunk when chunks are sized adaptively.
+    self.resumable_chunksize = None
+
     # Stubs for testing.
     self._rand = random.random
     self._sleep = time.sleep
 
   @util.positional(1)
-  def execute(self, http=None, num_retries=0):
+  def execute(self, http=None, num_retries=0, deadline=None):
     """Execute the request.
 
     Args:
       http: httplib2.Http, an http object to be used in place of the
             one the HttpRequest request object was constructed with.
-      num_retries: Integer, number of times to retry 500's with randomized
-            exponential backoff. If all retries fail, the raised HttpError
-            represents the last request. If zero (default), we attempt the
-            request only once.
+      num_retries: Integer, number of times to retry errors allowed by
+            retry_policy, 500's and rate limit errors by default, with
+            jittered backoff or as long as Retry-After asks. If all retries
+            fail, the raised HttpError represents the last request. If zero
+            (default), we attempt the request only once.
+      deadline: apiclient.deadline.Deadline or a number of seconds, the time
+            by which the request must have completed, retries and credential
+            refreshes included. Socket timeouts are capped to the time left
+            and retries that would wait past it are skipped.
 
     Returns:
       A deserialized object model of the response body as determined
@@ -677,19 +1200,47 @@ class HttpRequest(object):
 
     Raises:
       apiclient.errors.HttpError if the response was not a 2xx.
+      apiclient.errors.DeadlineExceededError if the deadline passed.
+      apiclient.errors.CircuitOpenError if circuit_breaker refused the
+        request and there was no cached response to serve instead.
       httplib2.HttpLib2Error if a transport error has occured.
     """
     if http is None:
       http = self.http
+    deadline = to_deadline(deadline)
 
     if self.resumable:
       body = None
       while body is None:
-        _, body = self.next_chunk(http=http, num_retries=num_retries)
+        _, body = self.next_chunk(http=http, num_retries=num_retries,
+                                  deadline=deadline)
       return body
 
     # Non-resumable case.
 
+    tracker = field_masks
+    if (tracker is None or self.methodId is None or
+        'x-http-method-override' in self.headers):
+      return self._execute(http, num_retries, deadline)
+    self.uri, recorder = tracker.prepare(self.methodId, self.uri)
+    if recorder is None:
+      return self._execute(http, num_retries, deadline)
+    result = self._execute(http, num_retries, deadline,
+                           recorder.postproc(self.postproc))
+    return recorder.wrap(result)
+
+  def _execute(self, http, num_retries, deadline, postproc=None):
+    """Send a non-resumable request and deserialize the response.
+
+    Args:
+      http: httplib2.Http, the http object to make the request with.
+      num_retries: Integer, the maximum number of retries.
+      deadline: apiclient.deadline.Deadline, bounds every attempt and retry.
+      postproc: callable, deserializes the response in place of the
+        request's own postproc.
+    """
+    if postproc is None:
+      postproc = self.postproc
     if 'content-length' not in self.headers:
       self.headers['content-length'] = str(self.body_size)
     # If the request URI is too long then turn it into a POST request.
@@ -705,23 +1256,120 @@ class HttpRequest(object):
       self.body = parsed.query
       self.headers['content-length'] = str(len(self.body))
 
-    # Handle retries for server-side errors.
-    for retry_num in xrange(num_retries + 1):
-      if retry_num > 0:
-        self._sleep(self._rand() * 2**retry_num)
-        logging.warning('Retry #%d for request: %s %s, following status: %d'
-                        % (retry_num, self.method, self.uri, resp.status))
-
-      resp, content = http.request(str(self.uri), method=str(self.method),
-                                   body=self.body, headers=self.headers)
-      if resp.status < 500:
-        break
+    headers = self.headers
+    cache = None
+    entry = None
+    if (response_cache is not None and self.method == 'GET' and
+        self.methodId is not None):
+      cache = response_cache
+      key = cache_key(self.methodId, self.uri,
+                      auth_identity(http, self.headers))
+      entry = cache.get(key)
+      if entry is not None:
+        headers = copy.copy(self.headers)
+        headers['if-none-match'] = entry.etag
+
+    try:
+      if request_coalescer is not None and self.method == 'GET':
+        resp, content = request_coalescer.do(
+            coalesce_key(self.method, self.uri, http, headers),
+            lambda: self._request_with_retries(http, num_retries, headers,
+                                               deadline),
+            copy_result=lambda result: (copy.copy(result[0]), result[1]),
+            deadline=deadline)
+      else:
+        resp, content = self._request_with_retries(http, num_retries,
+                                                   headers, deadline)
+    except CircuitOpenError, e:
+      breaker = circuit_breaker
+      if entry is None or breaker is None or not breaker.serve_stale:
+        raise
+      # The cached copy may be out of date, but it beats no answer at all.
+      breaker.record_stale(e.host)
+      return entry.value
 
     for callback in self.response_callbacks:
       callback(resp)
+
+    if entry is not None:
+      # httplib2 answers a 304 itself when it has its own cache, in which case
+      # the response is marked fromcache.
+      not_modified = resp.status == 304 or (
+          getattr(resp, 'fromcache', False) and
+          resp.get('etag') == entry.etag)
+      if not_modified:
+        cache.record(True)
+        return entry.value
+
     if resp.status >= 300:
       raise HttpError(resp, content, uri=self.uri)
-    return self.postproc(resp, content)
+    result = postproc(resp, content)
+    if cache is not None:
+      cache.record(False)
+      # A StreamingListResponse is read lazily and can't be shared.
+      if 'etag' in resp and not isinstance(result, StreamingListResponse):
+        cache.put(key, resp['etag'], result)
+    return result
+
+  def _request_with_retries(self, http, num_retries, headers=None,
+                            deadline=None):
+    """Send the request, retrying errors allowed by the retry policy.
+
+    Args:
+      http: httplib2.Http, the http object to make the request with.
+      num_retries: Integer, the maximum number of retries.
+      headers: dict, headers to send in place of the request's own headers.
+      deadline: apiclient.deadline.Deadline, bounds every attempt and retry.
+
+    Returns:
+      The (resp, content) pair of the last attempt.
+    """
+    if headers is None:
+      headers = self.headers
+    send = lambda h: _paced_request(h, self.methodId, str(self.uri),
+                                    method=str(self.method), body=self.body,
+                                    headers=headers, deadline=deadline)
+    hedger = request_hedger
+    if hedger is not None and self.method == 'GET':
+      attempt = lambda: hedger.request(send, http, self.methodId,
+                                       headers=headers)
+    else:
+      attempt = lambda: send(http)
+    return retry_policy.run(
+        attempt, num_retries, self._sleep, self._rand,
+        description='request: %s %s' % (self.method, self.uri),
+        deadline=deadline)
+
+  @util.positional(1)
+  def execute_async(self, http=None, num_retries=0, pool=None, deadline=None):
+    """Execute the request on a worker thread.
+
+    Args:
+      http: httplib2.Http, an http object to be used in place of the
+            one the HttpRequest request object was constructed with. If not
+            given, the pool's per-thread http object is used when it has an
+            http_factory.
+      num_retries: Integer, number of times to retry errors allowed by
+            retry_policy.
+      pool: apiclient.futures.WorkerPool, the pool to run the request on. If
+            None then the process wide default pool is used.
+      deadline: apiclient.deadline.Deadline or a number of seconds, as for
+            execute(). Time spent waiting for a worker thread counts.
+
+    Returns:
+      An apiclient.futures.Future whose result() is the deserialized object
+      model of the response body, or raises the error execute() would raise.
+    """
+    if pool is None:
+      pool = futures.default_pool()
+    return pool.submit(self._run_in_pool, self.execute, pool, http,
+                       num_retries, to_deadline(deadline))
+
+  def _run_in_pool(self, fn, pool, http, num_retries, deadline):
+    """Call fn with the transport selected for the current worker thread."""
+    if http is None:
+      http = pool.http(self.http)
+    return fn(http=http, num_retries=num_retries, deadline=deadline)
 
   @util.positional(2)
   def add_response_callback(self, cb):
@@ -736,7 +1384,8 @@ class HttpRequest(object):
     self.response_callbacks.append(cb)
 
   @util.positional(1)
-  def next_chunk(self, http=None, num_retries=0):
+  def next_chunk(self, http=None, num_retries=0, adaptive=False,
+                 deadline=None):
     """Execute the next step of a resumable upload.
 
     Can only be used if the method being executed supports media uploads and
@@ -761,10 +1410,19 @@ class HttpRequest(object):
     Args:
       http: httplib2.Http, an http object to be used in place of the
             one the HttpRequest request object was constructed with.
-      num_retries: Integer, number of times to retry 500's with randomized
-            exponential backoff. If all retries fail, the raised HttpError
-            represents the last request. If zero (default), we attempt the
-            request only once.
+      num_retries: Integer, number of times to retry errors allowed by
+            retry_policy, 500's and rate limit errors by default, with
+            jittered backoff or as long as Retry-After asks. If all retries
+            fail, the raised HttpError represents the last request. If zero
+            (default), we attempt the request only once.
+      adaptive: bool, if True the chunk size starts from the media's chunksize
+            and is then adjusted after every chunk: it grows while chunks are
+            sent quickly and shrinks after retries or failures. The size of
+            the next chunk is reported by status.chunksize. Ignored when the
+            media is sent in a single chunk.
+      deadline: apiclient.deadline.Deadline or a number of seconds, the time
+            by which this step must have completed, as for execute(). Pass
+            the same Deadline to every call to bound the whole upload.
 
     Returns:
       (status, body): (ResumableMediaStatus, object)
@@ -772,10 +1430,12 @@ class HttpRequest(object):
 
     Raises:
       apiclient.errors.HttpError if the response was not a 2xx.
+      apiclient.errors.DeadlineExceededError if the deadline passed.
       httplib2.HttpLib2Error if a transport error has occured.
     """
     if http is None:
       http = self.http
+    deadline = to_deadline(deadline)
 
     if self.resumable.size() is None:
       size = '*'
@@ -789,18 +1449,13 @@ class HttpRequest(object):
         start_headers['X-Upload-Content-Length'] = size
       start_headers['content-length'] = str(self.body_size)
 
-      for retry_num in xrange(num_retries + 1):
-        if retry_num > 0:
-          self._sleep(self._rand() * 2**retry_num)
-          logging.warning(
-              'Retry #%d for resumable URI request: %s %s, following status: %d'
-              % (retry_num, self.method, self.uri, resp.status))
-
-        resp, content = http.request(self.uri, method=self.method,
-                                     body=self.body,
-                                     headers=start_headers)
-        if resp.status < 500:
-          break
+      resp, content = retry_policy.run(
+          lambda: _paced_request(http, self.methodId, self.uri,
+                                 method=self.method, body=self.body,
+                                 headers=start_headers, deadline=deadline),
+          num_retries, self._sleep, self._rand,
+          description='resumable URI request: %s %s' % (self.method, self.uri),
+          deadline=deadline)
 
       if resp.status == 200 and 'location' in resp:
         self.resumable_uri = resp['location']
@@ -814,8 +1469,9 @@ class HttpRequest(object):
           'Content-Range': 'bytes */%s' % size,
           'content-length': '0'
           }
-      resp, content = http.request(self.resumable_uri, 'PUT',
-                                   headers=headers)
+      resp, content = _paced_request(http, self.methodId, self.resumable_uri,
+                                     method='PUT', headers=headers,
+                                     deadline=deadline)
       status, body = self._process_response(resp, content)
       if body:
         # The upload was complete.
@@ -824,54 +1480,113 @@ class HttpRequest(object):
     # The httplib.request method can take streams for the body parameter, but
     # only in Python 2.6 or later. If a stream is available under those
     # conditions then use it as the body argument.
+    chunksize = self.resumable.chunksize()
+    adaptive = adaptive and chunksize != -1
+    if adaptive:
+      if self.resumable_chunksize is None:
+        self.resumable_chunksize = max(
+            CHUNK_GRANULARITY,
+            chunksize // CHUNK_GRANULARITY * CHUNK_GRANULARITY)
+      chunksize = self.resumable_chunksize
+
     if self.resumable.has_stream() and sys.version_info[1] >= 6:
-      data = self.resumable.stream()
-      if self.resumable.chunksize() == -1:
-        data.seek(self.resumable_progress)
-        chunk_end = self.resumable.size() - self.resumable_progress - 1
+      stream = self.resumable.stream()
+      if chunksize == -1:
+        def body():
+          stream.seek(self.resumable_progress)
+          return stream
+        chunk_end = self.resumable.size() - 1
       else:
         # Doing chunking with a stream, so wrap a slice of the stream.
-        data = _StreamSlice(data, self.resumable_progress,
-                            self.resumable.chunksize())
+        def body():
+          return _StreamSlice(stream, self.resumable_progress, chunksize)
         chunk_end = min(
-            self.resumable_progress + self.resumable.chunksize() - 1,
+            self.resumable_progress + chunksize - 1,
             self.resumable.size() - 1)
     else:
-      data = self.resumable.getbytes(
-          self.resumable_progress, self.resumable.chunksize())
+      data = self.resumable.getbytes(self.resumable_progress, chunksize)
 
       # A short read implies that we are at EOF, so finish the upload.
-      if len(data) < self.resumable.chunksize():
+      if len(data) < chunksize:
         size = str(self.resumable_progress + len(data))
+      elif size == '*' and self.resumable.size() is not None:
+        # A stream may only find its size while reading this chunk.
+        size = str(self.resumable.size())
 
       chunk_end = self.resumable_progress + len(data) - 1
+      body = lambda: data
 
+    if chunk_end < self.resumable_progress:
+      # Nothing is left to send, but the server must still be told the size.
+      content_range = 'bytes */%s' % size
+    else:
+      content_range = 'bytes %d-%d/%s' % (
+          self.resumable_progress, chunk_end, size)
     headers = {
-        'Content-Range': 'bytes %d-%d/%s' % (
-            self.resumable_progress, chunk_end, size),
+        'Content-Range': content_range,
         # Must set the content-length header here because httplib can't
         # calculate the size when working with _StreamSlice.
         'Content-Length': str(chunk_end - self.resumable_progress + 1)
         }
 
-    for retry_num in xrange(num_retries + 1):
-      if retry_num > 0:
-        self._sleep(self._rand() * 2**retry_num)
-        logging.warning(
-            'Retry #%d for media upload: %s %s, following status: %d'
-            % (retry_num, self.method, self.uri, resp.status))
+    # The body is rebuilt for every attempt since a stream is consumed by
+    # sending it.
+    attempts = []
+    def send():
+      attempts.append(None)
+      return _paced_request(http, self.methodId, self.resumable_uri,
+                            method='PUT', body=body(), headers=headers,
+                            deadline=deadline)
+
+    start = time.time()
+    try:
+      resp, content = retry_policy.run(
+          send, num_retries, self._sleep, self._rand,
+          description='media upload: %s %s' % (self.method, self.uri),
+          deadline=deadline)
+    except:
+      self._in_error_state = True
+      if adaptive:
+        self.resumable_chunksize = _adapt_chunksize(chunksize, 0, 0, True)
+      raise
+
+    if adaptive:
+      begin = self.resumable_progress
+      self.resumable_chunksize = _adapt_chunksize(
+          chunksize, chunk_end - begin + 1, time.time() - start,
+          len(attempts) > 1 or resp.status not in [200, 201, 308])
+    return self._process_response(resp, content)
 
-      try:
-        resp, content = http.request(self.resumable_uri, method='PUT',
-                                     body=data,
-                                     headers=headers)
-      except:
-        self._in_error_state = True
-        raise
-      if resp.status < 500:
-        break
+  @util.positional(1)
+  def next_chunk_async(self, http=None, num_retries=0, adaptive=False,
+                       pool=None, deadline=None):
+    """Execute the next step of a resumable upload on a worker thread.
 
-    return self._process_response(resp, content)
+    Args:
+      http: httplib2.Http, an http object to be used in place of the
+            one the HttpRequest request object was constructed with.
+      num_retries: Integer, number of times to retry errors allowed by
+            retry_policy.
+      adaptive: bool, whether chunks are sized adaptively, as for
+            next_chunk().
+      pool: apiclient.futures.WorkerPool, the pool to run the request on. If
+            None then the process wide default pool is used.
+      deadline: apiclient.deadline.Deadline or a number of seconds, as for
+            next_chunk().
+
+    Returns:
+      An apiclient.futures.Future whose result() is the (status, body) pair
+      returned by next_chunk().
+    """
+    if pool is None:
+      pool = futures.default_pool()
+
+    def next_chunk(http, num_retries, deadline):
+      return self.next_chunk(http=http, num_retries=num_retries,
+                             adaptive=adaptive, deadline=deadline)
+
+    return pool.submit(self._run_in_pool, next_chunk, pool, http, num_retries,
+                       to_deadline(deadline))
 
   def _process_response(self, resp, content):
     """Process the response from a single chunk upload.
@@ -892,15 +1607,20 @@ class HttpRequest(object):
       return None, self.postproc(resp, content)
     elif resp.status == 308:
       self._in_error_state = False
-      # A "308 Resume Incomplete" indicates we are not done.
-      self.resumable_progress = int(resp['range'].split('-')[1]) + 1
+      # A "308 Resume Incomplete" indicates we are not done. Without a range
+      # the server hasn't received any bytes yet.
+      if 'range' in resp:
+        self.resumable_progress = int(resp['range'].split('-')[1]) + 1
+      else:
+        self.resumable_progress = 0
       if 'location' in resp:
         self.resumable_uri = resp['location']
     else:
       self._in_error_state = True
       raise HttpError(resp, content, uri=self.uri)
 
-    return (MediaUploadProgress(self.resumable_progress, self.resumable.size()),
+    return (MediaUploadProgress(self.resumable_progress, self.resumable.size(),
+                                self.resumable_chunksize),
             None)
 
   def to_json(self):
@@ -917,11 +1637,17 @@ class HttpRequest(object):
 
   @staticmethod
   def from_json(s, http, postproc):
-    """Returns an HttpRequest populated with info from a JSON object."""
+    """Returns an HttpRequest populated with info from a JSON object.
+
+    A resumable upload that had already started continues from where it was
+    serialized. Since the server may have received more bytes since then, the
+    first call to next_chunk() asks it for the upload's status before sending
+    anything.
+    """
     d = simplejson.loads(s)
     if d['resumable'] is not None:
       d['resumable'] = MediaUpload.new_from_json(d['resumable'])
-    return HttpRequest(
+    request = HttpRequest(
         http,
         postproc,
         uri=d['uri'],
@@ -930,6 +1656,12 @@ class HttpRequest(object):
         headers=d['headers'],
         methodId=d['methodId'],
         resumable=d['resumable'])
+    request.resumable_uri = d.get('resumable_uri')
+    request.resumable_progress = d.get('resumable_progress', 0)
+    request.resumable_chunksize = d.get('resumable_chunksize')
+    if request.resumable_uri is not None:
+      request._in_error_state = True
+    return request
 
 
 class BatchHttpRequest(object):
@@ -966,7 +1698,8 @@ class BatchHttpRequest(object):
   """
 
   @util.positional(1)
-  def __init__(self, callback=None, batch_uri=None):
+  def __init__(self, callback=None, batch_uri=None,
+               max_batch_size=MAX_BATCH_SIZE):
     """Constructor for a BatchHttpRequest.
 
     Args:
@@ -976,10 +1709,16 @@ class BatchHttpRequest(object):
         third is an apiclient.errors.HttpError exception object if an HTTP error
         occurred while processing the request, or None if no error occurred.
       batch_uri: string, URI to send batch requests to.
+      max_batch_size: int, the most requests sent in a single HTTP request.
+        Larger batches are split. May not be larger than MAX_BATCH_SIZE.
     """
+    if not 0 < max_batch_size <= MAX_BATCH_SIZE:
+      raise ValueError('max_batch_size must be between 1 and %d.' %
+                       MAX_BATCH_SIZE)
     if batch_uri is None:
       batch_uri = 'https://www.googleapis.com/batch'
     self._batch_uri = batch_uri
+    self._max_batch_size = max_batch_size
 
     # Global callback to be called for each individual response in the batch.
     self._callback = callback
@@ -1005,12 +1744,17 @@ class BatchHttpRequest(object):
     # A map of id(Credentials) that have been refreshed.
     self._refreshed_credentials = {}
 
-  def _refresh_and_apply_credentials(self, request, http):
+    # Stubs for testing.
+    self._sleep = time.sleep
+    self._rand = random.random
+
+  def _refresh_and_apply_credentials(self, request, http, deadline=None):
     """Refresh the credentials and apply to the request.
 
     Args:
       request: HttpRequest, the request.
       http: httplib2.Http, the global http object for the batch.
+      deadline: apiclient.deadline.Deadline, bounds the refresh.
     """
     # For the credentials to refresh, but only once per refresh_token
     # If there is no http per the request then refresh the http passed in
@@ -1023,7 +1767,11 @@ class BatchHttpRequest(object):
       creds = http.request.credentials
     if creds is not None:
       if id(creds) not in self._refreshed_credentials:
-        creds.refresh(http)
+        if deadline is not None:
+          deadline.call(http, lambda: creds.refresh(http),
+                        description='credential refresh')
+        else:
+          creds.refresh(http)
         self._refreshed_credentials[id(creds)] = 1
 
     # Only apply the credentials if we are using the http object passed in,
@@ -1080,45 +1828,14 @@ class BatchHttpRequest(object):
     Returns:
       The request as a string in application/http format.
     """
-    # Construct status line
-    parsed = urlparse.urlparse(request.uri)
-    request_line = urlparse.urlunparse(
-        (None, None, parsed.path, parsed.params, parsed.query, None)
-        )
-    status_line = request.method + ' ' + request_line + ' HTTP/1.1\n'
-    major, minor = request.headers.get('content-type', 'application/json').split('/')
-    msg = MIMENonMultipart(major, minor)
     headers = request.headers.copy()
 
     if request.http is not None and hasattr(request.http.request,
         'credentials'):
       request.http.request.credentials.apply(headers)
 
-    # MIMENonMultipart adds its own Content-Type header.
-    if 'content-type' in headers:
-      del headers['content-type']
-
-    for key, value in headers.iteritems():
-      msg[key] = value
-    msg['Host'] = parsed.netloc
-    msg.set_unixfrom(None)
-
-    if request.body is not None:
-      msg.set_payload(request.body)
-      msg['content-length'] = str(len(request.body))
-
-    # Serialize the mime message.
-    fp = StringIO.StringIO()
-    # maxheaderlen=0 means don't line wrap headers.
-    g = Generator(fp, maxheaderlen=0)
-    g.flatten(msg, unixfrom=False)
-    body = fp.getvalue()
-
-    # Strip off the \n\n that the MIME lib tacks onto the end of the payload.
-    if request.body is None:
-      body = body[:-2]
-
-    return status_line.encode('utf-8') + body
+    return batchcodec.serialize_request(request.method, request.uri, headers,
+                                        request.body)
 
   def _deserialize_response(self, payload):
     """Convert string into httplib2 response and content.
@@ -1129,24 +1846,7 @@ class BatchHttpRequest(object):
     Returns:
       A pair (resp, content), such as would be returned from httplib2.request.
     """
-    # Strip off the status line
-    status_line, payload = payload.split('\n', 1)
-    protocol, status, reason = status_line.split(' ', 2)
-
-    # Parse the rest of the response
-    parser = FeedParser()
-    parser.feed(payload)
-    msg = parser.close()
-    msg['status'] = status
-
-    # Create httplib2.Response from the parsed headers.
-    resp = httplib2.Response(msg)
-    resp.reason = reason
-    resp.version = int(protocol.split('/', 1)[1].replace('.', ''))
-
-    content = payload.split('\r\n\r\n', 1)[1]
-
-    return resp, content
+    return batchcodec.parse_response(payload)
 
   def _new_id(self):
     """Create a new id.
@@ -1200,7 +1900,8 @@ class BatchHttpRequest(object):
     self._callbacks[request_id] = callback
     self._order.append(request_id)
 
-  def _execute(self, http, order, requests):
+  def _execute(self, http, order, requests, num_retries=0, on_response=None,
+               deadline=None):
     """Serialize batch request, send to server, process response.
 
     Args:
@@ -1208,67 +1909,150 @@ class BatchHttpRequest(object):
       order: list, list of request ids in the order they were added to the
         batch.
       request: list, list of request objects to send.
+      num_retries: Integer, number of times to retry the batch request itself.
+      on_response: callable, called with the request id of each response as
+        soon as it has been parsed and stored.
+      deadline: apiclient.deadline.Deadline, bounds the batch request and its
+        retries.
 
     Raises:
       httplib2.HttpLib2Error if a transport error has occured.
       apiclient.errors.BatchError if the response is the wrong format.
+      apiclient.errors.DeadlineExceededError if the deadline passed.
     """
-    message = MIMEMultipart('mixed')
-    # Message should not write out it's own headers.
-    setattr(message, '_write_headers', lambda self: None)
-
-    # Add all the individual requests.
-    for request_id in order:
-      request = requests[request_id]
-
-      msg = MIMENonMultipart('application', 'http')
-      msg['Content-Transfer-Encoding'] = 'binary'
-      msg['Content-ID'] = self._id_to_header(request_id)
-
-      body = self._serialize_request(request)
-      msg.set_payload(body)
-      message.attach(msg)
-
-    body = message.as_string()
+    body, boundary = batchcodec.write_mixed(
+        [(self._id_to_header(request_id),
+          self._serialize_request(requests[request_id]))
+         for request_id in order])
 
     headers = {}
     headers['content-type'] = ('multipart/mixed; '
-                               'boundary="%s"') % message.get_boundary()
-
-    resp, content = http.request(self._batch_uri, method='POST', body=body,
-                                 headers=headers)
+                               'boundary="%s"') % boundary
+    description = 'batch request: POST %s' % self._batch_uri
+
+    # Each request in the batch counts against its own quota.
+    limiter = rate_limiter
+    limiter_keys = {}
+    if limiter is not None:
+      for request_id in order:
+        request = requests[request_id]
+        limiter_keys[request_id] = rate_limit_key(
+            request.methodId,
+            auth_identity(request.http or http, request.headers))
+        _acquire(limiter, limiter_keys[request_id], deadline, description)
+
+    send = lambda: http.request(self._batch_uri, method='POST', body=body,
+                                headers=headers)
+    breaker = circuit_breaker
+    if breaker is not None:
+      send_direct = send
+      send = lambda: breaker.call(self._batch_uri, send_direct)
+    if deadline is not None:
+      send_once = send
+      send = lambda: deadline.call(http, send_once, description=description)
+    resp, content = retry_policy.run(
+        send, num_retries, self._sleep, self._rand,
+        description=description, deadline=deadline, record=False)
 
     if resp.status >= 300:
       raise HttpError(resp, content, uri=self._batch_uri)
 
     # Now break out the individual responses and store each one.
-    boundary, _ = content.split(None, 1)
-
-    # Prepend with a content-type header so FeedParser can handle it.
-    header = 'content-type: %s\r\n\r\n' % resp['content-type']
-    for_parser = header + content
+    try:
+      for content_id, payload in batchcodec.iter_mixed(
+          content, resp.get('content-type', '')):
+        if content_id is None:
+          raise BatchError('Missing Content-ID in batch response part.',
+                           resp=resp, content=content)
+        request_id = self._header_to_id(content_id)
+        response, part_content = self._deserialize_response(payload)
+        self._responses[request_id] = (response, part_content)
+        if request_id in limiter_keys:
+          limiter.feedback(limiter_keys[request_id], response, part_content)
+        if on_response is not None:
+          on_response(request_id)
+    except BatchError, e:
+      e.resp = resp
+      raise
+
+  def _execute_split(self, http, order, requests, num_retries, on_response,
+                     pool, deadline):
+    """Send requests in as many batches as max_batch_size requires.
 
-    parser = FeedParser()
-    parser.feed(for_parser)
-    mime_response = parser.close()
-
-    if not mime_response.is_multipart():
-      raise BatchError("Response not in multipart/mixed format.", resp=resp,
-                       content=content)
+    Args:
+      http: httplib2.Http, an http object to be used to make the requests with.
+      order: list, list of request ids in the order they were added to the
+        batch.
+      request: list, list of request objects to send.
+      num_retries: Integer, number of times to retry each batch request.
+      on_response: callable, called with the request id of each response.
+      pool: apiclient.futures.WorkerPool, sends the batches concurrently, or
+        None to send them one after another.
+      deadline: apiclient.deadline.Deadline, bounds every batch request.
+    """
+    size = self._max_batch_size
+    chunks = [order[i:i + size] for i in xrange(0, len(order), size)]
+    if pool is None or len(chunks) < 2:
+      for chunk in chunks:
+        self._execute(http, chunk, requests, num_retries, on_response,
+                      deadline)
+      return
+
+    lock = threading.Lock()
+    shared_http_lock = threading.Lock()
+
+    def locked_on_response(request_id):
+      with lock:
+        on_response(request_id)
+
+    def send(chunk):
+      chunk_http = pool.http()
+      if chunk_http is None:
+        # httplib2.Http isn't thread-safe, so only one batch at a time may use
+        # the shared one.
+        with shared_http_lock:
+          self._execute(http, chunk, requests, num_retries, locked_on_response,
+                        deadline)
+      else:
+        self._execute(chunk_http, chunk, requests, num_retries,
+                      locked_on_response, deadline)
 
-    for part in mime_response.get_payload():
-      request_id = self._header_to_id(part['Content-ID'])
-      response, content = self._deserialize_response(part.get_payload())
-      self._responses[request_id] = (response, content)
+    pending = [pool.submit(send, chunk) for chunk in chunks]
+    exc_info = None
+    for future in pending:
+      try:
+        future.result()
+      except Exception:
+        if exc_info is None:
+          exc_info = sys.exc_info()
+    if exc_info is not None:
+      raise exc_info[0], exc_info[1], exc_info[2]
 
   @util.positional(1)
-  def execute(self, http=None):
-    """Execute all the requests as a single batched HTTP request.
+  def execute(self, http=None, num_retries=0, pool=None, deadline=None):
+    """Execute all the requests as batched HTTP requests.
+
+    The requests are sent in batches of at most max_batch_size requests.
 
     Args:
       http: httplib2.Http, an http object to be used in place of the one the
         HttpRequest request object was constructed with. If one isn't supplied
         then use a http object from the requests in this batch.
+      num_retries: Integer, number of times to retry the batch request, and to
+        re-send the requests in it that failed with an error allowed by
+        retry_policy in a new batch.
+      pool: apiclient.futures.WorkerPool, if given and more than one batch is
+        needed, the batches are sent concurrently on it, each with the pool's
+        per-thread http object. That object must then be authorized. Without
+        an http_factory the batches share http and are sent one at a time.
+      deadline: apiclient.deadline.Deadline or a number of seconds, the time
+        by which every batch request, credential refresh and retry must have
+        completed. Requests are not retried when the wait would outlast it.
+
+    The callbacks of a request are called as soon as its response has been
+    parsed, unless the request may still be sent again to refresh its
+    credentials or to retry it. Those callbacks are called once the batch is
+    done, in the order the requests were added.
 
     Returns:
       None
@@ -1276,7 +2060,11 @@ class BatchHttpRequest(object):
     Raises:
       httplib2.HttpLib2Error if a transport error has occured.
       apiclient.errors.BatchError if the response is the wrong format.
+      apiclient.errors.DeadlineExceededError if the deadline passed.
+      apiclient.errors.CircuitOpenError if circuit_breaker refused the
+        batch request.
     """
+    deadline = to_deadline(deadline)
 
     # If http is not supplied use the first valid one given in the requests.
     if http is None:
@@ -1289,7 +2077,32 @@ class BatchHttpRequest(object):
     if http is None:
       raise ValueError("Missing a valid http object.")
 
-    self._execute(http, self._order, self._requests)
+    delivered = set()
+
+    def deliver_unless(redo):
+
+      def on_response(request_id):
+        resp, content = self._responses[request_id]
+        if not redo(resp, content):
+          delivered.add(request_id)
+          self._deliver(request_id)
+
+      return on_response
+
+    def retryable(resp, content):
+      return retry_policy.is_retryable(resp, content)
+
+    if num_retries:
+      may_retry = retryable
+    else:
+      may_retry = lambda resp, content: False
+
+    retry_policy.record_request(len(self._order))
+    self._execute_split(
+        http, self._order, self._requests, num_retries,
+        deliver_unless(lambda resp, content: resp['status'] == '401' or
+                       may_retry(resp, content)),
+        pool, deadline)
 
     # Loop over all the requests and check for 401s. For each 401 request the
     # credentials should be refreshed and then sent again in a separate batch.
@@ -1301,35 +2114,88 @@ class BatchHttpRequest(object):
       if resp['status'] == '401':
         redo_order.append(request_id)
         request = self._requests[request_id]
-        self._refresh_and_apply_credentials(request, http)
+        self._refresh_and_apply_credentials(request, http, deadline)
         redo_requests[request_id] = request
 
     if redo_requests:
-      self._execute(http, redo_order, redo_requests)
-
-    # Now process all callbacks that are erroring, and raise an exception for
-    # ones that return a non-2xx response? Or add extra parameter to callback
-    # that contains an HttpError?
+      self._execute_split(http, redo_order, redo_requests, num_retries,
+                          deliver_unless(may_retry), pool, deadline)
+
+    # Send the requests that failed with a retryable error again, in batches
+    # of their own.
+    delay = None
+    for retry_num in xrange(1, num_retries + 1):
+      failures = [(request_id,) + self._responses[request_id]
+                  for request_id in self._order]
+      redo_order, delay = retry_policy.plan_retry(failures, delay, self._rand,
+                                                  deadline)
+      if not redo_order:
+        break
+      self._sleep(delay)
+      retry_policy.log_retry(
+          retry_num, '%d requests of batch request: POST %s' % (
+              len(redo_order), self._batch_uri))
+      if retry_num < num_retries:
+        on_response = deliver_unless(retryable)
+      else:
+        on_response = deliver_unless(lambda resp, content: False)
+      self._execute_split(http, redo_order, self._requests, num_retries,
+                          on_response, pool, deadline)
 
     for request_id in self._order:
-      resp, content = self._responses[request_id]
+      if request_id not in delivered:
+        self._deliver(request_id)
+
+  def _deliver(self, request_id):
+    """Call the callbacks of a request with its final response."""
+    resp, content = self._responses[request_id]
+
+    request = self._requests[request_id]
+    callback = self._callbacks[request_id]
+
+    response = None
+    exception = None
+    try:
+      if resp.status >= 300:
+        raise HttpError(resp, content, uri=request.uri)
+      response = request.postproc(resp, content)
+    except HttpError, e:
+      exception = e
+
+    if callback is not None:
+      callback(request_id, response, exception)
+    if self._callback is not None:
+      self._callback(request_id, response, exception)
 
-      request = self._requests[request_id]
-      callback = self._callbacks[request_id]
+  @util.positional(1)
+  def execute_async(self, http=None, num_retries=0, pool=None, deadline=None):
+    """Execute all the requests as a single batch on a worker thread.
 
-      response = None
-      exception = None
-      try:
-        if resp.status >= 300:
-          raise HttpError(resp, content, uri=request.uri)
-        response = request.postproc(resp, content)
-      except HttpError, e:
-        exception = e
+    The callbacks are called on the worker thread.
 
-      if callback is not None:
-        callback(request_id, response, exception)
-      if self._callback is not None:
-        self._callback(request_id, response, exception)
+    Args:
+      http: httplib2.Http, an http object to be used in place of the one the
+        HttpRequest request object was constructed with. If not given, the
+        pool's per-thread http object is used when it has an http_factory.
+      num_retries: Integer, as for execute().
+      pool: apiclient.futures.WorkerPool, the pool to run the batch on. If None
+        then the process wide default pool is used.
+      deadline: apiclient.deadline.Deadline or a number of seconds, as for
+        execute(). Time spent waiting for a worker thread counts.
+
+    Returns:
+      An apiclient.futures.Future whose result() is None once every callback
+      has been called, or raises the error execute() would raise.
+    """
+    if pool is None:
+      pool = futures.default_pool()
+    deadline = to_deadline(deadline)
+
+    def run():
+      return self.execute(http=http if http is not None else pool.http(),
+                          num_retries=num_retries, deadline=deadline)
+
+    return pool.submit(run)
 
 
 class HttpRequestMock(object):
@@ -1363,6 +2229,16 @@ class HttpRequestMock(object):
     """
     return self.postproc(self.resp, self.content)
 
+  def execute_async(self, http=None, num_retries=0, pool=None, deadline=None):
+    """Execute the request.
+
+    Same behavior as HttpRequest.execute_async(), but the returned Future is
+    already done.
+    """
+    future = futures.Future()
+    futures.run_in_future(future, self.execute)
+    return future
+
 
 class RequestMockBuilder(object):
   """A simple mock of HttpRequest
@@ -24,12 +24,16 @@ object representation.
 
 __author__ = 'jcgregorio@google.com (Joe Gregorio)'
 
+import copy
 import logging
+import re
+import sys
+import threading
 import urllib
 
 from apiclient import __version__
 from errors import HttpError
-from oauth2client.anyjson import simplejson
+from oauth2client import anyjson
 
 
 dump_request_response = False
@@ -232,6 +236,162 @@ class BaseModel(Model):
     _abstract()
 
 
+# The longest strings, in characters, that an Interner shares by default.
+DEFAULT_INTERN_LENGTH = 64
+
+# The most distinct strings an Interner holds by default.
+DEFAULT_INTERN_ENTRIES = 100000
+
+
+class Interner(object):
+  """Shares one copy of each repeated key and short string between responses.
+
+  List responses repeat the same keys, such as 'start' and 'dateTime', and
+  many of the same values, such as creator emails and time zones, thousands
+  of times a page, and each is parsed into a string of its own. Given to a
+  JsonModel, an Interner puts the copy it already holds in place of every key
+  and short string value as the response is deserialized, so the duplicates
+  are freed at once. Sharing one Interner between models shares the copies
+  across methods too:
+
+    interner = Interner()
+    service = build('calendar', 'v3', http=http,
+                    model=JsonModel(interner=interner))
+    ...
+    print interner.stats()
+
+  This pays off for responses that are kept, such as those in
+  apiclient.http.response_cache or the pages of a long listing; a response
+  that is read once and dropped is only made slower to deserialize.
+  """
+
+  def __init__(self, max_length=DEFAULT_INTERN_LENGTH,
+               max_entries=DEFAULT_INTERN_ENTRIES):
+    """Constructor.
+
+    Args:
+      max_length: int, strings longer than this many characters are left
+        alone; long strings are rarely repeated.
+      max_entries: int, the most distinct strings held. Once it is reached,
+        strings already held are still shared but new ones are not added.
+    """
+    self._max_length = max_length
+    self._max_entries = max_entries
+    self._table = {}
+    self._lock = threading.Lock()
+    self._shared = 0
+    self._bytes_saved = 0
+
+  def __getstate__(self):
+    return {'max_length': self._max_length, 'max_entries': self._max_entries}
+
+  def __setstate__(self, state):
+    self.__init__(**state)
+
+  def loads(self, codec, content):
+    """Deserialize a JSON body, sharing its keys and short strings.
+
+    Codecs with an object_pairs_hook build each object with the shared
+    strings in place; the objects parsed by others are copied with them.
+
+    Args:
+      codec: oauth2client.anyjson.JsonCodec, parses the body.
+      content: string, the JSON body.
+
+    Returns:
+      The body deserialized, as by codec.loads().
+    """
+    table = self._table
+    get = table.get
+    max_length = self._max_length
+    max_entries = self._max_entries
+    # The sizes of the strings put in place of their held copies, added up
+    # once the body is parsed rather than under the lock for every string.
+    # Keeping the strings themselves until then would leave their memory
+    # scattered between the objects kept.
+    shared = []
+    getsizeof = sys.getsizeof
+
+    def share(string):
+      found = get(string)
+      if found is None:
+        if len(table) < max_entries:
+          table[string] = string
+      # 'a' and u'a' are equal, but aren't interchangeable.
+      elif found is not string and found.__class__ is string.__class__:
+        shared.append(getsizeof(string))
+        return found
+      return string
+
+    # The hook runs for every object in the body, so share() is inlined for
+    # the keys and values.
+    def object_pairs_hook(pairs):
+      result = {}
+      for key, value in pairs:
+        cls = value.__class__
+        if cls is unicode or cls is str:
+          if len(value) <= max_length:
+            found = get(value)
+            if found is None:
+              if len(table) < max_entries:
+                table[value] = value
+            elif found is not value and found.__class__ is cls:
+              shared.append(getsizeof(value))
+              value = found
+        elif cls is list:
+          for i, item in enumerate(value):
+            if isinstance(item, basestring) and len(item) <= max_length:
+              value[i] = share(item)
+        if len(key) <= max_length:
+          found = get(key)
+          if found is None:
+            if len(table) < max_entries:
+              table[key] = key
+          elif found is not key and found.__class__ is key.__class__:
+            shared.append(getsizeof(key))
+            key = found
+        result[key] = value
+      return result
+
+    def copy(value):
+      if isinstance(value, dict):
+        return object_pairs_hook(
+            [(key, copy(item)) for key, item in value.iteritems()])
+      if isinstance(value, list):
+        return [copy(item) for item in value]
+      return value
+
+    if codec.hooked_loads is not None:
+      result = codec.hooked_loads(object_pairs_hook)(content)
+    else:
+      result = copy(codec.loads(content))
+    saved = sum(shared)
+    with self._lock:
+      self._shared += len(shared)
+      self._bytes_saved += saved
+    return result
+
+  def clear(self):
+    """Drop the strings held, so they are freed once no response uses them."""
+    with self._lock:
+      self._table.clear()
+
+  def stats(self):
+    """Get statistics about the strings shared.
+
+    Returns:
+      A dict with the number of distinct strings held as 'entries', the number
+      of strings replaced by a held copy as 'shared', and an estimate of the
+      memory those copies saved as 'bytes_saved'.
+    """
+    with self._lock:
+      return {
+          'entries': len(self._table),
+          'shared': self._shared,
+          'bytes_saved': self._bytes_saved,
+          }
+
+
 class JsonModel(BaseModel):
   """Model class for JSON.
 
@@ -242,23 +402,61 @@ class JsonModel(BaseModel):
   content_type = 'application/json'
   alt_param = 'json'
 
-  def __init__(self, data_wrapper=False):
+  # Parses bodies in place of the codec, for hooked_response().
+  _hooked_loads = None
+
+  def __init__(self, data_wrapper=False, codec=None, interner=None):
     """Construct a JsonModel.
 
     Args:
       data_wrapper: boolean, wrap requests and responses in a data wrapper
+      codec: string or oauth2client.anyjson.JsonCodec, the JSON codec to use,
+        such as 'json'. Defaults to the fastest one installed.
+      interner: Interner, shares the repeated keys and short strings of
+        deserialized responses. None leaves them as parsed.
     """
     self._data_wrapper = data_wrapper
+    self._interner = interner
+    # Looked up on every use, so that models with a named codec can be
+    # pickled, but checked now.
+    anyjson.get_codec(codec)
+    self._codec = codec
+
+  def _get_codec(self):
+    return anyjson.get_codec(self._codec)
 
   def serialize(self, body_value):
     if (isinstance(body_value, dict) and 'data' not in body_value and
         self._data_wrapper):
       body_value = {'data': body_value}
-    return simplejson.dumps(body_value)
+    return self._get_codec().dumps(body_value)
+
+  def hooked_response(self, object_pairs_hook):
+    """Get a response() that builds every JSON object with a hook.
+
+    Args:
+      object_pairs_hook: callable, takes the list of (key, value) pairs of an
+        object and returns the object to put in its place.
+
+    Returns:
+      A callable like response(), or None if the codec has no
+      object_pairs_hook. Responses aren't passed to the interner.
+    """
+    hooked_loads = self._get_codec().hooked_loads
+    if hooked_loads is None:
+      return None
+    model = copy.copy(self)
+    model._hooked_loads = hooked_loads(object_pairs_hook)
+    return model.response
 
   def deserialize(self, content):
-    content = content.decode('utf-8')
-    body = simplejson.loads(content)
+    # Every codec decodes a UTF-8 body to unicode before parsing it.
+    if self._hooked_loads is not None:
+      body = self._hooked_loads(content)
+    elif self._interner is not None:
+      body = self._interner.loads(self._get_codec(), content)
+    else:
+      body = self._get_codec().loads(content)
     if self._data_wrapper and isinstance(body, dict) and 'data' in body:
       body = body['data']
     return body
@@ -268,6 +466,211 @@ class JsonModel(BaseModel):
     return {}
 
 
+# JSON whitespace, skipped between tokens by StreamingListResponse.
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class StreamingListResponse(object):
+  """A list response whose items are parsed one at a time.
+
+  It is read with the same calls as the dict JsonModel returns, but
+  response['items'] is a generator that parses each item as it is reached,
+  so only one item is held at a time besides the body itself. Other fields
+  are parsed the first time they are looked up. A field after the items,
+  looked up before they have been iterated over, makes the items be parsed
+  and dropped to get past them, as does iterating over the response, which
+  yields the names of its fields.
+
+  Iterating over the items again parses them again. A response is read
+  lazily and isn't thread-safe, so apiclient.http.response_cache doesn't
+  keep it for other callers.
+  """
+
+  def __init__(self, content, begin, items_key, raw_decode):
+    """Constructor.
+
+    Args:
+      content: string, the body of the response.
+      begin: int, the offset of the '{' that opens the object to read.
+      items_key: string, the name of the field holding the items.
+      raw_decode: callable, the raw_decode() of the codec that parses each
+        item and field.
+    """
+    self._content = content
+    self._items_key = items_key
+    self._raw_decode = raw_decode
+    self._fields = {}
+    # Where reading the next field starts, or None at the end of the object.
+    self._pos = begin + 1
+    # The offset of the '[' opening the items, once they have been found, and
+    # whether the next field to read is after them.
+    self._items_begin = None
+    self._at_items = False
+
+  def _skip(self, idx):
+    return _WHITESPACE.match(self._content, idx).end()
+
+  def _read_field(self):
+    """Read the next field, stopping short of the items."""
+    s = self._content
+    idx = self._skip(self._pos)
+    if s[idx:idx + 1] == ',':
+      idx = self._skip(idx + 1)
+    if s[idx:idx + 1] == '}':
+      self._pos = None
+      return
+    key, idx = self._raw_decode(s, idx)
+    idx = self._skip(idx)
+    if s[idx:idx + 1] != ':':
+      raise ValueError('Expecting : delimiter at %d' % idx)
+    idx = self._skip(idx + 1)
+    if key == self._items_key and s[idx:idx + 1] == '[':
+      self._items_begin = idx
+      self._at_items = True
+    else:
+      self._fields[key], idx = self._raw_decode(s, idx)
+    self._pos = idx
+
+  def _find(self, key):
+    """Read fields until key has been found or there are none left."""
+    while self._pos is not None:
+      if key == self._items_key and self._items_begin is not None:
+        return
+      if key in self._fields:
+        return
+      if self._at_items:
+        for _ in self._iter_items():
+          pass
+      else:
+        self._read_field()
+
+  def _iter_items(self):
+    s = self._content
+    idx = self._skip(self._items_begin + 1)
+    if s[idx:idx + 1] != ']':
+      while True:
+        item, idx = self._raw_decode(s, idx)
+        yield item
+        idx = self._skip(idx)
+        if s[idx:idx + 1] == ']':
+          break
+        if s[idx:idx + 1] != ',':
+          raise ValueError('Expecting , delimiter at %d' % idx)
+        idx = self._skip(idx + 1)
+    if self._at_items:
+      self._at_items = False
+      self._pos = idx + 1
+
+  def __getitem__(self, key):
+    self._find(key)
+    if key == self._items_key and self._items_begin is not None:
+      return self._iter_items()
+    return self._fields[key]
+
+  def get(self, key, default=None):
+    try:
+      return self[key]
+    except KeyError:
+      return default
+
+  def __contains__(self, key):
+    self._find(key)
+    return key in self._fields or (
+        key == self._items_key and self._items_begin is not None)
+
+  has_key = __contains__
+
+  def keys(self):
+    """The names of the fields of the response."""
+    self._find(None)
+    keys = self._fields.keys()
+    if self._items_begin is not None:
+      keys.append(self._items_key)
+    return keys
+
+  def __iter__(self):
+    return iter(self.keys())
+
+  def to_dict(self):
+    """Parse the whole response into the dict JsonModel would return."""
+    self._find(None)
+    result = dict(self._fields)
+    if self._items_begin is not None:
+      result[self._items_key] = list(self._iter_items())
+    return result
+
+
+class StreamingListModel(JsonModel):
+  """Model class for JSON list responses with many items.
+
+  Responses are deserialized into a StreamingListResponse, which parses the
+  items one at a time as they are iterated over, so peak memory is bounded by
+  the body and one item rather than by the whole page as objects. Select it
+  for the list methods that return large pages with build():
+
+    service = build('calendar', 'v3', http=http, methodModels={
+        'calendar.events.list': StreamingListModel()})
+    for event in service.events().list(
+        calendarId='primary', maxResults=2500).execute()['items']:
+      ...
+
+  Requests are serialized as by JsonModel. Responses are parsed with the
+  raw_decode() of the codec. With a codec that has none, they are parsed
+  whole, as by JsonModel.
+  """
+
+  def __init__(self, data_wrapper=False, codec=None, items_key='items'):
+    """Construct a StreamingListModel.
+
+    Args:
+      data_wrapper: boolean, wrap requests and responses in a data wrapper
+      codec: string or oauth2client.anyjson.JsonCodec, the JSON codec to
+        serialize requests and parse responses with.
+      items_key: string, the name of the field holding the items.
+    """
+    super(StreamingListModel, self).__init__(data_wrapper=data_wrapper,
+                                             codec=codec)
+    self._items_key = items_key
+
+  def _data_offset(self, content, begin, raw_decode):
+    """Find the offset of the value of the data field, without parsing it.
+
+    Returns:
+      The offset, or None if the object has no data field.
+    """
+    idx = _WHITESPACE.match(content, begin + 1).end()
+    while content[idx:idx + 1] not in ('}', ''):
+      key, idx = raw_decode(content, idx)
+      idx = _WHITESPACE.match(content, idx).end()
+      if content[idx:idx + 1] != ':':
+        raise ValueError('Expecting : delimiter at %d' % idx)
+      idx = _WHITESPACE.match(content, idx + 1).end()
+      if key == 'data':
+        return idx
+      _, idx = raw_decode(content, idx)
+      idx = _WHITESPACE.match(content, idx).end()
+      if content[idx:idx + 1] == ',':
+        idx = _WHITESPACE.match(content, idx + 1).end()
+    return None
+
+  def deserialize(self, content):
+    raw_decode = self._get_codec().raw_decode
+    if raw_decode is None:
+      return super(StreamingListModel, self).deserialize(content)
+    begin = _WHITESPACE.match(content).end()
+    if self._data_wrapper and content[begin:begin + 1] == '{':
+      data = self._data_offset(content, begin, raw_decode)
+      if data is not None:
+        begin = data
+    if content[begin:begin + 1] != '{':
+      return super(StreamingListModel, self).deserialize(content)
+    return StreamingListResponse(content, begin, self._items_key, raw_decode)
+
+  def hooked_response(self, object_pairs_hook):
+    """Responses are StreamingListResponses, so objects aren't hooked."""
+    return None
+
+
 class RawModel(JsonModel):
   """Model class for requests that don't return JSON.
 
@@ -359,25 +762,348 @@ def makepatch(original, modified):
     item['object']['content'] = 'This is updated.'
     service.activities.patch(postid=postid, userid=userid,
       body=makepatch(original, item)).execute()
+
+  TrackedResource builds the same patch without the copy or the diff.
   """
   patch = {}
   for key, original_value in original.iteritems():
     modified_value = modified.get(key, None)
-    if modified_value is None:
+    if original_value is modified_value:
+      # copy.deepcopy() keeps strings and numbers, so most unchanged values
+      # are found without comparing them.
+      pass
+    elif modified_value is None:
       # Use None to signal that the element is deleted
       patch[key] = None
+    elif isinstance(original_value, dict) and isinstance(modified_value,
+                                                         dict):
+      # Recursively descend objects, comparing each value once
+      child = makepatch(original_value, modified_value)
+      if child:
+        patch[key] = child
     elif original_value != modified_value:
-      if type(original_value) == type({}):
-        # Recursively descend objects
-        patch[key] = makepatch(original_value, modified_value)
-      else:
-        # In the case of simple types or arrays we just replace
-        patch[key] = modified_value
-    else:
-      # Don't add anything to patch if there's no change
-      pass
+      # In the case of simple types or arrays we just replace
+      patch[key] = modified_value
   for key in modified:
     if key not in original:
       patch[key] = modified[key]
 
   return patch
+
+
+# The original value of a key that a TrackedResource didn't have.
+_MISSING = object()
+
+# The original value of an array changed in place, which is sent whole. It
+# is unequal to any value.
+_REPLACED = object()
+
+
+def _plain(value):
+  """Copy the tracked objects and arrays in value into plain ones."""
+  if isinstance(value, dict):
+    return dict((key, _plain(item)) for key, item in dict.iteritems(value))
+  if isinstance(value, list):
+    return [_plain(item) for item in list.__iter__(value)]
+  return value
+
+
+def _plain_copy(value):
+  """Copy a dict or list of a subclass into a plain one to track.
+
+  The fields of a dict subclass are read through its items(), so that an
+  apiclient.fieldmask.TrackedDict notes they were all read.
+  """
+  if isinstance(value, (TrackedResource, _TrackedList)):
+    return _plain(value)
+  if isinstance(value, dict):
+    return dict(value.items())
+  return list(value)
+
+
+class TrackedResource(dict):
+  """A resource that records its changes, to build a PATCH body from.
+
+  makepatch() needs a deep copy of the resource to diff it against, which
+  takes time and memory in proportion to the whole resource for every
+  update. A TrackedResource instead notes each key set or deleted as it
+  happens, in itself and in the objects and arrays inside it, so that
+  makepatch() only visits what changed:
+
+    event = TrackedResource(service.events().get(
+        calendarId='primary', eventId=event_id).execute())
+    event['start']['dateTime'] = '2014-06-03T10:00:00Z'
+    del event['location']
+    service.events().patch(calendarId='primary', eventId=event_id,
+                           body=event.makepatch()).execute()
+    event.clear_changes()
+
+  The patch is what apiclient.model.makepatch() would make: deleted keys
+  and keys set to None are sent as None unless they were None already,
+  changed objects are descended into, and an array changed in any way,
+  including an object inside it, is sent whole.
+
+  The objects and arrays inside are wrapped as they are first read, and
+  only changes made through them are seen; keep no references to the plain
+  ones of the resource that was wrapped. Copies and pickles are plain dicts.
+  """
+
+  __slots__ = ('_owner', '_key', '_originals', '_dirty')
+
+  def __init__(self, resource=None):
+    """Constructor.
+
+    Args:
+      resource: dict, the deserialized resource, which is copied shallowly.
+        The objects and arrays inside it, and the resource itself, may be of
+        dict and list subclasses; they are copied into plain ones.
+    """
+    if resource is not None and resource.__class__ is not dict:
+      resource = _plain_copy(resource)
+    dict.__init__(self, resource or {})
+    # The object or array holding this one, and the key it is under.
+    self._owner = None
+    self._key = None
+    # The original value of each key set or deleted, and the keys of the
+    # objects inside that have changes of their own.
+    self._originals = {}
+    self._dirty = set()
+
+  def _wrap(self, key, value):
+    """Replace an object or array inside with a tracked one of its own."""
+    if isinstance(value, (TrackedResource, _TrackedList)):
+      if value._owner is self:
+        return value
+      # Tracked by another resource, such as one it was set from.
+      value = _plain(value)
+    if isinstance(value, dict):
+      value = TrackedResource(value)
+      value._owner = self
+      value._key = key
+      dict.__setitem__(self, key, value)
+    elif isinstance(value, list):
+      value = _TrackedList(value, self, key)
+      dict.__setitem__(self, key, value)
+    return value
+
+  def _notify(self):
+    if self._owner is not None:
+      self._owner._child_changed(self._key)
+
+  def _child_changed(self, key):
+    """Note a change inside the object or array under key."""
+    if key in self._originals:
+      return
+    if isinstance(dict.get(self, key), _TrackedList):
+      self._originals[key] = _REPLACED
+    elif key in self._dirty:
+      return
+    else:
+      self._dirty.add(key)
+    self._notify()
+
+  def _original(self):
+    """The value of this object before its changes, as a plain dict."""
+    original = {}
+    for key, value in dict.iteritems(self):
+      if key in self._originals:
+        continue
+      if key in self._dirty:
+        value = value._original()
+      original[key] = value
+    for key, value in self._originals.iteritems():
+      if value is not _MISSING:
+        original[key] = value
+    return original
+
+  def _record(self, key, value=_MISSING):
+    """Note that key is about to be set to value, or deleted."""
+    if dict.__contains__(self, key):
+      old = dict.__getitem__(self, key)
+      # 'resource[key] += [...]' sets the array it has just changed.
+      if old is value:
+        return
+      if isinstance(old, (TrackedResource, _TrackedList)):
+        old._owner = None
+    else:
+      old = _MISSING
+    if key not in self._originals:
+      if isinstance(old, TrackedResource):
+        old = old._original()
+      elif isinstance(old, _TrackedList):
+        old = list(list.__iter__(old))
+      self._originals[key] = old
+      self._dirty.discard(key)
+    self._notify()
+
+  def __setitem__(self, key, value):
+    self._record(key, value)
+    dict.__setitem__(self, key, value)
+
+  def __delitem__(self, key):
+    if not dict.__contains__(self, key):
+      raise KeyError(key)
+    self._record(key)
+    dict.__delitem__(self, key)
+
+  def pop(self, key, *args):
+    if dict.__contains__(self, key):
+      self._record(key)
+    return dict.pop(self, key, *args)
+
+  def popitem(self):
+    for key in dict.iterkeys(self):
+      return key, self.pop(key)
+    raise KeyError('popitem(): dictionary is empty')
+
+  def clear(self):
+    for key in dict.keys(self):
+      self._record(key)
+    dict.clear(self)
+
+  def update(self, *args, **kwargs):
+    for key, value in dict(*args, **kwargs).iteritems():
+      self[key] = value
+
+  def setdefault(self, key, default=None):
+    if not dict.__contains__(self, key):
+      self[key] = default
+    return self[key]
+
+  def __getitem__(self, key):
+    return self._wrap(key, dict.__getitem__(self, key))
+
+  def get(self, key, default=None):
+    if dict.__contains__(self, key):
+      return self[key]
+    return default
+
+  def values(self):
+    return [self[key] for key in dict.keys(self)]
+
+  def items(self):
+    return [(key, self[key]) for key in dict.keys(self)]
+
+  def itervalues(self):
+    return iter(self.values())
+
+  def iteritems(self):
+    return iter(self.items())
+
+  def copy(self):
+    return _plain(self)
+
+  def __reduce__(self):
+    return (dict, (_plain(self).items(),))
+
+  def changed(self):
+    """Whether anything has changed since the last clear_changes()."""
+    return bool(self._originals or self._dirty)
+
+  def makepatch(self):
+    """Build the PATCH body for the changes made.
+
+    Returns:
+      A dict of the changes since the resource was wrapped or since
+      clear_changes(), as makepatch() would find them.
+    """
+    patch = {}
+    for key, old in self._originals.iteritems():
+      new = dict.get(self, key)
+      if new is None:
+        # Unless it was None already, or was added and deleted again.
+        if old is None:
+          pass
+        elif old is not _MISSING or dict.__contains__(self, key):
+          patch[key] = None
+      elif old is _MISSING or old is _REPLACED:
+        patch[key] = _plain(new)
+      elif isinstance(old, dict) and isinstance(new, dict):
+        child = makepatch(old, _plain(new))
+        if child:
+          patch[key] = child
+      elif old != new:
+        patch[key] = _plain(new)
+    for key in self._dirty:
+      child = dict.__getitem__(self, key).makepatch()
+      if child:
+        patch[key] = child
+    return patch
+
+  def clear_changes(self):
+    """Forget the changes made, once they have been sent."""
+    # Objects set in place of others note changes of their own too.
+    for key in self._dirty.union(self._originals):
+      child = dict.get(self, key)
+      if isinstance(child, TrackedResource):
+        child.clear_changes()
+    self._originals.clear()
+    self._dirty.clear()
+
+
+class _TrackedList(list):
+  """An array inside a TrackedResource, which is sent whole if changed."""
+
+  __slots__ = ('_owner', '_key')
+
+  def __init__(self, items, owner, key):
+    if items.__class__ is not list:
+      items = _plain_copy(items)
+    list.__init__(self, items)
+    self._owner = owner
+    self._key = key
+
+  def _changed(self):
+    if self._owner is not None:
+      self._owner._child_changed(self._key)
+
+  def _child_changed(self, key):
+    self._changed()
+
+  def _wrap(self, index, value):
+    if isinstance(value, (TrackedResource, _TrackedList)):
+      if value._owner is self:
+        return value
+      value = _plain(value)
+    if isinstance(value, dict):
+      value = TrackedResource(value)
+      value._owner = self
+      list.__setitem__(self, index, value)
+    elif isinstance(value, list):
+      value = _TrackedList(value, self, None)
+      list.__setitem__(self, index, value)
+    return value
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      return [self[i] for i in xrange(*index.indices(len(self)))]
+    return self._wrap(index, list.__getitem__(self, index))
+
+  def __getslice__(self, i, j):
+    return self[i:j:]
+
+  def __iter__(self):
+    for i in xrange(len(self)):
+      yield self[i]
+
+  def __reduce__(self):
+    return (list, (_plain(self),))
+
+
+def _mutator(name):
+  method = getattr(list, name)
+
+  def mutate(self, *args, **kwargs):
+    result = method(self, *args, **kwargs)
+    self._changed()
+    return result
+
+  mutate.__name__ = name
+  return mutate
+
+
+for _name in ('__setitem__', '__delitem__', '__setslice__', '__delslice__',
+              '__iadd__', '__imul__', 'append', 'extend', 'insert', 'pop',
+              'remove', 'reverse', 'sort'):
+  setattr(_TrackedList, _name, _mutator(_name))
+del _name
@@ -0,0 +1,218 @@
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Iteration over paged list() responses.
+
+The iterators fetch the next page on a worker thread while the caller is still
+consuming the current one:
+
+  request = service.events().list(calendarId='primary')
+  for event in service.events().list_iter_items(request):
+    print event['summary']
+"""
+
+import copy
+import logging
+import threading
+import urllib
+
+from apiclient import futures
+from apiclient.deadline import to_deadline
+from apiclient.errors import DeadlineExceededError
+from apiclient.errors import TimeoutError
+from oauth2client import util
+
+logger = logging.getLogger(__name__)
+
+
+def _replace_page_token(uri, page_token):
+  """Return uri with its pageToken query parameter set to page_token.
+
+  The other query parameters are kept exactly as they were, so the URI never
+  has to be fully parsed and re-encoded.
+  """
+  fragment = ''
+  if '#' in uri:
+    uri, fragment = uri.split('#', 1)
+    fragment = '#' + fragment
+  if '?' in uri:
+    base, query = uri.split('?', 1)
+    params = [p for p in query.split('&')
+              if p and not p.startswith('pageToken=')]
+  else:
+    base = uri
+    params = []
+  params.append(urllib.urlencode({'pageToken': page_token}))
+  return '%s?%s%s' % (base, '&'.join(params), fragment)
+
+
+def next_page_request(previous_request, previous_response):
+  """Build the request for the page following previous_response.
+
+  Args:
+    previous_request: HttpRequest, the request for the previous page.
+    previous_response: dict, the response for the previous page.
+
+  Returns:
+    A copy of previous_request for the next page, or None if there are no more
+    pages.
+  """
+  if 'nextPageToken' not in previous_response:
+    return None
+  request = copy.copy(previous_request)
+  request.uri = _replace_page_token(request.uri,
+                                    previous_response['nextPageToken'])
+  logger.info('URL being requested: %s' % request.uri)
+  return request
+
+
+class _Prefetcher(object):
+  """Fetches pages ahead of the consumer, at most prefetch pages ahead."""
+
+  def __init__(self, request, prefetch, http, num_retries, pool, deadline):
+    self._next_request = request
+    self._prefetch = prefetch
+    self._http = http
+    self._num_retries = num_retries
+    self._pool = pool
+    self._deadline = deadline
+    self._lock = threading.RLock()
+    self._pending = []
+    # The future of the page being fetched, until the request for the page
+    # after it is known.
+    self._in_flight = None
+    self._stopped = False
+
+  def _maybe_submit(self):
+    with self._lock:
+      if (self._stopped or self._in_flight is not None or
+          self._next_request is None or
+          len(self._pending) >= self._prefetch):
+        return
+      request = self._next_request
+      self._next_request = None
+      future = request.execute_async(http=self._http,
+                                     num_retries=self._num_retries,
+                                     pool=self._pool,
+                                     deadline=self._deadline)
+      self._in_flight = future
+      self._pending.append((request, future))
+      future.add_done_callback(
+          lambda f: self._on_done(request, f))
+
+  def _on_done(self, request, future):
+    with self._lock:
+      if self._in_flight is not future:
+        # pages() got to the response first.
+        return
+      self._in_flight = None
+      if not future.cancelled() and future.exception() is None:
+        self._next_request = next_page_request(request, future.result())
+      self._maybe_submit()
+
+  def pages(self):
+    try:
+      while True:
+        with self._lock:
+          self._maybe_submit()
+          if not self._pending:
+            return
+          request, future = self._pending[0]
+        if self._deadline is None:
+          response = future.result()
+        else:
+          try:
+            response = future.result(timeout=self._deadline.remaining())
+          except TimeoutError:
+            raise DeadlineExceededError(
+                'Deadline exceeded waiting for page: %s' % request.uri)
+        with self._lock:
+          self._pending.pop(0)
+          # Waiters are woken before done callbacks run, so the callback may
+          # not have queued the next page yet.
+          if self._in_flight is future:
+            self._in_flight = None
+            self._next_request = next_page_request(request, response)
+          self._maybe_submit()
+        yield response
+    finally:
+      with self._lock:
+        self._stopped = True
+        for _, future in self._pending:
+          future.cancel()
+        self._pending = []
+
+
+@util.positional(1)
+def iter_pages(request, prefetch=1, http=None, num_retries=0, pool=None,
+               deadline=None):
+  """Iterate over the responses for every page of a list() request.
+
+  Args:
+    request: HttpRequest, the request for the first page.
+    prefetch: int, the number of pages to fetch ahead of the one being
+      consumed. If zero then each page is fetched on the calling thread only
+      once it is needed.
+    http: httplib2.Http, an http object to be used in place of the one the
+      request was constructed with.
+    num_retries: Integer, number of times to retry 500's with randomized
+      exponential backoff.
+    pool: apiclient.futures.WorkerPool, the pool to prefetch pages on. If None
+      then the process wide default pool is used.
+    deadline: apiclient.deadline.Deadline or a number of seconds, the time by
+      which every page must have been fetched. The clock starts when
+      iter_pages() is called.
+
+  Returns:
+    A generator of deserialized responses. Closing the generator, or dropping
+    it, stops fetching further pages. Raises
+    apiclient.errors.DeadlineExceededError if the deadline passes.
+  """
+  if prefetch < 0:
+    raise ValueError('prefetch must not be negative.')
+  deadline = to_deadline(deadline)
+  if prefetch == 0:
+    return _iter_pages_serially(request, http, num_retries, deadline)
+  if pool is None:
+    pool = futures.default_pool()
+  return _Prefetcher(request, prefetch, http, num_retries, pool,
+                     deadline).pages()
+
+
+def _iter_pages_serially(request, http, num_retries, deadline):
+  while request is not None:
+    response = request.execute(http=http, num_retries=num_retries,
+                               deadline=deadline)
+    yield response
+    request = next_page_request(request, response)
+
+
+@util.positional(1)
+def iter_items(request, prefetch=1, http=None, num_retries=0, pool=None,
+               deadline=None):
+  """Iterate over the 'items' of every page of a list() request.
+
+  Takes the same arguments as iter_pages().
+
+  Returns:
+    A generator of the items from each page, in order.
+  """
+  pages = iter_pages(request, prefetch=prefetch, http=http,
+                     num_retries=num_retries, pool=pool, deadline=deadline)
+  try:
+    for page in pages:
+      for item in page.get('items', []):
+        yield item
+  finally:
+    pages.close()
@@ -0,0 +1,245 @@
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Client-side rate limiting that adapts to quota errors.
+
+A QuotaScheduler keeps a token bucket per API, method and credential. Every
+request made by HttpRequest.execute(), HttpRequest.next_chunk() and
+BatchHttpRequest.execute() waits for a token first. The rate of a bucket is
+halved when the server answers with a rate limit error and creeps back up
+while requests succeed, so that sustained load settles just under the quota:
+
+  from apiclient import http
+  from apiclient.ratelimit import QuotaScheduler
+
+  http.rate_limiter = QuotaScheduler(rate=10)
+"""
+
+import threading
+import time
+
+from oauth2client import util
+from oauth2client.anyjson import simplejson
+
+DEFAULT_RATE = 10.0
+
+# Error reasons returned with a 403 when a quota has been exceeded.
+RATE_LIMIT_REASONS = frozenset(['rateLimitExceeded', 'userRateLimitExceeded'])
+
+
+def is_rate_limit_error(resp, content):
+  """Is the response a rate limit error.
+
+  Args:
+    resp: httplib2.Response, the response.
+    content: string, the body of the response.
+
+  Returns:
+    True for a 429, or a 403 whose error reason is a rate limit reason.
+  """
+  if resp.status == 429:
+    return True
+  if resp.status != 403:
+    return False
+  try:
+    errors = simplejson.loads(content)['error']['errors']
+    return any(e.get('reason') in RATE_LIMIT_REASONS for e in errors)
+  except (ValueError, KeyError, TypeError, AttributeError):
+    return False
+
+
+def rate_limit_key(method_id, identity):
+  """Build the key of the token bucket a request draws from.
+
+  Args:
+    method_id: string, the id of the API method, such as
+      'calendar.events.list', or None.
+    identity: hashable, identifies the credentials the request is sent with.
+
+  Returns:
+    A (api, method_id, identity) tuple.
+  """
+  api = None
+  if method_id:
+    api = method_id.split('.', 1)[0]
+  return (api, method_id, identity)
+
+
+class TokenBucket(object):
+  """A token bucket that hands out reservations instead of blocking."""
+
+  def __init__(self, rate, burst, clock=time.time):
+    """Constructor.
+
+    Args:
+      rate: float, tokens added per second.
+      burst: float, the maximum number of tokens the bucket holds.
+      clock: callable, returns the current time in seconds.
+    """
+    self.rate = float(rate)
+    self.burst = float(burst)
+    self._clock = clock
+    self._tokens = self.burst
+    self._last = clock()
+
+  def reserve(self, max_wait=None):
+    """Take a token, going into debt if none is available.
+
+    Args:
+      max_wait: float, the longest wait acceptable, in seconds. None accepts
+        any wait.
+
+    Returns:
+      The number of seconds to wait before the token may be used, or None if
+      that is longer than max_wait, in which case no token is taken.
+    """
+    now = self._clock()
+    self._tokens = min(self.burst,
+                       self._tokens + (now - self._last) * self.rate)
+    self._last = now
+    wait = max(0.0, (1 - self._tokens) / self.rate)
+    if max_wait is not None and wait > max_wait:
+      return None
+    self._tokens -= 1
+    return wait
+
+
+class _Limit(object):
+  """The bucket and counters for a single key."""
+
+  def __init__(self, bucket):
+    self.bucket = bucket
+    self.last_decrease = 0.0
+    self.requests = 0
+    self.delayed = 0
+    self.total_delay = 0.0
+    self.max_delay = 0.0
+    self.rate_limited = 0
+    self.refused = 0
+
+
+class QuotaScheduler(object):
+  """Paces requests per key with additive-increase, multiplicative-decrease."""
+
+  @util.positional(1)
+  def __init__(self, rate=DEFAULT_RATE, burst=None, min_rate=None,
+               increase=None, decrease_factor=0.5, cooldown=1.0):
+    """Constructor.
+
+    Args:
+      rate: float, the initial and maximum requests per second for each key.
+      burst: float, the number of requests allowed back to back. Defaults to
+        rate.
+      min_rate: float, the rate is never lowered below this. Defaults to a
+        twentieth of rate.
+      increase: float, requests per second added to the rate after every
+        successful request. Defaults to a hundredth of rate.
+      decrease_factor: float, the rate is multiplied by this after a rate
+        limit error.
+      cooldown: float, seconds after a decrease during which further rate
+        limit errors, from requests that were already in flight, don't lower
+        the rate again.
+    """
+    self._max_rate = float(rate)
+    self._burst = float(burst or rate)
+    self._min_rate = float(min_rate or rate / 20.0)
+    self._increase = float(increase or rate / 100.0)
+    self._decrease_factor = decrease_factor
+    self._cooldown = cooldown
+    self._limits = {}
+    self._lock = threading.Lock()
+
+    # Stubs for testing.
+    self._clock = time.time
+    self._sleep = time.sleep
+
+  def _limit(self, key):
+    limit = self._limits.get(key)
+    if limit is None:
+      limit = _Limit(TokenBucket(self._max_rate, self._burst, self._clock))
+      self._limits[key] = limit
+    return limit
+
+  def acquire(self, key, max_wait=None):
+    """Wait until a request for key may be sent.
+
+    Args:
+      key: hashable, from rate_limit_key().
+      max_wait: float, the longest wait acceptable, in seconds, such as the
+        time left before a deadline. None waits for as long as it takes.
+
+    Returns:
+      The number of seconds spent waiting, or None, without waiting, if the
+      wait would be longer than max_wait.
+    """
+    with self._lock:
+      limit = self._limit(key)
+      delay = limit.bucket.reserve(max_wait)
+      if delay is None:
+        limit.refused += 1
+        return None
+      limit.requests += 1
+      if delay > 0:
+        limit.delayed += 1
+        limit.total_delay += delay
+        limit.max_delay = max(limit.max_delay, delay)
+    if delay > 0:
+      self._sleep(delay)
+    return delay
+
+  def feedback(self, key, resp, content):
+    """Adjust the rate for key from the response to a request.
+
+    Args:
+      key: hashable, from rate_limit_key().
+      resp: httplib2.Response, the response.
+      content: string, the body of the response.
+    """
+    rate_limited = is_rate_limit_error(resp, content)
+    with self._lock:
+      limit = self._limit(key)
+      bucket = limit.bucket
+      if rate_limited:
+        limit.rate_limited += 1
+        now = self._clock()
+        if now - limit.last_decrease >= self._cooldown:
+          limit.last_decrease = now
+          bucket.rate = max(self._min_rate,
+                            bucket.rate * self._decrease_factor)
+      elif resp.status < 500:
+        bucket.rate = min(self._max_rate, bucket.rate + self._increase)
+
+  def stats(self):
+    """Queueing and rate counters for every key.
+
+    Returns:
+      A dict from key to a dict with the current 'rate', the number of
+      'requests', how many were 'delayed', their 'total_delay' and 'max_delay'
+      in seconds, how many were answered with a rate limit error
+      ('rate_limited'), and how many were 'refused' because the wait would
+      have outlasted their deadline.
+    """
+    with self._lock:
+      result = {}
+      for key, limit in self._limits.iteritems():
+        result[key] = {
+            'rate': limit.bucket.rate,
+            'requests': limit.requests,
+            'delayed': limit.delayed,
+            'total_delay': limit.total_delay,
+            'max_delay': limit.max_delay,
+            'rate_limited': limit.rate_limited,
+            'refused': limit.refused,
+            }
+      return result
@@ -0,0 +1,365 @@
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Retry policy shared by every request type.
+
+A RetryPolicy decides which failures are retried, how long to wait between
+attempts and whether the process can afford another retry at all. Waits use
+decorrelated jitter, and a Retry-After header sent by the server takes
+precedence. A policy can be given a RetryBudget, which caps retries at a
+fraction of the requests made so that a backend brownout isn't multiplied by
+every client retrying. Without one, requests are retried as many times as
+their num_retries asks.
+
+The policy used by HttpRequest, MediaIoBaseDownload and BatchHttpRequest is
+apiclient.http.retry_policy, and can be replaced:
+
+  from apiclient import http
+  from apiclient import retry
+
+  http.retry_policy = retry.RetryPolicy(
+      budget=retry.RetryBudget(ratio=0.2),
+      rules={retry.TRANSPORT_ERROR: retry.RetryRule(retry=True)})
+"""
+
+import email.utils
+import httplib
+import logging
+import random
+import socket
+import sys
+import threading
+import time
+
+import httplib2
+
+from apiclient.ratelimit import is_rate_limit_error
+from oauth2client import util
+
+logger = logging.getLogger(__name__)
+
+# Classes of errors that rules can be given for.
+SERVER_ERROR = 'server_error'
+RATE_LIMIT = 'rate_limit'
+TRANSPORT_ERROR = 'transport_error'
+
+# Exceptions raised by the transport that count as a TRANSPORT_ERROR. httplib2
+# lets httplib's own, such as BadStatusLine and IncompleteRead, through.
+TRANSPORT_EXCEPTIONS = (socket.error, httplib.HTTPException,
+                        httplib2.HttpLib2Error)
+
+
+class RetryRule(object):
+  """How to retry one class of errors."""
+
+  @util.positional(1)
+  def __init__(self, retry=True, base_delay=None, max_delay=None):
+    """Constructor.
+
+    Args:
+      retry: bool, whether errors of this class are retried at all.
+      base_delay: float, overrides the policy's base_delay for this class.
+      max_delay: float, overrides the policy's max_delay for this class.
+    """
+    self.retry = retry
+    self.base_delay = base_delay
+    self.max_delay = max_delay
+
+
+DEFAULT_RULES = {
+    SERVER_ERROR: RetryRule(),
+    RATE_LIMIT: RetryRule(base_delay=2.0),
+    TRANSPORT_ERROR: RetryRule(retry=False),
+    }
+
+
+class RetryBudget(object):
+  """Limits retries to a fraction of the requests made.
+
+  Every first attempt deposits ratio tokens and every retry withdraws one. The
+  balance starts at min_retries so that a process that has made few requests
+  can still retry a few times.
+  """
+
+  @util.positional(1)
+  def __init__(self, ratio=0.1, min_retries=10, max_tokens=None):
+    """Constructor.
+
+    Args:
+      ratio: float, the number of retries allowed per request, so that 0.1
+        means retries add at most 10% of extra load.
+      min_retries: int, the number of retries allowed before any request has
+        been made.
+      max_tokens: float, the maximum balance. Defaults to ten times
+        min_retries.
+    """
+    self._ratio = ratio
+    self._tokens = float(min_retries)
+    self._max_tokens = float(max_tokens or 10 * min_retries)
+    self._lock = threading.Lock()
+    self._retries = 0
+    self._exhausted = 0
+
+  def record_request(self, count=1):
+    """Count first attempts.
+
+    Args:
+      count: int, the number of requests made.
+    """
+    with self._lock:
+      self._tokens = min(self._max_tokens,
+                         self._tokens + count * self._ratio)
+
+  def try_spend(self):
+    """Take the budget for one retry.
+
+    Returns:
+      True if the retry may go ahead.
+    """
+    with self._lock:
+      if self._tokens >= 1.0:
+        self._tokens -= 1.0
+        self._retries += 1
+        return True
+      self._exhausted += 1
+      return False
+
+  def stats(self):
+    """Counters for this budget.
+
+    Returns:
+      A dict with the current 'tokens', the number of 'retries' allowed and
+      the number of retries refused because the budget was 'exhausted'.
+    """
+    with self._lock:
+      return {
+          'tokens': self._tokens,
+          'retries': self._retries,
+          'exhausted': self._exhausted,
+          }
+
+
+def parse_retry_after(resp):
+  """Read the Retry-After header of a response.
+
+  Args:
+    resp: httplib2.Response, the response.
+
+  Returns:
+    The number of seconds to wait as a float, or None if the header is missing
+    or malformed.
+  """
+  value = resp.get('retry-after')
+  if not value:
+    return None
+  try:
+    return max(0.0, float(value))
+  except ValueError:
+    pass
+  parsed = email.utils.parsedate_tz(value)
+  if parsed is None:
+    return None
+  return max(0.0, email.utils.mktime_tz(parsed) - time.time())
+
+
+class RetryPolicy(object):
+  """Decides whether, and when, a failed request is retried."""
+
+  @util.positional(1)
+  def __init__(self, base_delay=1.0, max_delay=32.0, max_retry_after=120.0,
+               budget=None, rules=None):
+    """Constructor.
+
+    Args:
+      base_delay: float, the shortest wait between attempts, in seconds.
+      max_delay: float, the longest wait between attempts, in seconds.
+      max_retry_after: float, a Retry-After longer than this, in seconds, is
+        not waited for and the error is returned instead.
+      budget: RetryBudget, shared by every request using this policy, or None
+        to retry every request up to its num_retries.
+      rules: dict, maps SERVER_ERROR, RATE_LIMIT or TRANSPORT_ERROR to a
+        RetryRule, overriding DEFAULT_RULES for that class.
+    """
+    self.base_delay = base_delay
+    self.max_delay = max_delay
+    self.max_retry_after = max_retry_after
+    self.budget = budget
+    self.rules = dict(DEFAULT_RULES)
+    if rules:
+      self.rules.update(rules)
+
+  def record_request(self, count=1):
+    """Credit the budget, if any, with first attempts.
+
+    Args:
+      count: int, the number of requests made.
+    """
+    if self.budget is not None:
+      self.budget.record_request(count)
+
+  def _try_spend(self):
+    return self.budget is None or self.budget.try_spend()
+
+  def log_retry(self, retry_num, description, status=None):
+    """Log that a request is being retried.
+
+    Args:
+      retry_num: int, the number of the retry, from 1.
+      description: string, describes the request.
+      status: the status or exception of the failed attempt, if any.
+    """
+    if status is None:
+      logger.warning('Retry #%d for %s', retry_num, description)
+    else:
+      logger.warning('Retry #%d for %s, following status: %s', retry_num,
+                     description, status)
+
+  def classify(self, resp, content):
+    """Find the class of error a response represents.
+
+    Args:
+      resp: httplib2.Response, the response.
+      content: string, the body of the response.
+
+    Returns:
+      SERVER_ERROR, RATE_LIMIT, or None if the response isn't an error that
+      can be retried.
+    """
+    if resp.status >= 500:
+      return SERVER_ERROR
+    if is_rate_limit_error(resp, content):
+      return RATE_LIMIT
+    return None
+
+  def is_retryable(self, resp, content):
+    """Is the response an error that rules allow retrying."""
+    error_class = self.classify(resp, content)
+    return error_class is not None and self.rules[error_class].retry
+
+  def next_delay(self, error_class, previous_delay, resp=None, rand=None):
+    """Compute the wait before the next attempt.
+
+    Args:
+      error_class: string, the class of error being retried.
+      previous_delay: float, the previous wait, or None before the first
+        retry.
+      resp: httplib2.Response, the failed response, or None.
+      rand: callable, returns a random float in [0, 1).
+
+    Returns:
+      The number of seconds to wait, or None if the server asked for a wait
+      longer than max_retry_after.
+    """
+    if resp is not None:
+      retry_after = parse_retry_after(resp)
+      if retry_after is not None:
+        if retry_after > self.max_retry_after:
+          return None
+        return retry_after
+    if rand is None:
+      rand = random.random
+    rule = self.rules[error_class]
+    base = rule.base_delay or self.base_delay
+    cap = rule.max_delay or self.max_delay
+    if previous_delay is None:
+      previous_delay = base
+    # Decorrelated jitter: uniform between the base and three times the
+    # previous wait.
+    upper = max(base, previous_delay * 3)
+    return min(cap, base + rand() * (upper - base))
+
+  def plan_retry(self, responses, previous_delay, rand=None, deadline=None):
+    """Pick the requests of a batch to send again.
+
+    Every request picked takes one retry from the budget, if any.
+
+    Args:
+      responses: list of (request_id, resp, content) for the batch.
+      previous_delay: float, the previous wait, or None before the first
+        retry.
+      rand: callable, returns a random float in [0, 1).
+      deadline: apiclient.deadline.Deadline, requests whose wait would
+        outlast it are not picked.
+
+    Returns:
+      (request_ids, delay): the ids of the requests to retry, in order, and
+      the number of seconds to wait before retrying them.
+    """
+    request_ids = []
+    delay = None
+    for request_id, resp, content in responses:
+      error_class = self.classify(resp, content)
+      if error_class is None or not self.rules[error_class].retry:
+        continue
+      part_delay = self.next_delay(error_class, previous_delay, resp, rand)
+      if (part_delay is None or
+          (deadline is not None and not deadline.allows(part_delay)) or
+          not self._try_spend()):
+        continue
+      request_ids.append(request_id)
+      delay = max(delay, part_delay)
+    return request_ids, delay
+
+  def run(self, send, num_retries, sleep, rand, description='request',
+          deadline=None, record=True):
+    """Make a request, retrying it as allowed by this policy.
+
+    Args:
+      send: callable, makes one attempt and returns (resp, content).
+      num_retries: Integer, the maximum number of retries.
+      sleep: callable, sleeps for the given number of seconds.
+      rand: callable, returns a random float in [0, 1).
+      description: string, describes the request in log messages.
+      deadline: apiclient.deadline.Deadline, retries that would have to wait
+        past it are not made.
+      record: bool, whether to credit the budget with the request. False
+        when the caller has already done so, as a batch does for the
+        requests it carries.
+
+    Returns:
+      The (resp, content) pair of the last attempt.
+
+    Raises:
+      The exception of the last attempt if it raised one.
+    """
+    if record:
+      self.record_request()
+    delay = None
+    retry_num = 0
+    while True:
+      try:
+        resp, content = send()
+      except TRANSPORT_EXCEPTIONS, e:
+        if (retry_num >= num_retries or
+            not self.rules[TRANSPORT_ERROR].retry):
+          raise
+        exc_info = sys.exc_info()
+        error_class, resp, status = TRANSPORT_ERROR, None, e
+      else:
+        error_class = self.classify(resp, content)
+        if (error_class is None or retry_num >= num_retries or
+            not self.rules[error_class].retry):
+          return resp, content
+        status = resp.status
+
+      delay = self.next_delay(error_class, delay, resp, rand)
+      if (delay is None or
+          (deadline is not None and not deadline.allows(delay)) or
+          not self._try_spend()):
+        if resp is None:
+          raise exc_info[0], exc_info[1], exc_info[2]
+        return resp, content
+      retry_num += 1
+      sleep(delay)
+      self.log_retry(retry_num, description, status)
@@ -0,0 +1,293 @@
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Concurrent resumable uploads that survive a restart of the process.
+
+An UploadManager runs resumable uploads on a bounded pool of worker threads
+and records the state of each one in a journal file after every chunk. When
+the process is restarted, resume() picks up every upload the journal lists as
+unfinished from the last chunk the server acknowledged:
+
+  manager = UploadManager('uploads.journal', http_factory=make_http)
+  futures = manager.resume()
+  for name in filenames:
+    media = MediaFileUpload(name, resumable=True)
+    request = service.files().insert(body={'title': name}, media_body=media)
+    futures[name] = manager.submit(name, request)
+  for name, future in futures.iteritems():
+    print name, future.result()['id']
+
+Only requests whose media can be serialized, such as MediaFileUpload, can be
+journaled.
+"""
+
+import os
+import threading
+
+from apiclient import futures
+from apiclient.http import HttpRequest
+from apiclient.model import JsonModel
+from oauth2client import util
+from oauth2client.anyjson import simplejson
+
+DEFAULT_MAX_WORKERS = 4
+
+
+class UploadJournal(object):
+  """An append-only file of upload states, one JSON record per line.
+
+  The last record for an upload wins. Every record is flushed to disk before
+  the call returns, and a line left incomplete by a crash is ignored. The file
+  is compacted when it is opened and whenever most of its lines are stale.
+  """
+
+  def __init__(self, filename):
+    """Constructor.
+
+    Args:
+      filename: string, the path of the journal. Created if missing.
+    """
+    self._filename = filename
+    self._lock = threading.Lock()
+    self._entries = self._read()
+    self._lines = 0
+    self._compact()
+
+  def _read(self):
+    entries = {}
+    try:
+      f = open(self._filename, 'rb')
+    except IOError:
+      return entries
+    try:
+      for line in f:
+        try:
+          record = simplejson.loads(line)
+        except ValueError:
+          continue
+        if record.get('request') is None:
+          entries.pop(record['id'], None)
+        else:
+          entries[record['id']] = record['request']
+    finally:
+      f.close()
+    return entries
+
+  def _compact(self):
+    """Rewrite the journal with only the live entries. Must hold the lock."""
+    tmp = self._filename + '.tmp'
+    f = open(tmp, 'wb')
+    try:
+      for upload_id, request in self._entries.iteritems():
+        f.write(simplejson.dumps({'id': upload_id, 'request': request}) + '\n')
+      f.flush()
+      os.fsync(f.fileno())
+    finally:
+      f.close()
+    os.rename(tmp, self._filename)
+    self._file = open(self._filename, 'ab')
+    self._lines = len(self._entries)
+
+  def _append(self, record):
+    """Append a record and flush it to disk. Must hold the lock."""
+    self._file.write(simplejson.dumps(record) + '\n')
+    self._file.flush()
+    os.fsync(self._file.fileno())
+    self._lines += 1
+    if self._lines > max(100, 4 * len(self._entries)):
+      self._file.close()
+      self._compact()
+
+  def entries(self):
+    """The unfinished uploads.
+
+    Returns:
+      A dict from upload id to the JSON of the upload's HttpRequest.
+    """
+    with self._lock:
+      return dict(self._entries)
+
+  def record(self, upload_id, request_json):
+    """Save the state of an upload.
+
+    Args:
+      upload_id: string, identifies the upload.
+      request_json: string, from HttpRequest.to_json().
+    """
+    with self._lock:
+      self._entries[upload_id] = request_json
+      self._append({'id': upload_id, 'request': request_json})
+
+  def remove(self, upload_id):
+    """Forget a finished upload.
+
+    Args:
+      upload_id: string, identifies the upload.
+    """
+    with self._lock:
+      if self._entries.pop(upload_id, None) is not None:
+        self._append({'id': upload_id, 'request': None})
+
+  def close(self):
+    with self._lock:
+      self._file.close()
+
+
+class UploadManager(object):
+  """Runs resumable uploads concurrently, journaling their progress."""
+
+  @util.positional(2)
+  def __init__(self, journal, http_factory=None,
+               max_workers=DEFAULT_MAX_WORKERS, num_retries=0, adaptive=False,
+               pool=None):
+    """Constructor.
+
+    Args:
+      journal: string or UploadJournal, the journal file to record uploads in.
+      http_factory: callable, returns a new httplib2.Http for each worker
+        thread, or for each upload if pool has no http_factory of its own.
+        httplib2.Http isn't thread-safe, so without one each upload is sent
+        with the http object of its own request, and resume() can't be
+        used.
+      max_workers: int, the maximum number of uploads run at once when no pool
+        is given.
+      num_retries: Integer, number of times to retry each chunk, as for
+        HttpRequest.next_chunk().
+      adaptive: bool, whether chunks are sized adaptively, as for
+        HttpRequest.next_chunk().
+      pool: apiclient.futures.WorkerPool, the pool to run uploads on. Its
+        per-thread http object is used when it has an http_factory.
+    """
+    if not isinstance(journal, UploadJournal):
+      journal = UploadJournal(journal)
+    self._journal = journal
+    self._http_factory = http_factory
+    self._num_retries = num_retries
+    self._adaptive = adaptive
+    self._own_pool = pool is None
+    if pool is None:
+      pool = futures.WorkerPool(max_workers=max_workers,
+                                http_factory=http_factory)
+    self._pool = pool
+    self._lock = threading.Lock()
+    self._running = set()
+
+  def submit(self, upload_id, request):
+    """Start a resumable upload.
+
+    The upload is journaled before this returns, so that it is resumed after
+    a restart even if no chunk has been sent yet.
+
+    Args:
+      upload_id: string, identifies the upload in the journal.
+      request: HttpRequest, a request with a resumable media body.
+
+    Returns:
+      An apiclient.futures.Future whose result() is the deserialized response
+      to the completed upload.
+
+    Raises:
+      ValueError if the request isn't a resumable upload or upload_id is
+        already running.
+      NotImplementedError if the media of the request can't be serialized.
+    """
+    if request.resumable is None:
+      raise ValueError('Only resumable uploads can be managed.')
+    with self._lock:
+      if upload_id in self._running:
+        raise ValueError('Upload %s is already running.' % upload_id)
+      self._running.add(upload_id)
+    try:
+      self._journal.record(upload_id, request.to_json())
+      return self._pool.submit(self._run, upload_id, request)
+    except:
+      with self._lock:
+        self._running.discard(upload_id)
+      raise
+
+  @util.positional(1)
+  def resume(self, postproc=None):
+    """Restart every unfinished upload found in the journal.
+
+    Uploads that are already running are left alone. The restored requests
+    are sent with http objects from the manager's http_factory.
+
+    Args:
+      postproc: callable, deserializes the response to a completed upload.
+        Defaults to the response method of a JsonModel.
+
+    Returns:
+      A dict from upload id to the apiclient.futures.Future of the upload.
+
+    Raises:
+      ValueError if the manager has no http_factory.
+    """
+    if self._http_factory is None:
+      raise ValueError('Resuming uploads needs an http_factory, since the '
+                       'uploads run on several threads at once.')
+    if postproc is None:
+      postproc = JsonModel().response
+    result = {}
+    for upload_id, request_json in self._journal.entries().iteritems():
+      with self._lock:
+        if upload_id in self._running:
+          continue
+      # The http object is picked on the worker thread.
+      request = HttpRequest.from_json(request_json, None, postproc)
+      result[upload_id] = self.submit(upload_id, request)
+    return result
+
+  def _http(self, request):
+    """The http object to send an upload with on the current thread."""
+    http = self._pool.http()
+    if http is None and self._http_factory is not None:
+      # The pool has no http_factory of its own, so the upload gets one.
+      http = self._http_factory()
+    if http is None:
+      http = request.http
+    return http
+
+  def _run(self, upload_id, request):
+    """Send the chunks of an upload, journaling after every one."""
+    try:
+      http = self._http(request)
+      response = None
+      while response is None:
+        try:
+          _, response = request.next_chunk(
+              http=http, num_retries=self._num_retries,
+              adaptive=self._adaptive)
+        finally:
+          if response is None:
+            self._journal.record(upload_id, request.to_json())
+      self._journal.remove(upload_id)
+      return response
+    finally:
+      with self._lock:
+        self._running.discard(upload_id)
+
+  def shutdown(self, wait=True):
+    """Stop the workers of the manager's own pool and close the journal.
+
+    Uploads that haven't completed stay in the journal and are picked up by
+    resume() on the next run.
+
+    Args:
+      wait: bool, if True block until running uploads have completed. The
+        journal is only closed then.
+    """
+    if self._own_pool:
+      self._pool.shutdown(wait=wait)
+    if wait:
+      self._journal.close()
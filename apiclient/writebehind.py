@@ -0,0 +1,567 @@
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A durable write-behind queue for mutating requests.
+
+A WriteBehindQueue writes each request it is given to a spool file and
+returns as soon as the request is on disk, without waiting for the server. A
+worker thread drains the spool in the background, sending the requests as
+BatchHttpRequests:
+
+  queue = WriteBehindQueue('calendar.spool', http=credentials.authorize(
+      httplib2.Http()))
+  future = queue.enqueue(service.events().patch(
+      calendarId='primary', eventId=event_id, body={'summary': 'Lunch'}))
+  ...
+  queue.close()
+
+Requests with the same key, by default the path of their URI, are sent in
+the order they were enqueued and never in the same batch, since the parts of
+a batch may be applied in any order. Inserts (POST) are unordered unless
+given a key, such as the id of the resource they create, which orders them
+with later changes to it.
+
+Failed requests are retried with the backoff of apiclient.http.retry_policy
+until they succeed, fail with an error that can't be retried, or have been
+sent max_attempts times. A request whose response was lost, to a transport
+error or a crash, is sent again and may reach the server twice. To make that
+safe, a 409 Conflict to a request that an earlier attempt may have delivered
+counts as delivered, which makes inserts idempotent when they carry a
+client-chosen resource id. Requests are marked in the spool before they are
+first sent, so that a 409 to one that never left is still reported as a
+conflict.
+"""
+
+import collections
+import logging
+import os
+import threading
+import time
+import urlparse
+import uuid
+
+from apiclient import futures
+from apiclient import http as apiclient_http
+from apiclient.errors import BatchError
+from apiclient.errors import CircuitOpenError
+from apiclient.errors import HttpError
+from apiclient.http import BatchHttpRequest
+from apiclient.http import HttpRequest
+from apiclient.model import JsonModel
+from apiclient.retry import TRANSPORT_ERROR
+from apiclient.retry import TRANSPORT_EXCEPTIONS
+from oauth2client import util
+from oauth2client.anyjson import simplejson
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BATCH_SIZE = 100
+
+# Seconds to wait after a request is enqueued for more to batch with it.
+DEFAULT_WINDOW = 0.05
+
+# The number of times a request is sent before its error is given up on.
+DEFAULT_MAX_ATTEMPTS = 10
+
+# Errors of a whole batch that are retried, whatever the rule for transport
+# errors, since the requests are safe on disk.
+_BATCH_RETRY_EXCEPTIONS = TRANSPORT_EXCEPTIONS + (CircuitOpenError,)
+
+
+def resource_key(request):
+  """The default ordering key of a request: the path of its URI.
+
+  Args:
+    request: HttpRequest, the request.
+
+  Returns:
+    The path, or None for a POST, which creates a new resource.
+  """
+  if request.method == 'POST':
+    return None
+  return urlparse.urlsplit(request.uri).path
+
+
+class WriteSpool(object):
+  """An append-only file of queued requests, one JSON record per line.
+
+  Requests are kept in the order they were appended, with whether they may
+  have been sent. Every record is flushed to disk before the call returns,
+  and a line left incomplete by a crash is ignored. The file is compacted
+  when it is opened and whenever most of its lines are stale.
+  """
+
+  def __init__(self, filename):
+    """Constructor.
+
+    Args:
+      filename: string, the path of the spool. Created if missing.
+    """
+    self._filename = filename
+    self._lock = threading.Lock()
+    self._entries = self._read()
+    self._lines = 0
+    self._compact()
+
+  def _read(self):
+    entries = collections.OrderedDict()
+    try:
+      f = open(self._filename, 'rb')
+    except IOError:
+      return entries
+    try:
+      for line in f:
+        try:
+          record = simplejson.loads(line)
+        except ValueError:
+          continue
+        if 'request' not in record:
+          if record['id'] in entries:
+            key, request, _ = entries[record['id']]
+            entries[record['id']] = (key, request, True)
+        elif record['request'] is None:
+          entries.pop(record['id'], None)
+        else:
+          # Spools written before sends were marked may have sent anything.
+          entries[record['id']] = (record.get('key'), record['request'],
+                                   record.get('sent', True))
+    finally:
+      f.close()
+    return entries
+
+  def _compact(self):
+    """Rewrite the spool with only the live entries. Must hold the lock."""
+    tmp = self._filename + '.tmp'
+    f = open(tmp, 'wb')
+    try:
+      for entry_id, (key, request, sent) in self._entries.iteritems():
+        f.write(simplejson.dumps({'id': entry_id, 'key': key,
+                                  'request': request, 'sent': sent}) + '\n')
+      f.flush()
+      os.fsync(f.fileno())
+    finally:
+      f.close()
+    os.rename(tmp, self._filename)
+    self._file = open(self._filename, 'ab')
+    self._lines = len(self._entries)
+
+  def _append(self, records):
+    """Append records and flush them to disk. Must hold the lock."""
+    self._file.write(''.join(simplejson.dumps(record) + '\n'
+                             for record in records))
+    self._file.flush()
+    os.fsync(self._file.fileno())
+    self._lines += len(records)
+    if self._lines > max(100, 4 * len(self._entries)):
+      self._file.close()
+      self._compact()
+
+  def entries(self):
+    """The requests that haven't been delivered.
+
+    Returns:
+      A list of (entry_id, key, request_json, sent) in the order they were
+      added, where sent is whether the request may have been sent.
+    """
+    with self._lock:
+      return [(entry_id, key, request, sent)
+              for entry_id, (key, request, sent) in self._entries.iteritems()]
+
+  def add(self, entry_id, key, request_json):
+    """Save a request.
+
+    Args:
+      entry_id: string, identifies the entry.
+      key: string, the ordering key of the request, or None.
+      request_json: string, from HttpRequest.to_json().
+    """
+    with self._lock:
+      self._entries[entry_id] = (key, request_json, False)
+      self._append([{'id': entry_id, 'key': key, 'request': request_json,
+                     'sent': False}])
+
+  def mark_sent(self, entry_ids):
+    """Note that requests are about to be sent for the first time.
+
+    Args:
+      entry_ids: list of strings, the entries being sent.
+    """
+    with self._lock:
+      records = []
+      for entry_id in entry_ids:
+        entry = self._entries.get(entry_id)
+        if entry is not None and not entry[2]:
+          self._entries[entry_id] = (entry[0], entry[1], True)
+          records.append({'id': entry_id, 'sent': True})
+      if records:
+        self._append(records)
+
+  def remove(self, entry_ids):
+    """Forget requests that are done with.
+
+    Args:
+      entry_ids: list of strings, the entries to remove.
+    """
+    with self._lock:
+      records = [{'id': entry_id, 'request': None} for entry_id in entry_ids
+                 if self._entries.pop(entry_id, None) is not None]
+      if records:
+        self._append(records)
+
+  def close(self):
+    with self._lock:
+      self._file.close()
+
+
+class _Entry(object):
+  """A queued request, and how its delivery is going."""
+
+  def __init__(self, entry_id, key, request, future, maybe_delivered):
+    self.id = entry_id
+    # Requests without a key are ordered only with themselves.
+    self.key = key if key is not None else ('', entry_id)
+    self.request = request
+    self.future = future
+    # The number of times the request has been sent by this queue.
+    self.attempts = 0
+    # Whether an earlier attempt may have reached the server without its
+    # response arriving.
+    self.maybe_delivered = maybe_delivered
+    self.ready_at = 0.0
+    self.delay = None
+
+
+class WriteBehindQueue(object):
+  """Acknowledges requests once spooled and sends them in the background."""
+
+  @util.positional(3)
+  def __init__(self, spool, http, postproc=None, batch_uri=None,
+               max_batch_size=DEFAULT_MAX_BATCH_SIZE, window=DEFAULT_WINDOW,
+               num_retries=0, max_attempts=DEFAULT_MAX_ATTEMPTS,
+               callback=None):
+    """Constructor.
+
+    Requests left in the spool by an earlier run are loaded and sent again.
+
+    Args:
+      spool: string or WriteSpool, the spool file to keep requests in.
+      http: httplib2.Http, the http object to send batches with, and the one
+        requests loaded from the spool are restored with. It is used only by
+        the queue's worker thread.
+      postproc: callable, deserializes the responses to requests loaded from
+        the spool. Defaults to the response method of a JsonModel.
+      batch_uri: string, URI to send batch requests to.
+      max_batch_size: int, the most requests sent in one batch.
+      window: float, seconds to wait after a request is enqueued for more
+        requests to batch with it.
+      num_retries: Integer, number of times each batch retries failed
+        requests before the queue backs them off, as for
+        BatchHttpRequest.execute().
+      max_attempts: int, the number of times the queue sends a request
+        before it fails with its last error, even one that could be retried.
+      callback: callable, called as callback(entry_id, response, exception)
+        on the worker thread once each request, including those loaded from
+        the spool, has been delivered or has failed for good.
+    """
+    if not isinstance(spool, WriteSpool):
+      spool = WriteSpool(spool)
+    if postproc is None:
+      postproc = JsonModel().response
+    self._spool = spool
+    self._http = http
+    self._postproc = postproc
+    self._batch_uri = batch_uri
+    self._max_batch_size = max_batch_size
+    self._window = window
+    self._num_retries = num_retries
+    self._max_attempts = max_attempts
+    self._callback = callback
+    self._cond = threading.Condition()
+    self._entries = collections.OrderedDict()
+    self._closed = False
+    self._sending = False
+    self._enqueued = 0
+    self._delivered = 0
+    self._failed = 0
+    self._retried = 0
+
+    # Stubs for testing.
+    self._clock = time.time
+
+    for entry_id, key, request_json, sent in spool.entries():
+      # If it was sent before the earlier run stopped, it may have got
+      # through.
+      self._entries[entry_id] = _Entry(entry_id, key, request_json, None,
+                                       sent)
+    self._worker = threading.Thread(target=self._run)
+    self._worker.daemon = True
+    self._worker.start()
+
+  def enqueue(self, request, key=None):
+    """Spool a request to be sent in the background.
+
+    Args:
+      request: HttpRequest, the request. It must not have a media body that
+        can't be batched.
+      key: string, orders the request after earlier requests with the same
+        key. Defaults to resource_key(request).
+
+    Returns:
+      An apiclient.futures.Future whose result() is the deserialized response
+      once the request has been delivered, or raises the HttpError it failed
+      with. The request is on disk before this returns.
+
+    Raises:
+      ValueError if the request is a resumable upload.
+      RuntimeError if the queue has been closed.
+    """
+    if request.resumable is not None:
+      raise ValueError('Resumable uploads can not be queued.')
+    if key is None:
+      key = resource_key(request)
+    entry_id = uuid.uuid4().hex
+    future = futures.Future()
+    future.set_running_or_notify_cancel()
+    with self._cond:
+      if self._closed:
+        raise RuntimeError('Cannot enqueue to a WriteBehindQueue after close.')
+      self._spool.add(entry_id, key, request.to_json())
+      entry = _Entry(entry_id, key, request, future, False)
+      entry.ready_at = self._clock() + self._window
+      self._entries[entry_id] = entry
+      self._enqueued += 1
+      self._cond.notify_all()
+    return future
+
+  def _take_batch(self):
+    """Pick the entries to send next. Must hold the lock.
+
+    Returns:
+      (batch, wait): the entries, and the seconds until more are ready, or
+      None if nothing is waiting.
+    """
+    now = self._clock()
+    keys = set()
+    batch = []
+    ready_at = None
+    for entry in self._entries.itervalues():
+      if entry.key in keys:
+        continue
+      # Later entries with the same key wait for this one, ready or not.
+      keys.add(entry.key)
+      if entry.ready_at > now:
+        if ready_at is None or entry.ready_at < ready_at:
+          ready_at = entry.ready_at
+        continue
+      batch.append(entry)
+      if len(batch) >= self._max_batch_size:
+        break
+    if ready_at is None:
+      return batch, None
+    return batch, ready_at - now
+
+  def _run(self):
+    while True:
+      with self._cond:
+        while True:
+          if self._closed:
+            return
+          batch, wait = self._take_batch()
+          if batch:
+            break
+          self._cond.wait(wait)
+        self._sending = True
+      try:
+        self._send(batch)
+      finally:
+        with self._cond:
+          self._sending = False
+          self._cond.notify_all()
+
+  def _send(self, batch):
+    """Send entries as one BatchHttpRequest and settle their outcomes."""
+    outcomes = {}
+
+    def callback(entry_id, response, exception):
+      outcomes[entry_id] = (response, exception)
+
+    batch_request = BatchHttpRequest(batch_uri=self._batch_uri)
+    sent = []
+    for entry in batch:
+      try:
+        if not isinstance(entry.request, HttpRequest):
+          entry.request = HttpRequest.from_json(entry.request, self._http,
+                                                self._postproc)
+        # The entry id is the Content-ID of the part on every attempt.
+        batch_request.add(entry.request, callback=callback,
+                          request_id=entry.id)
+      except Exception, e:
+        outcomes[entry.id] = (None, e)
+        continue
+      entry.attempts += 1
+      sent.append(entry)
+
+    error = None
+    if sent:
+      self._spool.mark_sent([entry.id for entry in sent])
+      try:
+        batch_request.execute(http=self._http, num_retries=self._num_retries)
+      except Exception, e:
+        logger.warning('Sending %d queued requests failed: %s', len(sent), e)
+        error = e
+
+    # Whether the requests of the batch that got no response of their own
+    # may have been applied. Not if the batch as a whole was refused.
+    lost = error is not None and (
+        isinstance(error, BatchError) or not isinstance(error, HttpError))
+
+    done = []
+    for entry in batch:
+      if entry.id in outcomes:
+        response, exception = outcomes[entry.id]
+      else:
+        response, exception = None, error
+      if (isinstance(exception, HttpError) and exception.resp is not None and
+          exception.resp.status == 409 and entry.maybe_delivered):
+        # An earlier attempt got through before its response was lost.
+        exception = None
+      if lost and entry.id not in outcomes and entry in sent:
+        entry.maybe_delivered = True
+      if exception is not None and self._back_off(
+          entry, exception, entry.id not in outcomes):
+        continue
+      done.append((entry, response, exception))
+
+    with self._cond:
+      for entry, response, exception in done:
+        del self._entries[entry.id]
+        if exception is None:
+          self._delivered += 1
+        else:
+          self._failed += 1
+    self._spool.remove([entry.id for entry, _, _ in done])
+
+    for entry, response, exception in done:
+      if exception is not None:
+        logger.warning('Queued request %s failed: %s', entry.id, exception)
+      if self._callback is not None:
+        try:
+          self._callback(entry.id, response, exception)
+        except Exception:
+          logger.exception('Exception calling write-behind callback.')
+      if entry.future is not None:
+        if exception is None:
+          entry.future.set_result(response)
+        else:
+          entry.future.set_exception(exception)
+
+  def _back_off(self, entry, exception, batch_failed):
+    """Schedule another attempt at an entry if its error can be retried.
+
+    HttpErrors, whether of the entry's own part or of the whole batch, are
+    retried as the retry policy allows. A batch that failed on the way, as
+    with a transport error, is always retried, whatever the rule for
+    transport errors, since the request is safe on disk. A batch response
+    that can't be parsed, and any other error, is not retried.
+
+    Args:
+      entry: _Entry, the entry that failed.
+      exception: Exception, what it failed with.
+      batch_failed: bool, whether the whole batch failed rather than the
+        entry's own part.
+
+    Returns:
+      True if the entry stays queued for another attempt.
+    """
+    if entry.attempts >= self._max_attempts:
+      return False
+    policy = apiclient_http.retry_policy
+    resp = None
+    if isinstance(exception, BatchError):
+      return False
+    elif isinstance(exception, HttpError):
+      resp = exception.resp
+      error_class = policy.classify(resp, exception.content)
+      if error_class is None or not policy.rules[error_class].retry:
+        return False
+    elif batch_failed and isinstance(exception, _BATCH_RETRY_EXCEPTIONS):
+      error_class = TRANSPORT_ERROR
+    else:
+      return False
+    delay = policy.next_delay(error_class, entry.delay, resp=resp)
+    if delay is None:
+      delay = policy.max_retry_after
+    entry.delay = delay
+    with self._cond:
+      entry.ready_at = self._clock() + delay
+      self._retried += 1
+    return True
+
+  def flush(self, timeout=None):
+    """Wait until every queued request has been delivered or has failed.
+
+    Args:
+      timeout: float, the most seconds to wait, or None to wait for ever.
+
+    Returns:
+      True if the queue is empty, False if the timeout ran out first.
+    """
+    end = None if timeout is None else self._clock() + timeout
+    with self._cond:
+      while self._entries or self._sending:
+        if end is None:
+          self._cond.wait()
+        else:
+          remaining = end - self._clock()
+          if remaining <= 0:
+            return False
+          self._cond.wait(remaining)
+      return True
+
+  def close(self, timeout=None):
+    """Stop accepting requests and stop the worker thread.
+
+    Requests still queued once the timeout runs out stay in the spool and are
+    sent by the next WriteBehindQueue created with it.
+
+    Args:
+      timeout: float, the most seconds to wait for queued requests to be
+        delivered first. 0 stops after the batch being sent, if any.
+    """
+    with self._cond:
+      if self._closed:
+        return
+    if timeout != 0:
+      self.flush(timeout)
+    with self._cond:
+      self._closed = True
+      self._cond.notify_all()
+    self._worker.join()
+    self._spool.close()
+
+  def stats(self):
+    """Counters for the requests that have gone through the queue.
+
+    Returns:
+      A dict with the number of requests 'enqueued', 'pending' delivery,
+      'delivered', 'failed' for good, and 'retried' after a failure.
+    """
+    with self._cond:
+      return {
+          'enqueued': self._enqueued,
+          'pending': len(self._entries),
+          'delivered': self._delivered,
+          'failed': self._failed,
+          'retried': self._retried,
+          }
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare the batch codec with the email package based one it replaced.
+
+Builds a batch request body and parses a batch response of the given size
+with both implementations, checks that they agree byte for byte, and prints
+the time each one takes:
+
+  python benchmarks/batch_codec.py --requests 1000
+"""
+
+import StringIO
+import optparse
+import os
+import random
+import sys
+import time
+import urlparse
+from email.generator import Generator
+from email.mime.multipart import MIMEMultipart
+from email.mime.nonmultipart import MIMENonMultipart
+from email.parser import FeedParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import httplib2
+
+from apiclient import batchcodec
+
+
+def email_serialize_request(method, uri, headers, body):
+  parsed = urlparse.urlparse(uri)
+  request_line = urlparse.urlunparse(
+      (None, None, parsed.path, parsed.params, parsed.query, None))
+  status_line = method + ' ' + request_line + ' HTTP/1.1\n'
+  major, minor = headers.get('content-type', 'application/json').split('/')
+  msg = MIMENonMultipart(major, minor)
+  if 'content-type' in headers:
+    del headers['content-type']
+  for key, value in headers.iteritems():
+    msg[key] = value
+  msg['Host'] = parsed.netloc
+  msg.set_unixfrom(None)
+  if body is not None:
+    msg.set_payload(body)
+    msg['content-length'] = str(len(body))
+  fp = StringIO.StringIO()
+  g = Generator(fp, maxheaderlen=0)
+  g.flatten(msg, unixfrom=False)
+  out = fp.getvalue()
+  if body is None:
+    out = out[:-2]
+  return status_line.encode('utf-8') + out
+
+
+def email_write_mixed(parts):
+  message = MIMEMultipart('mixed')
+  setattr(message, '_write_headers', lambda self: None)
+  for content_id, payload in parts:
+    msg = MIMENonMultipart('application', 'http')
+    msg['Content-Transfer-Encoding'] = 'binary'
+    msg['Content-ID'] = content_id
+    msg.set_payload(payload)
+    message.attach(msg)
+  body = message.as_string()
+  return body, message.get_boundary()
+
+
+def email_iter_mixed(content, content_type):
+  parser = FeedParser()
+  parser.feed('content-type: %s\r\n\r\n' % content_type + content)
+  for part in parser.close().get_payload():
+    yield part['Content-ID'], part.get_payload()
+
+
+def email_parse_response(payload):
+  status_line, payload = payload.split('\n', 1)
+  protocol, status, reason = status_line.split(' ', 2)
+  parser = FeedParser()
+  parser.feed(payload)
+  msg = parser.close()
+  msg['status'] = status
+  resp = httplib2.Response(msg)
+  resp.reason = reason
+  resp.version = int(protocol.split('/', 1)[1].replace('.', ''))
+  content = payload.split('\r\n\r\n', 1)[1]
+  return resp, content
+
+
+def make_requests(count):
+  requests = []
+  for i in xrange(count):
+    if i % 2:
+      body = '{"summary": "Event %d", "description": "From here"}' % i
+      method = 'POST'
+    else:
+      body = None
+      method = 'GET'
+    headers = {
+        'content-type': 'application/json',
+        'accept': 'application/json',
+        'authorization': 'Bearer ya29.token',
+        }
+    uri = ('https://www.googleapis.com/calendar/v3/calendars/c%d/events'
+           '?alt=json&maxResults=250' % i)
+    requests.append(('<batch-id+%d>' % i, method, uri, headers, body))
+  return requests
+
+
+def make_response(count):
+  boundary = 'batch_abc123'
+  parts = []
+  for i in xrange(count):
+    body = '{"kind": "calendar#events", "items": [%s]}' % ','.join(
+        ['{"id": "e%d", "summary": "Event"}' % j for j in xrange(10)])
+    parts.append(
+        '--%s\r\nContent-Type: application/http\r\n'
+        'Content-ID: <response-batch-id+%d>\r\n\r\n'
+        'HTTP/1.1 200 OK\r\nContent-Type: application/json; charset=UTF-8\r\n'
+        'ETag: "tag%d"\r\nContent-Length: %d\r\n\r\n%s\r\n'
+        % (boundary, i, i, len(body), body))
+  content = ''.join(parts) + '--%s--\r\n' % boundary
+  return content, 'multipart/mixed; boundary=%s' % boundary
+
+
+def write(serialize, write_mixed, requests):
+  # Like BatchHttpRequest, serialize a copy of each request's headers.
+  return write_mixed(
+      [(content_id, serialize(method, uri, headers.copy(), body))
+       for content_id, method, uri, headers, body in requests])
+
+
+def parse(iter_mixed, parse_response, content, content_type):
+  return [(content_id, parse_response(payload))
+          for content_id, payload in iter_mixed(content, content_type)]
+
+
+def best_time(fn, repeat):
+  best = None
+  for _ in xrange(repeat):
+    start = time.time()
+    fn()
+    elapsed = time.time() - start
+    if best is None or elapsed < best:
+      best = elapsed
+  return best
+
+
+def main():
+  parser = optparse.OptionParser()
+  parser.add_option('--requests', type='int', default=1000)
+  parser.add_option('--repeat', type='int', default=5)
+  options, _ = parser.parse_args()
+
+  requests = make_requests(options.requests)
+  random.seed(0)
+  old_body = write(email_serialize_request, email_write_mixed, requests)
+  random.seed(0)
+  new_body = write(batchcodec.serialize_request, batchcodec.write_mixed,
+                   requests)
+  assert old_body == new_body, 'Request bodies differ.'
+
+  content, content_type = make_response(options.requests)
+  old_parts = parse(email_iter_mixed, email_parse_response, content,
+                    content_type)
+  new_parts = parse(batchcodec.iter_mixed, batchcodec.parse_response, content,
+                    content_type)
+  assert [(i, dict(r), c) for i, (r, c) in old_parts] == [
+      (i, dict(r), c) for i, (r, c) in new_parts], 'Responses differ.'
+
+  print '%d requests per batch, best of %d' % (options.requests,
+                                                options.repeat)
+  print '%-8s %10s %10s %8s' % ('', 'email', 'batchcodec', 'speedup')
+  for name, old, new in [
+      ('write',
+       lambda: write(email_serialize_request, email_write_mixed, requests),
+       lambda: write(batchcodec.serialize_request, batchcodec.write_mixed,
+                     requests)),
+      ('parse',
+       lambda: parse(email_iter_mixed, email_parse_response, content,
+                     content_type),
+       lambda: parse(batchcodec.iter_mixed, batchcodec.parse_response,
+                     content, content_type)),
+      ]:
+    old_time = best_time(old, options.repeat)
+    new_time = best_time(new, options.repeat)
+    print '%-8s %9.1fms %9.1fms %7.1fx' % (
+        name, old_time * 1000, new_time * 1000, old_time / new_time)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""End-to-end load test against the local Calendar API stand-in.
+
+Runs a number of clients, each on its own thread with its own http object and
+service built from the stand-in's discovery document, for a fixed time. Each
+client repeats the operations of the chosen workloads:
+
+  dashboard: list a year of events page by page, as handler.py does.
+  sync:      a full sync of a calendar once, then incremental syncs with the
+             nextSyncToken of the previous one, patching an event in between.
+  batch:     get events in batches.
+
+The stand-in runs in this process unless --discovery-url points at one
+started with calendar_server.py. For example:
+
+  python benchmarks/calendar_load.py --clients 16 --seconds 30 \\
+      --latency-ms 40 --error-rate 0.01 --workloads dashboard,sync
+
+--hedge-percentile sends GETs through an apiclient.hedge.RequestHedger, to
+compare tail latencies with and without hedging, and --breaker sends every
+request through an apiclient.breaker.CircuitBreaker.
+"""
+
+import optparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import httplib2
+
+from apiclient import futures
+from apiclient import http as apiclient_http
+from apiclient.breaker import CircuitBreaker
+from apiclient.discovery import build
+from apiclient.errors import CircuitOpenError
+from apiclient.errors import HttpError
+from apiclient.hedge import RequestHedger
+from apiclient.http import BatchHttpRequest
+
+import calendar_server
+
+WORKLOADS = ['dashboard', 'sync', 'batch']
+
+
+class _Stats(object):
+  """Latencies and failures of each operation, across all clients."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.latencies = {}
+    self.failures = {}
+    self.items = {}
+
+  def record(self, name, seconds, items):
+    with self._lock:
+      self.latencies.setdefault(name, []).append(seconds)
+      self.items[name] = self.items.get(name, 0) + items
+
+  def fail(self, name):
+    with self._lock:
+      self.failures[name] = self.failures.get(name, 0) + 1
+
+
+def _percentile(ordered, fraction):
+  return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class _Client(object):
+
+  def __init__(self, index, options, discovery_url, batch_uri, stats, pool):
+    self._options = options
+    self._stats = stats
+    self._pool = pool
+    self._batch_uri = batch_uri
+    self._rand = random.Random(index)
+    self._http = httplib2.Http()
+    self._service = build('calendar', 'v3', http=self._http,
+                          discoveryServiceUrl=discovery_url)
+    self._calendar_id = 'calendar%d' % (index % options.calendars)
+    self._sync_token = None
+    self._event_ids = []
+
+  def _dashboard(self):
+    year = self._options.year
+    request = self._service.events().list(
+        calendarId=self._calendar_id,
+        timeMin='%d-01-01T00:00:00Z' % year,
+        timeMax='%d-01-01T00:00:00Z' % (year + 1),
+        maxResults=self._options.page_size)
+    items = 0
+    for page in self._service.events().list_iter_pages(
+        request, num_retries=self._options.num_retries, pool=self._pool):
+      for event in page.get('items', []):
+        items += 1
+        if len(self._event_ids) < 1000:
+          self._event_ids.append(event['id'])
+    return items
+
+  def _sync(self):
+    events = self._service.events()
+    if self._sync_token is not None and self._event_ids:
+      events.patch(calendarId=self._calendar_id,
+                   eventId=self._rand.choice(self._event_ids),
+                   body={'description': 'edited at %f' % time.time()}
+                   ).execute(num_retries=self._options.num_retries)
+    request = events.list(calendarId=self._calendar_id,
+                          syncToken=self._sync_token,
+                          maxResults=self._options.page_size)
+    items = 0
+    page = None
+    try:
+      for page in events.list_iter_pages(
+          request, num_retries=self._options.num_retries, pool=self._pool):
+        for event in page.get('items', []):
+          items += 1
+          if len(self._event_ids) < 1000:
+            self._event_ids.append(event['id'])
+    except HttpError, e:
+      if e.resp.status != 410:
+        raise
+      # The token has expired, start over with a full sync.
+      self._sync_token = None
+      return self._sync()
+    self._sync_token = page.get('nextSyncToken')
+    return items
+
+  def _batch(self):
+    if not self._event_ids:
+      self._dashboard()
+    batch = BatchHttpRequest(batch_uri=self._batch_uri)
+    events = self._service.events()
+    for _ in xrange(self._options.batch_size):
+      batch.add(events.get(calendarId=self._calendar_id,
+                           eventId=self._rand.choice(self._event_ids)))
+    batch.execute(http=self._http, num_retries=self._options.num_retries)
+    return self._options.batch_size
+
+  def run(self, workloads, deadline):
+    while time.time() < deadline:
+      for name in workloads:
+        start = time.time()
+        try:
+          items = getattr(self, '_' + name)()
+        except (HttpError, CircuitOpenError):
+          self._stats.fail(name)
+        else:
+          self._stats.record(name, time.time() - start, items)
+
+
+def main():
+  parser = optparse.OptionParser()
+  parser.add_option('--clients', type='int', default=8)
+  parser.add_option('--seconds', type='float', default=10.0)
+  parser.add_option('--workloads', default='dashboard',
+                    help='comma separated, from %s' % ', '.join(WORKLOADS))
+  parser.add_option('--calendars', type='int', default=4)
+  parser.add_option('--events', type='int',
+                    default=calendar_server.DEFAULT_EVENTS_PER_CALENDAR)
+  parser.add_option('--year', type='int', default=time.gmtime().tm_year)
+  parser.add_option('--page-size', type='int', default=250)
+  parser.add_option('--batch-size', type='int', default=50)
+  parser.add_option('--num-retries', type='int', default=3)
+  parser.add_option('--latency-ms', type='float', default=20.0)
+  parser.add_option('--sigma', type='float', default=0.5)
+  parser.add_option('--error-rate', type='float', default=0.0)
+  parser.add_option('--rate-limit-rate', type='float', default=0.0)
+  parser.add_option('--hedge-percentile', type='float',
+                    help='hedge GETs slower than this percentile, such as '
+                    '0.95')
+  parser.add_option('--breaker', action='store_true',
+                    help='send requests through a circuit breaker')
+  parser.add_option('--discovery-url',
+                    help='use a stand-in that is already running')
+  options, _ = parser.parse_args()
+  workloads = options.workloads.split(',')
+  for name in workloads:
+    if name not in WORKLOADS:
+      parser.error('Unknown workload: %s' % name)
+
+  server = None
+  if options.discovery_url:
+    discovery_url = options.discovery_url
+    batch_uri = discovery_url.split('/discovery/')[0] + '/batch'
+  else:
+    store = calendar_server.CalendarStore(
+        events_per_calendar=options.events, year=options.year)
+    server = calendar_server.CalendarServer(
+        ('127.0.0.1', 0), store=store, latency=options.latency_ms / 1000.0,
+        sigma=options.sigma, error_rate=options.error_rate,
+        rate_limit_rate=options.rate_limit_rate)
+    server.start()
+    discovery_url = server.discovery_url
+    batch_uri = server.batch_uri
+
+  hedger = None
+  if options.hedge_percentile:
+    hedger = RequestHedger(httplib2.Http, percentile=options.hedge_percentile)
+    apiclient_http.request_hedger = hedger
+
+  breaker = None
+  if options.breaker:
+    breaker = CircuitBreaker(open_seconds=1.0)
+    apiclient_http.circuit_breaker = breaker
+
+  # Prefetching pages needs a thread per client, each with its own http.
+  pool = futures.WorkerPool(max_workers=options.clients,
+                            http_factory=httplib2.Http)
+  stats = _Stats()
+  clients = [_Client(i, options, discovery_url, batch_uri, stats, pool)
+             for i in xrange(options.clients)]
+  start = time.time()
+  deadline = start + options.seconds
+  threads = [threading.Thread(target=client.run, args=(workloads, deadline))
+             for client in clients]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  elapsed = time.time() - start
+  pool.shutdown()
+
+  print '%d clients for %.1fs' % (options.clients, elapsed)
+  print '%-10s %8s %8s %8s %9s %9s %9s %10s' % (
+      'workload', 'ops', 'ops/s', 'failed', 'p50 ms', 'p95 ms', 'p99 ms',
+      'items/s')
+  for name in workloads:
+    latencies = sorted(stats.latencies.get(name, []))
+    if not latencies:
+      print '%-10s %8d %8s %8d' % (name, 0, '-', stats.failures.get(name, 0))
+      continue
+    print '%-10s %8d %8.1f %8d %9.1f %9.1f %9.1f %10.0f' % (
+        name, len(latencies), len(latencies) / elapsed,
+        stats.failures.get(name, 0),
+        _percentile(latencies, 0.5) * 1000,
+        _percentile(latencies, 0.95) * 1000,
+        _percentile(latencies, 0.99) * 1000,
+        stats.items.get(name, 0) / elapsed)
+  if hedger is not None:
+    print 'hedger: %s' % ', '.join(
+        '%s=%d' % item for item in sorted(hedger.stats().iteritems()))
+    hedger.shutdown()
+  if breaker is not None:
+    for host, counts in sorted(breaker.stats().iteritems()):
+      print 'breaker %s: state=%s, %s' % (host, counts.pop('state'), ', '.join(
+          '%s=%d' % item for item in sorted(counts.iteritems())))
+  if server is not None:
+    print 'server: %s' % ', '.join(
+        '%s=%d' % item for item in sorted(server.api.counts.iteritems()))
+    server.stop()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,922 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A local stand-in for the Calendar API, for end-to-end load tests.
+
+Serves a discovery document for calendar v3 and the events collection of
+synthetic calendars that are generated from a seed the first time they are
+asked for:
+
+  events.list    pagination with pageToken and maxResults, timeMin and
+                 timeMax, showDeleted, incremental sync with syncToken and
+                 nextSyncToken, and If-None-Match revalidation.
+  events.get, insert, patch, update and delete.
+  fields         partial responses of any of the above.
+  /batch         multipart/mixed batches of any of the above.
+
+Latency and errors can be injected into every response. Point build() at the
+server's discovery URL to run the client against it:
+
+  server = CalendarServer(('127.0.0.1', 0), latency=0.05, error_rate=0.01)
+  server.start()
+  service = build('calendar', 'v3', http=httplib2.Http(),
+                  discoveryServiceUrl=server.discovery_url)
+
+or run it on its own:
+
+  python benchmarks/calendar_server.py --port 8090 --events 2000
+"""
+
+import BaseHTTPServer
+import SocketServer
+import base64
+import copy
+import datetime
+import hashlib
+import optparse
+import os
+import random
+import re
+import socket
+import sys
+import threading
+import time
+import urllib
+import urlparse
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from apiclient import batchcodec
+from apiclient.cassette import lognormal_latency
+from apiclient.errors import BatchError
+from oauth2client.anyjson import simplejson
+
+DEFAULT_EVENTS_PER_CALENDAR = 500
+DEFAULT_MAX_RESULTS = 250
+MAX_MAX_RESULTS = 2500
+
+# The users that synthetic events are created by, as in handler.py.
+DEFAULT_USERS = ('test', 'hyojun.im')
+
+# Kinds of synthetic events, with their relative frequency. handler.py tells
+# them apart by their summary or location.
+_EVENT_KINDS = [
+    ('work', 16),
+    ('nolunch', 2),
+    ('half', 1),
+    ('leave', 1),
+    ('holiday', 1),
+    ]
+
+_SERVICE_PATH = 'calendar/v3/'
+_EVENTS_PATH = '/' + _SERVICE_PATH + 'calendars/'
+
+
+def _string_param(location='query', required=False):
+  param = {'type': 'string', 'location': location}
+  if required:
+    param['required'] = True
+  return param
+
+
+def discovery_document(root_url):
+  """The subset of the calendar v3 discovery document the server implements.
+
+  Args:
+    root_url: string, the URL of the server, ending with a slash.
+
+  Returns:
+    The discovery document as a dict.
+  """
+  calendar_id = _string_param('path', required=True)
+  event_id = _string_param('path', required=True)
+  event_path = 'calendars/{calendarId}/events/{eventId}'
+  list_params = {
+      'calendarId': calendar_id,
+      'maxResults': {'type': 'integer', 'location': 'query', 'minimum': '1'},
+      'orderBy': _string_param(),
+      'pageToken': _string_param(),
+      'showDeleted': {'type': 'boolean', 'location': 'query'},
+      'singleEvents': {'type': 'boolean', 'location': 'query'},
+      'syncToken': _string_param(),
+      'timeMax': _string_param(),
+      'timeMin': _string_param(),
+      'updatedMin': _string_param(),
+      }
+  return {
+      'kind': 'discovery#restDescription',
+      'discoveryVersion': 'v1',
+      'id': 'calendar:v3',
+      'name': 'calendar',
+      'version': 'v3',
+      'protocol': 'rest',
+      'rootUrl': root_url,
+      'servicePath': _SERVICE_PATH,
+      'batchPath': 'batch',
+      'parameters': {
+          'alt': {'type': 'string', 'location': 'query', 'default': 'json',
+                  'enum': ['json']},
+          'fields': _string_param(),
+          'key': _string_param(),
+          'oauth_token': _string_param(),
+          'prettyPrint': {'type': 'boolean', 'location': 'query',
+                          'default': 'true'},
+          'quotaUser': _string_param(),
+          'userIp': _string_param(),
+          },
+      'schemas': {
+          'Events': {
+              'id': 'Events',
+              'type': 'object',
+              'properties': {
+                  'etag': {'type': 'string'},
+                  'items': {'type': 'array', 'items': {'$ref': 'Event'}},
+                  'kind': {'type': 'string'},
+                  'nextPageToken': {'type': 'string'},
+                  'nextSyncToken': {'type': 'string'},
+                  'summary': {'type': 'string'},
+                  'updated': {'type': 'string'},
+                  },
+              },
+          'Event': {
+              'id': 'Event',
+              'type': 'object',
+              'properties': {
+                  'creator': {'type': 'object'},
+                  'end': {'type': 'object'},
+                  'etag': {'type': 'string'},
+                  'id': {'type': 'string'},
+                  'kind': {'type': 'string'},
+                  'location': {'type': 'string'},
+                  'start': {'type': 'object'},
+                  'status': {'type': 'string'},
+                  'summary': {'type': 'string'},
+                  'updated': {'type': 'string'},
+                  },
+              },
+          },
+      'resources': {
+          'events': {
+              'methods': {
+                  'list': {
+                      'id': 'calendar.events.list',
+                      'path': 'calendars/{calendarId}/events',
+                      'httpMethod': 'GET',
+                      'parameters': list_params,
+                      'parameterOrder': ['calendarId'],
+                      'response': {'$ref': 'Events'},
+                      },
+                  'get': {
+                      'id': 'calendar.events.get',
+                      'path': event_path,
+                      'httpMethod': 'GET',
+                      'parameters': {'calendarId': calendar_id,
+                                     'eventId': event_id},
+                      'parameterOrder': ['calendarId', 'eventId'],
+                      'response': {'$ref': 'Event'},
+                      },
+                  'insert': {
+                      'id': 'calendar.events.insert',
+                      'path': 'calendars/{calendarId}/events',
+                      'httpMethod': 'POST',
+                      'parameters': {'calendarId': calendar_id},
+                      'parameterOrder': ['calendarId'],
+                      'request': {'$ref': 'Event'},
+                      'response': {'$ref': 'Event'},
+                      },
+                  'patch': {
+                      'id': 'calendar.events.patch',
+                      'path': event_path,
+                      'httpMethod': 'PATCH',
+                      'parameters': {'calendarId': calendar_id,
+                                     'eventId': event_id},
+                      'parameterOrder': ['calendarId', 'eventId'],
+                      'request': {'$ref': 'Event'},
+                      'response': {'$ref': 'Event'},
+                      },
+                  'update': {
+                      'id': 'calendar.events.update',
+                      'path': event_path,
+                      'httpMethod': 'PUT',
+                      'parameters': {'calendarId': calendar_id,
+                                     'eventId': event_id},
+                      'parameterOrder': ['calendarId', 'eventId'],
+                      'request': {'$ref': 'Event'},
+                      'response': {'$ref': 'Event'},
+                      },
+                  'delete': {
+                      'id': 'calendar.events.delete',
+                      'path': event_path,
+                      'httpMethod': 'DELETE',
+                      'parameters': {'calendarId': calendar_id,
+                                     'eventId': event_id},
+                      'parameterOrder': ['calendarId', 'eventId'],
+                      },
+                  },
+              },
+          },
+      }
+
+
+def _error(code, reason, message, domain='global'):
+  return code, {}, simplejson.dumps({
+      'error': {
+          'errors': [{'domain': domain, 'reason': reason, 'message': message}],
+          'code': code,
+          'message': message,
+          }
+      })
+
+
+_FIELD_NAME = re.compile(r'[A-Za-z0-9_]+')
+
+
+def _parse_fields(text, pos=0):
+  """Parse a fields parameter, such as 'items(id,start/dateTime)'.
+
+  Returns:
+    (tree, pos): a dict mapping each field selected to the tree of the
+    fields selected inside it, or to None for the whole field, and the
+    offset just past the selection.
+  """
+  tree = {}
+  while True:
+    node = tree
+    while True:
+      match = _FIELD_NAME.match(text, pos)
+      if match is None:
+        raise ValueError('Invalid field selection at %d' % pos)
+      name, pos = match.group(), match.end()
+      if text[pos:pos + 1] == '/':
+        node = node.setdefault(name, {})
+        if node is None:
+          # The whole field is already selected.
+          node = {}
+        pos += 1
+        continue
+      if text[pos:pos + 1] == '(':
+        sub, pos = _parse_fields(text, pos + 1)
+        if text[pos:pos + 1] != ')':
+          raise ValueError('Invalid field selection at %d' % pos)
+        pos += 1
+        if node.get(name, {}) is not None:
+          node.setdefault(name, {}).update(sub)
+      else:
+        node[name] = None
+      break
+    if text[pos:pos + 1] != ',':
+      return tree, pos
+    pos += 1
+
+
+def _select(value, tree):
+  """Keep only the fields of value selected by a tree from _parse_fields."""
+  if tree is None:
+    return value
+  if isinstance(value, list):
+    return [_select(item, tree) for item in value]
+  if isinstance(value, dict):
+    return dict((key, _select(item, tree[key]))
+                for key, item in value.iteritems() if key in tree)
+  return value
+
+
+def _encode_token(values):
+  return base64.urlsafe_b64encode(simplejson.dumps(values))
+
+
+def _decode_token(token):
+  """Decode a page or sync token, or return None if it is malformed."""
+  try:
+    return simplejson.loads(base64.urlsafe_b64decode(str(token)))
+  except (TypeError, ValueError):
+    return None
+
+
+def _time_key(when):
+  """A sortable string for the start or end of an event."""
+  if 'dateTime' in when:
+    return when['dateTime']
+  return when.get('date', '') + 'T00:00:00Z'
+
+
+def _timestamp(version):
+  # Spread updates a second apart from a fixed epoch so that they are stable.
+  updated = datetime.datetime(2014, 1, 1) + datetime.timedelta(seconds=version)
+  return updated.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+class _Calendar(object):
+  """The events of one calendar, in order of their start."""
+
+  def __init__(self, calendar_id, events):
+    self.calendar_id = calendar_id
+    self.events = dict((event['id'], event) for event in events)
+    self.ordered = None
+    # Sync tokens issued before this version can no longer be honoured.
+    self.created = max([0] + [event['_version'] for event in events])
+    # The version of the last write to the calendar.
+    self.version = self.created
+
+  def sorted_events(self):
+    if self.ordered is None:
+      self.ordered = sorted(
+          self.events.itervalues(),
+          key=lambda event: (_time_key(event['start']), event['id']))
+    return self.ordered
+
+
+class CalendarStore(object):
+  """Synthetic calendars, generated the first time each one is asked for.
+
+  Every calendar id gets its own events, derived from the seed and the id, so
+  that separate runs see the same data. Writes bump a store-wide version that
+  sync tokens refer to.
+  """
+
+  def __init__(self, events_per_calendar=DEFAULT_EVENTS_PER_CALENDAR,
+               year=None, users=DEFAULT_USERS, seed=0):
+    """Constructor.
+
+    Args:
+      events_per_calendar: int, the number of events in a new calendar.
+      year: int, the year the events fall in. Defaults to the current year.
+      users: sequence of string, the nicknames of the event creators.
+      seed: int, varies the generated events.
+    """
+    self._events_per_calendar = events_per_calendar
+    self._year = year or datetime.date.today().year
+    self._users = list(users)
+    self._seed = seed
+    self._lock = threading.Lock()
+    self._calendars = {}
+    self._version = 0
+
+  def _generate(self, calendar_id):
+    rand = random.Random(zlib.crc32('%d:%s' % (self._seed, calendar_id)))
+    kinds = []
+    for kind, weight in _EVENT_KINDS:
+      kinds.extend([kind] * weight)
+    first = datetime.date(self._year, 1, 1)
+    days = (datetime.date(self._year + 1, 1, 1) - first).days
+    events = []
+    for i in xrange(self._events_per_calendar):
+      kind = rand.choice(kinds)
+      day = first + datetime.timedelta(rand.randrange(days))
+      event = {
+          'kind': 'calendar#event',
+          'id': 'e%s%d' % (hashlib.md5(calendar_id).hexdigest()[:8], i),
+          'status': 'confirmed',
+          'creator': {'email': rand.choice(self._users) + '@gmail.com'},
+          }
+      if kind in ('work', 'nolunch'):
+        start = rand.randrange(7, 12)
+        end = start + rand.randrange(4, 10)
+        event['summary'] = 'work'
+        if kind == 'nolunch':
+          event['location'] = 'nolunch'
+        event['start'] = {'dateTime': '%sT%02d:00:00Z' % (day, start)}
+        event['end'] = {'dateTime': '%sT%02d:00:00Z' % (day, min(end, 23))}
+      else:
+        length = 1 if kind == 'half' else rand.randrange(1, 4)
+        event['summary'] = kind
+        event['location'] = kind
+        event['start'] = {'date': str(day)}
+        event['end'] = {'date': str(day + datetime.timedelta(length))}
+      self._version += 1
+      self._stamp(event)
+      events.append(event)
+    return _Calendar(calendar_id, events)
+
+  def _stamp(self, event):
+    """Mark an event as written at the current version. Must hold the lock."""
+    event['_version'] = self._version
+    event['etag'] = '"%d"' % self._version
+    event['updated'] = _timestamp(self._version)
+
+  def _calendar(self, calendar_id):
+    """Get a calendar, generating it if needed. Must hold the lock."""
+    calendar = self._calendars.get(calendar_id)
+    if calendar is None:
+      calendar = self._generate(calendar_id)
+      self._calendars[calendar_id] = calendar
+    return calendar
+
+  def list(self, calendar_id, params):
+    """Handle events.list.
+
+    Args:
+      calendar_id: string, the calendar.
+      params: dict, the query parameters of the request.
+
+    Returns:
+      (status, headers, body).
+    """
+    sync_token = params.get('syncToken')
+    if sync_token and ('timeMin' in params or 'timeMax' in params or
+                       'updatedMin' in params):
+      return _error(400, 'invalid',
+                    'Sync token can not be used with time restrictions.')
+    try:
+      max_results = min(int(params.get('maxResults', DEFAULT_MAX_RESULTS)),
+                        MAX_MAX_RESULTS)
+    except ValueError:
+      return _error(400, 'invalid', 'Invalid value for maxResults.')
+    if max_results < 1:
+      return _error(400, 'invalid', 'Invalid value for maxResults.')
+
+    page_token = params.get('pageToken')
+    offset = 0
+    if page_token:
+      decoded = _decode_token(page_token)
+      if not isinstance(decoded, list) or len(decoded) != 2:
+        return _error(400, 'invalid', 'Invalid page token value.')
+      offset, snapshot = decoded
+
+    with self._lock:
+      calendar = self._calendar(calendar_id)
+      if page_token:
+        version = snapshot
+      else:
+        version = calendar.version
+      since = None
+      if sync_token:
+        decoded = _decode_token(sync_token)
+        if (not isinstance(decoded, list) or len(decoded) != 2 or
+            decoded[0] != calendar_id):
+          return _error(400, 'invalid', 'Invalid sync token value.')
+        since = decoded[1]
+        if since < calendar.created:
+          return _error(410, 'fullSyncRequired',
+                        'Sync token is no longer valid, a full sync is '
+                        'required.')
+
+      show_deleted = since is not None or params.get('showDeleted') == 'true'
+      time_min = params.get('timeMin')
+      time_max = params.get('timeMax')
+      updated_min = params.get('updatedMin')
+      matched = []
+      for event in calendar.sorted_events():
+        # Writes made after the first page was served wait for the next sync.
+        if event['_version'] > version:
+          continue
+        if since is not None and event['_version'] <= since:
+          continue
+        if event['status'] == 'cancelled' and not show_deleted:
+          continue
+        if time_min and _time_key(event['end']) <= time_min:
+          continue
+        if time_max and _time_key(event['start']) >= time_max:
+          continue
+        if updated_min and event['updated'] < updated_min:
+          continue
+        matched.append(event)
+
+    page = matched[offset:offset + max_results]
+    result = {
+        'kind': 'calendar#events',
+        'summary': calendar_id,
+        'updated': _timestamp(version),
+        'items': [self._public(event) for event in page],
+        }
+    if offset + max_results < len(matched):
+      result['nextPageToken'] = _encode_token([offset + max_results, version])
+    else:
+      result['nextSyncToken'] = _encode_token([calendar_id, version])
+    body = simplejson.dumps(result, sort_keys=True)
+    etag = '"%s"' % hashlib.md5(body).hexdigest()
+    result['etag'] = etag
+    return 200, {'etag': etag}, simplejson.dumps(result, sort_keys=True)
+
+  def _public(self, event):
+    return dict((k, v) for k, v in event.iteritems() if not k.startswith('_'))
+
+  def get(self, calendar_id, event_id):
+    with self._lock:
+      event = self._calendar(calendar_id).events.get(event_id)
+      if event is None:
+        return _error(404, 'notFound', 'Not Found')
+      return 200, {'etag': event['etag']}, simplejson.dumps(
+          self._public(event))
+
+  def write(self, calendar_id, event_id, body, replace=False):
+    """Handle events.insert, patch and update.
+
+    Args:
+      calendar_id: string, the calendar.
+      event_id: string, the event to change, or None to insert one.
+      body: dict, the event resource sent.
+      replace: bool, if True replace the event rather than patch it.
+
+    Returns:
+      (status, headers, body).
+    """
+    with self._lock:
+      calendar = self._calendar(calendar_id)
+      if event_id is None:
+        event_id = body.get('id') or 'n%s' % hashlib.md5(
+            '%s:%d' % (calendar_id, self._version)).hexdigest()[:16]
+        if event_id in calendar.events:
+          return _error(409, 'duplicate', 'The requested identifier already '
+                        'exists.')
+        event = {'kind': 'calendar#event', 'id': event_id,
+                 'status': 'confirmed'}
+      else:
+        event = calendar.events.get(event_id)
+        if event is None:
+          return _error(404, 'notFound', 'Not Found')
+        event = copy.deepcopy(event)
+        if replace:
+          event = {'kind': 'calendar#event', 'id': event_id,
+                   'status': 'confirmed', 'creator': event.get('creator')}
+      for key, value in body.iteritems():
+        if key in ('id', 'kind', 'etag', 'updated') or key.startswith('_'):
+          continue
+        if value is None:
+          event.pop(key, None)
+        else:
+          event[key] = value
+      if 'start' not in event or 'end' not in event:
+        return _error(400, 'required', 'Missing end time.')
+      self._version += 1
+      self._stamp(event)
+      calendar.events[event_id] = event
+      calendar.ordered = None
+      calendar.version = self._version
+      return 200, {'etag': event['etag']}, simplejson.dumps(
+          self._public(event))
+
+  def delete(self, calendar_id, event_id):
+    with self._lock:
+      calendar = self._calendar(calendar_id)
+      event = calendar.events.get(event_id)
+      if event is None or event['status'] == 'cancelled':
+        return _error(410, 'deleted', 'Resource has been deleted')
+      # Keep a tombstone so that incremental syncs see the deletion.
+      event = dict(event, status='cancelled')
+      self._version += 1
+      self._stamp(event)
+      calendar.events[event_id] = event
+      calendar.ordered = None
+      calendar.version = self._version
+      return 204, {}, ''
+
+
+class CalendarApi(object):
+  """Routes requests to a CalendarStore and injects latency and errors."""
+
+  def __init__(self, store, latency=0.0, sigma=0.5, error_rate=0.0,
+               rate_limit_rate=0.0, seed=0):
+    """Constructor.
+
+    Args:
+      store: CalendarStore, the calendars served.
+      latency: float, the median number of seconds each HTTP request takes.
+      sigma: float, the spread of latencies around the median, as for
+        apiclient.cassette.lognormal_latency. 0 makes every request take the
+        median.
+      error_rate: float, the fraction of calls that fail with a 503.
+      rate_limit_rate: float, the fraction of calls that fail with a 403
+        rateLimitExceeded.
+      seed: int, seeds the injected latencies and errors.
+    """
+    self.store = store
+    self._rand = random.Random(seed)
+    self._rand_lock = threading.Lock()
+    self._latency = None
+    if latency > 0:
+      if sigma > 0:
+        self._latency = lognormal_latency(latency, sigma, rand=self._rand)
+      else:
+        self._latency = lambda recorded: latency
+    self._error_rate = error_rate
+    self._rate_limit_rate = rate_limit_rate
+    self.root_url = None
+    self._counts_lock = threading.Lock()
+    self.counts = {}
+
+    # Stubs for testing.
+    self._sleep = time.sleep
+
+  def _count(self, name):
+    with self._counts_lock:
+      self.counts[name] = self.counts.get(name, 0) + 1
+
+  def delay(self):
+    """Wait for the injected latency of one HTTP request."""
+    if self._latency is None:
+      return
+    with self._rand_lock:
+      seconds = self._latency(None)
+    self._sleep(seconds)
+
+  def _fault(self):
+    """An injected error response, or None."""
+    if not self._error_rate and not self._rate_limit_rate:
+      return None
+    with self._rand_lock:
+      roll = self._rand.random()
+    if roll < self._error_rate:
+      self._count('backendError')
+      return _error(503, 'backendError', 'Backend Error')
+    if roll < self._error_rate + self._rate_limit_rate:
+      self._count('rateLimitExceeded')
+      return _error(403, 'rateLimitExceeded', 'Rate Limit Exceeded',
+                    domain='usageLimits')
+    return None
+
+  def handle(self, method, path, headers, body):
+    """Answer one call.
+
+    Args:
+      method: string, the HTTP method.
+      path: string, the path and query of the request.
+      headers: dict, the request headers, with lowercase names.
+      body: string, the request body.
+
+    Returns:
+      (status, headers, body) of the response.
+    """
+    parsed = urlparse.urlparse(path)
+    params = dict(urlparse.parse_qsl(parsed.query))
+    segments = [urllib.unquote(s) for s in parsed.path.split('/')]
+
+    if parsed.path.startswith('/discovery/v1/apis/'):
+      self._count('discovery')
+      if segments[4:] != ['calendar', 'v3', 'rest']:
+        return _error(404, 'notFound', 'Not Found')
+      return 200, {}, simplejson.dumps(discovery_document(self.root_url))
+
+    if not parsed.path.startswith(_EVENTS_PATH):
+      return _error(404, 'notFound', 'Not Found')
+    # ['', 'calendar', 'v3', 'calendars', calendarId, 'events', eventId]
+    segments = segments[4:]
+    if len(segments) not in (2, 3) or segments[1] != 'events':
+      return _error(404, 'notFound', 'Not Found')
+    calendar_id = segments[0]
+    event_id = segments[2] if len(segments) == 3 else None
+
+    fault = self._fault()
+    if fault is not None:
+      return fault
+
+    if event_id is None and method == 'GET':
+      self._count('list')
+      status, response_headers, content = self.store.list(calendar_id, params)
+    elif event_id is None and method == 'POST':
+      self._count('insert')
+      status, response_headers, content = self._write(calendar_id, None, body)
+    elif event_id is None:
+      return _error(405, 'methodNotAllowed', 'Method Not Allowed')
+    elif method == 'GET':
+      self._count('get')
+      status, response_headers, content = self.store.get(calendar_id, event_id)
+    elif method in ('PATCH', 'PUT'):
+      self._count(method == 'PUT' and 'update' or 'patch')
+      status, response_headers, content = self._write(
+          calendar_id, event_id, body, replace=(method == 'PUT'))
+    elif method == 'DELETE':
+      self._count('delete')
+      return self.store.delete(calendar_id, event_id)
+    else:
+      return _error(405, 'methodNotAllowed', 'Method Not Allowed')
+
+    if 'fields' in params and status == 200:
+      try:
+        tree, end = _parse_fields(params['fields'])
+        if end != len(params['fields']):
+          raise ValueError('Invalid field selection at %d' % end)
+      except ValueError, e:
+        return _error(400, 'invalidParameter', str(e))
+      content = simplejson.dumps(_select(simplejson.loads(content), tree))
+
+    etag = response_headers.get('etag')
+    if (status == 200 and method == 'GET' and etag and
+        headers.get('if-none-match') == etag):
+      self._count('notModified')
+      return 304, {'etag': etag}, ''
+    return status, response_headers, content
+
+  def _write(self, calendar_id, event_id, body, replace=False):
+    try:
+      resource = simplejson.loads(body or '{}')
+    except ValueError:
+      return _error(400, 'parseError', 'Parse Error')
+    if not isinstance(resource, dict):
+      return _error(400, 'parseError', 'Parse Error')
+    return self.store.write(calendar_id, event_id, resource, replace=replace)
+
+  def handle_batch(self, headers, body):
+    """Answer a multipart/mixed batch of calls.
+
+    Args:
+      headers: dict, the request headers, with lowercase names.
+      body: string, the multipart/mixed request body.
+
+    Returns:
+      (status, headers, body) of the response.
+    """
+    self._count('batch')
+    try:
+      parts = list(batchcodec.iter_mixed(body,
+                                         headers.get('content-type', '')))
+    except BatchError:
+      return _error(400, 'badContent', 'Batch requests must be '
+                    'multipart/mixed.')
+
+    responses = []
+    for content_id, payload in parts:
+      payload = payload.replace('\r\n', '\n')
+      request_line, _, rest = payload.partition('\n')
+      method, path = request_line.split(' ')[:2]
+      head, _, part_body = rest.partition('\n\n')
+      part_headers = {}
+      for line in head.split('\n'):
+        name, colon, value = line.partition(':')
+        if colon:
+          part_headers[name.strip().lower()] = value.strip()
+
+      status, response_headers, content = self.handle(
+          method, path, part_headers, part_body)
+      lines = ['HTTP/1.1 %d %s' % (
+          status, BaseHTTPServer.BaseHTTPRequestHandler.responses.get(
+              status, ('Unknown',))[0])]
+      if content:
+        lines.append('Content-Type: application/json; charset=UTF-8')
+      for name, value in sorted(response_headers.iteritems()):
+        lines.append('%s: %s' % (name, value))
+      lines.append('Content-Length: %d' % len(content))
+      lines.append('')
+      lines.append(content)
+      if content_id and content_id.startswith('<'):
+        response_id = '<response-' + content_id[1:]
+      else:
+        response_id = content_id or ''
+      responses.append((response_id, '\r\n'.join(lines)))
+
+    content, boundary = batchcodec.write_mixed(responses)
+    return 200, {
+        'content-type': 'multipart/mixed; boundary=%s' % boundary}, content
+
+
+class _CalendarHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+  protocol_version = 'HTTP/1.1'
+  # Write each response in one go rather than a line at a time, which would
+  # leave clients of kept-alive connections waiting on delayed ACKs.
+  wbufsize = -1
+
+  def log_message(self, *args):
+    if self.server.verbose:
+      BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, *args)
+
+  def _dispatch(self):
+    length = int(self.headers.get('content-length') or 0)
+    body = self.rfile.read(length) if length else ''
+    headers = dict((name.lower(), value)
+                   for name, value in self.headers.items())
+    api = self.server.api
+    api.delay()
+    if self.command == 'POST' and self.path.split('?')[0] == '/batch':
+      status, response_headers, content = api.handle_batch(headers, body)
+    else:
+      status, response_headers, content = api.handle(
+          self.command, self.path, headers, body)
+
+    self.send_response(status)
+    if content and 'content-type' not in response_headers:
+      self.send_header('content-type', 'application/json; charset=UTF-8')
+    for name, value in response_headers.iteritems():
+      self.send_header(name, value)
+    self.send_header('content-length', str(len(content)))
+    self.end_headers()
+    self.wfile.write(content)
+
+  do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _dispatch
+
+
+class CalendarServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+  """An HTTP server for a CalendarApi, one thread per connection."""
+
+  daemon_threads = True
+  allow_reuse_address = True
+
+  def __init__(self, address, store=None, verbose=False, **kwargs):
+    """Constructor.
+
+    Args:
+      address: (host, port), where to listen. Port 0 picks a free one.
+      store: CalendarStore, the calendars served. Defaults to a new one.
+      verbose: bool, whether to log every request.
+      **kwargs: passed on to CalendarApi, to inject latency and errors.
+    """
+    BaseHTTPServer.HTTPServer.__init__(self, address, _CalendarHandler)
+    self.api = CalendarApi(store or CalendarStore(), **kwargs)
+    self.api.root_url = 'http://%s:%d/' % self.server_address[:2]
+    self.verbose = verbose
+    self._thread = None
+    self._connections_lock = threading.Lock()
+    self._connections = set()
+
+  @property
+  def discovery_url(self):
+    """The URI template to pass to build() as discoveryServiceUrl."""
+    return self.api.root_url + 'discovery/v1/apis/{api}/{apiVersion}/rest'
+
+  @property
+  def batch_uri(self):
+    """The URI to pass to BatchHttpRequest as batch_uri."""
+    return self.api.root_url + 'batch'
+
+  def process_request(self, request, client_address):
+    with self._connections_lock:
+      self._connections.add(request)
+    SocketServer.ThreadingMixIn.process_request(self, request, client_address)
+
+  def shutdown_request(self, request):
+    with self._connections_lock:
+      self._connections.discard(request)
+    BaseHTTPServer.HTTPServer.shutdown_request(self, request)
+
+  def handle_error(self, request, client_address):
+    # Clients that give up on a request, after a deadline or because a hedged
+    # request won, close their end of the connection.
+    if not isinstance(sys.exc_info()[1], socket.error):
+      BaseHTTPServer.HTTPServer.handle_error(self, request, client_address)
+
+  def start(self):
+    """Serve on a background thread."""
+    self._thread = threading.Thread(target=self.serve_forever)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def stop(self):
+    """Stop serving and close the connections clients have kept open."""
+    self.shutdown()
+    self.server_close()
+    with self._connections_lock:
+      connections = list(self._connections)
+    for connection in connections:
+      try:
+        connection.shutdown(socket.SHUT_RDWR)
+      except socket.error:
+        pass
+    # Let the handler threads see the connections close before returning.
+    deadline = time.time() + 1.0
+    while self._connections and time.time() < deadline:
+      time.sleep(0.01)
+
+
+def main():
+  parser = optparse.OptionParser()
+  parser.add_option('--host', default='127.0.0.1')
+  parser.add_option('--port', type='int', default=8090)
+  parser.add_option('--events', type='int', default=DEFAULT_EVENTS_PER_CALENDAR,
+                    help='events in each calendar')
+  parser.add_option('--year', type='int', help='year the events fall in')
+  parser.add_option('--users', default=','.join(DEFAULT_USERS),
+                    help='comma separated nicknames of event creators')
+  parser.add_option('--seed', type='int', default=0)
+  parser.add_option('--latency-ms', type='float', default=0.0,
+                    help='median latency of each request')
+  parser.add_option('--sigma', type='float', default=0.5,
+                    help='spread of the lognormal latency, 0 for constant')
+  parser.add_option('--error-rate', type='float', default=0.0,
+                    help='fraction of calls failing with 503')
+  parser.add_option('--rate-limit-rate', type='float', default=0.0,
+                    help='fraction of calls failing with 403 '
+                    'rateLimitExceeded')
+  parser.add_option('--verbose', action='store_true')
+  options, _ = parser.parse_args()
+
+  store = CalendarStore(events_per_calendar=options.events, year=options.year,
+                        users=options.users.split(','), seed=options.seed)
+  server = CalendarServer(
+      (options.host, options.port), store=store, verbose=options.verbose,
+      latency=options.latency_ms / 1000.0, sigma=options.sigma,
+      error_rate=options.error_rate,
+      rate_limit_rate=options.rate_limit_rate, seed=options.seed)
+  print 'Discovery: %s' % server.discovery_url
+  print 'Batch:     %s' % server.batch_uri
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare a listing with and without learned field masks.
+
+Lists every event of a calendar on the Calendar API stand-in in
+calendar_server.py a number of times, reading only the summary and start of
+each event the way handler.py does, once without field masks and once with
+apiclient.http.field_masks set. Prints the bytes downloaded, the time taken
+and the mask that was learned:
+
+  python benchmarks/field_masks.py --events 5000 --rounds 5
+"""
+
+import optparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import httplib2
+
+from apiclient import http as apiclient_http
+from apiclient.discovery import build
+from apiclient.fieldmask import FieldMaskTracker
+
+import calendar_server
+
+
+class _CountingHttp(httplib2.Http):
+  """Counts the bytes of the response bodies received."""
+
+  received = 0
+
+  def request(self, *args, **kwargs):
+    resp, content = httplib2.Http.request(self, *args, **kwargs)
+    self.received += len(content)
+    return resp, content
+
+
+def list_all(service, page_size):
+  """Read the summary and start of every event, as handler.py does."""
+  days = set()
+  events = service.events()
+  request = events.list(calendarId='primary', maxResults=page_size)
+  while request is not None:
+    page = request.execute()
+    for event in page['items']:
+      if event['summary'] == 'work':
+        days.add(event['start'].get('dateTime', '')[:10])
+      else:
+        days.add(event['start'].get('date'))
+    request = events.list_next(request, page)
+  return len(days)
+
+
+def run(server, rounds, page_size, tracker):
+  apiclient_http.field_masks = tracker
+  try:
+    http = _CountingHttp()
+    service = build('calendar', 'v3', http=http,
+                    discoveryServiceUrl=server.discovery_url)
+    http.received = 0
+    start = time.time()
+    for _ in xrange(rounds):
+      days = list_all(service, page_size)
+    return time.time() - start, http.received, days
+  finally:
+    apiclient_http.field_masks = None
+
+
+def main():
+  parser = optparse.OptionParser()
+  parser.add_option('--events', type='int', default=5000)
+  parser.add_option('--page-size', type='int', default=250)
+  parser.add_option('--rounds', type='int', default=5)
+  parser.add_option('--warmup', type='int', default=5)
+  options, _ = parser.parse_args()
+
+  server = calendar_server.CalendarServer(
+      ('127.0.0.1', 0),
+      store=calendar_server.CalendarStore(events_per_calendar=options.events))
+  server.start()
+
+  print '%d events in pages of %d, listed %d times' % (
+      options.events, options.page_size, options.rounds)
+  print '%-8s %10s %12s %6s' % ('masks', 'seconds', 'MB received', 'days')
+  tracker = FieldMaskTracker(warmup=options.warmup)
+  try:
+    for name, masks in (('off', None), ('learned', tracker)):
+      elapsed, received, days = run(server, options.rounds,
+                                    options.page_size, masks)
+      print '%-8s %10.2f %12.2f %6d' % (name, elapsed, received / 1e6, days)
+  finally:
+    server.stop()
+  stats = tracker.stats()['calendar.events.list']
+  print 'mask: %s' % stats['mask']
+  print '%d of %d requests masked, %d unlisted reads' % (
+      stats['masked'], stats['responses'], stats['unlisted'])
+
+
+if __name__ == '__main__':
+  main()
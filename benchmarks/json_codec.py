@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare the JSON codecs installed for JsonModel.
+
+Takes pages of events.list responses and single events from the Calendar
+API stand-in in calendar_server.py, checks that every codec parses them to
+the same objects, and prints the time JsonModel takes to deserialize the
+pages and to serialize the events with each codec. 'legacy' is what JsonModel
+did before it had codecs: decode the body from UTF-8, then parse it with
+anyjson.simplejson.
+
+  python benchmarks/json_codec.py --pages 20 --page-size 250
+"""
+
+import gc
+import optparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from apiclient.model import JsonModel
+from oauth2client import anyjson
+from oauth2client.anyjson import simplejson
+
+import calendar_server
+
+
+def legacy_codec():
+  return anyjson.JsonCodec(
+      'legacy', lambda content: simplejson.loads(content.decode('utf-8')),
+      simplejson.dumps)
+
+
+def make_pages(pages, page_size):
+  """Get list pages, as the bytes sent on the wire, from the stand-in."""
+  store = calendar_server.CalendarStore(events_per_calendar=pages * page_size)
+  api = calendar_server.CalendarApi(store)
+  result = []
+  path = '/calendar/v3/calendars/primary/events?maxResults=%d' % page_size
+  while len(result) < pages:
+    _, _, body = api.handle('GET', path, {}, '')
+    result.append(body)
+    token = simplejson.loads(body).get('nextPageToken')
+    if token is None:
+      break
+    path = ('/calendar/v3/calendars/primary/events?maxResults=%d'
+            '&pageToken=%s' % (page_size, token))
+  return result
+
+
+def best_time(fn, repeat):
+  best = None
+  for _ in xrange(repeat):
+    # The collector would otherwise run at different points for each codec.
+    gc.collect()
+    gc.disable()
+    try:
+      start = time.time()
+      fn()
+      elapsed = time.time() - start
+    finally:
+      gc.enable()
+    if best is None or elapsed < best:
+      best = elapsed
+  return best
+
+
+def main():
+  parser = optparse.OptionParser()
+  parser.add_option('--pages', type='int', default=20)
+  parser.add_option('--page-size', type='int', default=250)
+  parser.add_option('--repeat', type='int', default=5)
+  options, _ = parser.parse_args()
+
+  pages = make_pages(options.pages, options.page_size)
+  events = [event for page in pages
+            for event in simplejson.loads(page)['items']]
+  size = sum(len(page) for page in pages)
+
+  codecs = [legacy_codec()] + [anyjson.get_codec(name)
+                               for name in anyjson.available_codecs()]
+  expected = [simplejson.loads(page) for page in pages]
+  for codec in codecs:
+    model = JsonModel(codec=codec)
+    assert [model.deserialize(page) for page in pages] == expected, (
+        '%s parses differently.' % codec.name)
+    assert [simplejson.loads(model.serialize(event)) for event in events] == (
+        events), '%s serializes differently.' % codec.name
+
+  print '%d pages of %d events, %.1f MB, best of %d' % (
+      len(pages), options.page_size, size / 1e6, options.repeat)
+  print 'default codec: %s' % anyjson.get_codec().name
+  print '%-12s %12s %8s %12s %8s' % ('codec', 'deserialize', 'MB/s',
+                                     'serialize', 'speedup')
+  baseline = None
+  for codec in codecs:
+    model = JsonModel(codec=codec)
+    load_time = best_time(
+        lambda: [model.deserialize(page) for page in pages], options.repeat)
+    dump_time = best_time(
+        lambda: [model.serialize(event) for event in events], options.repeat)
+    if baseline is None:
+      baseline = load_time + dump_time
+    print '%-12s %10.1fms %8.1f %10.1fms %7.2fx' % (
+        codec.name, load_time * 1000, size / 1e6 / load_time,
+        dump_time * 1000, baseline / (load_time + dump_time))
+
+
+if __name__ == '__main__':
+  main()
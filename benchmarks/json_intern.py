@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure the memory an Interner saves on responses that are kept.
+
+Deserializes events.list responses from the Calendar API stand-in in
+calendar_server.py with and without an Interner, in a fresh process each so
+that freed memory isn't reused, and prints how much resident memory the
+kept responses take:
+
+  pages: every page of one long listing, held in a list.
+  cache: the first page of many calendars, held in an
+         apiclient.cache.ResponseCache.
+
+  python benchmarks/json_intern.py --pages 20 --page-size 250
+"""
+
+import gc
+import optparse
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from apiclient.cache import ResponseCache
+from apiclient.model import Interner
+from apiclient.model import JsonModel
+
+import calendar_server
+
+SCENARIOS = ['pages', 'cache']
+
+_PAGE_SIZE = resource.getpagesize()
+
+
+def rss():
+  """The resident memory of this process, in bytes."""
+  f = open('/proc/self/statm')
+  try:
+    return int(f.read().split()[1]) * _PAGE_SIZE
+  finally:
+    f.close()
+
+
+def make_bodies(scenario, pages, page_size):
+  """Get the response bodies, as sent on the wire, from the stand-in."""
+  if scenario == 'pages':
+    store = calendar_server.CalendarStore(
+        events_per_calendar=pages * page_size)
+  else:
+    store = calendar_server.CalendarStore(events_per_calendar=page_size)
+  api = calendar_server.CalendarApi(store)
+  bodies = []
+  token = None
+  for i in xrange(pages):
+    calendar = 'primary' if scenario == 'pages' else 'c%d' % i
+    path = '/calendar/v3/calendars/%s/events?maxResults=%d' % (calendar,
+                                                               page_size)
+    if token:
+      path += '&pageToken=' + token
+    _, _, body = api.handle('GET', path, {}, '')
+    bodies.append(body)
+    token = JsonModel().deserialize(body).get('nextPageToken')
+  return bodies
+
+
+def run(scenario, interned, pages, page_size):
+  """Keep the responses of one scenario, printing time and memory taken."""
+  bodies = make_bodies(scenario, pages, page_size)
+  interner = Interner() if interned else None
+  model = JsonModel(interner=interner)
+  cache = ResponseCache(max_bytes=sum(len(body) for body in bodies))
+  kept = []
+  gc.collect()
+  before = rss()
+  start = time.time()
+  for i, body in enumerate(bodies):
+    value = model.deserialize(body)
+    if scenario == 'pages':
+      kept.append(value)
+    else:
+      cache.put('c%d' % i, 'etag', value, len(body))
+    del value
+  elapsed = time.time() - start
+  gc.collect()
+  growth = rss() - before
+  saved = interner.stats()['bytes_saved'] if interner else 0
+  print '%f %d %d' % (elapsed, growth, saved)
+
+
+def main():
+  parser = optparse.OptionParser()
+  parser.add_option('--pages', type='int', default=20)
+  parser.add_option('--page-size', type='int', default=250)
+  parser.add_option('--scenario', choices=SCENARIOS,
+                    help=optparse.SUPPRESS_HELP)
+  parser.add_option('--interned', action='store_true',
+                    help=optparse.SUPPRESS_HELP)
+  options, _ = parser.parse_args()
+
+  if options.scenario:
+    run(options.scenario, options.interned, options.pages, options.page_size)
+    return
+
+  print '%d responses of %d events' % (options.pages, options.page_size)
+  print '%-8s %-9s %10s %10s %14s' % ('kept', 'model', 'seconds', 'held MB',
+                                      'estimated MB')
+  for scenario in SCENARIOS:
+    held = {}
+    for interned in (False, True):
+      args = [sys.executable, __file__, '--scenario', scenario,
+              '--pages', str(options.pages),
+              '--page-size', str(options.page_size)]
+      if interned:
+        args.append('--interned')
+      elapsed, growth, saved = subprocess.check_output(args).split()
+      held[interned] = int(growth)
+      print '%-8s %-9s %10.3f %10.1f %14s' % (
+          scenario, 'interned' if interned else 'plain', float(elapsed),
+          int(growth) / 1e6,
+          '%.1f saved' % (int(saved) / 1e6) if interned else '')
+    print '%-8s saved %.1f MB (%.0f%%)' % (
+        scenario, (held[False] - held[True]) / 1e6,
+        100.0 * (held[False] - held[True]) / held[False])
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare peak memory of JsonModel and StreamingListModel on list pages.
+
+Writes an events.list page from the Calendar API stand-in in
+calendar_server.py to a file, then in a fresh process per model reads the
+body and walks every item of the page, printing the time taken and how far
+peak RSS grew above what the body alone needed.
+
+  python benchmarks/list_model.py --page-size 2500
+"""
+
+import optparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from apiclient.model import JsonModel
+from apiclient.model import StreamingListModel
+
+import calendar_server
+
+MODELS = {
+    'json': JsonModel,
+    'streaming': StreamingListModel,
+    }
+
+
+def run_model(name, filename):
+  """Walk the page in filename with one model, printing time and RSS growth."""
+  f = open(filename, 'rb')
+  try:
+    body = f.read()
+  finally:
+    f.close()
+  model = MODELS[name]()
+  # ru_maxrss is in kilobytes on Linux.
+  before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  start = time.time()
+  page = model.deserialize(body)
+  count = 0
+  for item in page['items']:
+    count += len(item['summary'])
+  token = page.get('nextPageToken')
+  elapsed = time.time() - start
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  assert count and token
+  print '%s %f %d' % (name, elapsed, peak - before)
+
+
+def main():
+  parser = optparse.OptionParser()
+  parser.add_option('--page-size', type='int',
+                    default=calendar_server.MAX_MAX_RESULTS)
+  parser.add_option('--model', choices=sorted(MODELS),
+                    help=optparse.SUPPRESS_HELP)
+  parser.add_option('--file', help=optparse.SUPPRESS_HELP)
+  options, _ = parser.parse_args()
+
+  if options.model:
+    run_model(options.model, options.file)
+    return
+
+  store = calendar_server.CalendarStore(
+      events_per_calendar=options.page_size + 1)
+  api = calendar_server.CalendarApi(store)
+  _, _, body = api.handle(
+      'GET', '/calendar/v3/calendars/primary/events?maxResults=%d' %
+      options.page_size, {}, '')
+  fd, filename = tempfile.mkstemp()
+  try:
+    os.write(fd, body)
+    os.close(fd)
+
+    print '%d events, %.1f MB page' % (options.page_size, len(body) / 1e6)
+    print '%-10s %10s %16s' % ('model', 'seconds', 'RSS growth MB')
+    for name in sorted(MODELS):
+      output = subprocess.check_output([
+          sys.executable, __file__, '--model', name, '--file', filename])
+      _, elapsed, growth = output.split()
+      print '%-10s %10.3f %16.1f' % (name, float(elapsed),
+                                     int(growth) / 1024.0)
+  finally:
+    os.remove(filename)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare peak memory and throughput of the resumable upload paths.
+
+Uploads a file to a resumable upload server running on localhost, once per
+mode, each in a fresh process so that peak RSS isn't shared:
+
+  string: chunks read into strings with getbytes().
+  stream: chunks sent from the file through _StreamSlice (the default).
+  mmap:   chunks sent as buffers over a memory mapped file (use_mmap=True).
+  pipe:   the file piped through cat into a MediaStreamUpload, which doesn't
+          know the size in advance.
+
+Usage:
+
+  python benchmarks/media_upload.py --size-mb 512 --chunk-mb 64
+"""
+
+import BaseHTTPServer
+import optparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import httplib2
+
+from apiclient.http import HttpRequest
+from apiclient.http import MediaFileUpload
+from apiclient.http import MediaStreamUpload
+from apiclient.model import JsonModel
+
+MODES = ['string', 'stream', 'mmap', 'pipe']
+
+
+class _UploadHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  """Speaks just enough of the resumable upload protocol."""
+
+  received = 0
+
+  def log_message(self, *args):
+    pass
+
+  def do_POST(self):
+    self.send_response(200)
+    self.send_header('location', 'http://%s:%d/session' %
+                     self.server.server_address)
+    self.send_header('content-length', '0')
+    self.end_headers()
+
+  def do_PUT(self):
+    length = int(self.headers['content-length'])
+    while length:
+      length -= len(self.rfile.read(min(length, 1024*1024)))
+    # Content-Range: bytes <first>-<last>/<total>, where the total may be *
+    # while unknown, or bytes */<total> once nothing is left to send.
+    span, total = self.headers['content-range'][6:].split('/')
+    if span != '*':
+      self.server.last = int(span.split('-')[1])
+    if total != '*' and self.server.last + 1 == int(total):
+      body = '{}'
+      self.send_response(200)
+    else:
+      body = ''
+      self.send_response(308)
+      self.send_header('range', 'bytes=0-%d' % self.server.last)
+    self.send_header('content-length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+
+class _MediaStringUpload(MediaFileUpload):
+  """Forces next_chunk() to read every chunk into a string."""
+
+  def has_stream(self):
+    return False
+
+
+def _serve():
+  server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), _UploadHandler)
+  server.last = -1
+  thread = threading.Thread(target=server.serve_forever)
+  thread.daemon = True
+  thread.start()
+  return server
+
+
+def run_mode(mode, filename, chunksize):
+  """Upload filename in one mode, printing seconds taken and peak RSS."""
+  server = _serve()
+  if mode == 'pipe':
+    proc = subprocess.Popen(['cat', filename], stdout=subprocess.PIPE)
+    media = MediaStreamUpload(proc.stdout,
+                              mimetype='application/octet-stream',
+                              chunksize=chunksize)
+  elif mode == 'string':
+    media = _MediaStringUpload(filename, mimetype='application/octet-stream',
+                               chunksize=chunksize, resumable=True)
+  else:
+    media = MediaFileUpload(filename, mimetype='application/octet-stream',
+                            chunksize=chunksize, resumable=True,
+                            use_mmap=(mode == 'mmap'))
+  request = HttpRequest(
+      httplib2.Http(), JsonModel().response,
+      'http://%s:%d/upload' % server.server_address, method='POST',
+      headers={}, resumable=media)
+  start = time.time()
+  response = None
+  while response is None:
+    _, response = request.next_chunk()
+  elapsed = time.time() - start
+  # ru_maxrss is in kilobytes on Linux.
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  print '%s %f %d' % (mode, elapsed, peak)
+
+
+def main():
+  parser = optparse.OptionParser()
+  parser.add_option('--size-mb', type='int', default=256)
+  parser.add_option('--chunk-mb', type='int', default=32)
+  parser.add_option('--mode', choices=MODES, help=optparse.SUPPRESS_HELP)
+  parser.add_option('--file', help=optparse.SUPPRESS_HELP)
+  options, _ = parser.parse_args()
+  chunksize = options.chunk_mb * 1024 * 1024
+
+  if options.mode:
+    run_mode(options.mode, options.file, chunksize)
+    return
+
+  fd, filename = tempfile.mkstemp()
+  try:
+    block = os.urandom(1024*1024)
+    for _ in xrange(options.size_mb):
+      os.write(fd, block)
+    os.close(fd)
+
+    print '%d MB in %d MB chunks' % (options.size_mb, options.chunk_mb)
+    print '%-8s %10s %10s %14s' % ('mode', 'seconds', 'MB/s', 'peak RSS MB')
+    for mode in MODES:
+      output = subprocess.check_output([
+          sys.executable, __file__, '--mode', mode, '--file', filename,
+          '--chunk-mb', str(options.chunk_mb)])
+      _, elapsed, peak = output.split()
+      elapsed = float(elapsed)
+      print '%-8s %10.2f %10.1f %14.1f' % (
+          mode, elapsed, options.size_mb / elapsed, int(peak) / 1024.0)
+  finally:
+    os.remove(filename)
+
+
+if __name__ == '__main__':
+  main()
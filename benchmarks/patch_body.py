@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare the ways of building a PATCH body for a small change.
+
+Takes an event with many attendees and private extended properties, changes
+its summary and one property and deletes its location, and prints the time
+per update of:
+
+  legacy:   copy.deepcopy() and the recursive diff makepatch() used to do.
+  diff:     copy.deepcopy() and the current makepatch().
+  tracked:  wrapping the event in a TrackedResource, which records the
+            changes as they are made.
+
+  python benchmarks/patch_body.py --attendees 500 --properties 2000
+"""
+
+import copy
+import optparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from apiclient.model import TrackedResource
+from apiclient.model import makepatch
+
+
+def legacy_makepatch(original, modified):
+  """makepatch() as it was, comparing whole subtrees before descending."""
+  patch = {}
+  for key, original_value in original.iteritems():
+    modified_value = modified.get(key, None)
+    if modified_value is None:
+      patch[key] = None
+    elif original_value != modified_value:
+      if type(original_value) == type({}):
+        patch[key] = legacy_makepatch(original_value, modified_value)
+      else:
+        patch[key] = modified_value
+  for key in modified:
+    if key not in original:
+      patch[key] = modified[key]
+  return patch
+
+
+def make_event(attendees, properties):
+  return {
+      'kind': 'calendar#event',
+      'id': 'e0',
+      'summary': 'work',
+      'location': 'office',
+      'start': {'dateTime': '2014-06-02T09:00:00Z'},
+      'end': {'dateTime': '2014-06-02T18:00:00Z'},
+      'attendees': [{'email': 'user%d@example.com' % i,
+                     'responseStatus': 'accepted'}
+                    for i in xrange(attendees)],
+      'extendedProperties': {
+          'private': dict(('p%d' % i, 'value %d' % i)
+                          for i in xrange(properties)),
+          },
+      }
+
+
+def change(event):
+  event['summary'] = 'leave'
+  event['extendedProperties']['private']['p1'] = 'changed'
+  del event['location']
+
+
+def with_diff(event, diff):
+  original = copy.deepcopy(event)
+  change(event)
+  return diff(original, event)
+
+
+def with_tracking(event):
+  tracked = TrackedResource(event)
+  change(tracked)
+  return tracked.makepatch()
+
+
+def best_time(fn, make, repeat):
+  """The best time of fn(make()), not counting make()."""
+  best = None
+  for _ in xrange(repeat):
+    event = make()
+    start = time.time()
+    fn(event)
+    elapsed = time.time() - start
+    if best is None or elapsed < best:
+      best = elapsed
+  return best
+
+
+def main():
+  parser = optparse.OptionParser()
+  parser.add_option('--attendees', type='int', default=500)
+  parser.add_option('--properties', type='int', default=2000)
+  parser.add_option('--repeat', type='int', default=20)
+  options, _ = parser.parse_args()
+
+  make = lambda: make_event(options.attendees, options.properties)
+  ways = [
+      ('legacy', lambda event: with_diff(event, legacy_makepatch)),
+      ('diff', lambda event: with_diff(event, makepatch)),
+      ('tracked', with_tracking),
+      ]
+  expected = with_diff(make(), legacy_makepatch)
+  for name, fn in ways:
+    assert fn(make()) == expected, '%s builds a different patch.' % name
+
+  print 'event with %d attendees and %d properties, best of %d' % (
+      options.attendees, options.properties, options.repeat)
+  print 'patch: %r' % expected
+  print '%-8s %12s %8s' % ('way', 'per update', 'speedup')
+  baseline = None
+  for name, fn in ways:
+    elapsed = best_time(fn, make, options.repeat)
+    if baseline is None:
+      baseline = elapsed
+    print '%-8s %10.3fms %7.1fx' % (name, elapsed * 1000, baseline / elapsed)
+
+
+if __name__ == '__main__':
+  main()
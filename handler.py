@@ -7,6 +7,8 @@ import httplib2
 
 from google.appengine.api import users
 from apiclient.discovery import build
+from apiclient.discovery import DISCOVERY_URI
+from apiclient.futures import WorkerPool
 from google.appengine.api import memcache
 from oauth2client.appengine import AppAssertionCredentials
 
@@ -29,6 +31,17 @@ Using the service accounf of this application
 credentials = AppAssertionCredentials(scope=settings.SCOPE)
 http = credentials.authorize(httplib2.Http(memcache))
 
+''' Pages of events are fetched in the background on this pool. An Http object must not be used
+by several threads at once, so each worker thread authorizes its own.
+'''
+page_pool = WorkerPool(max_workers=4,
+	http_factory=lambda: credentials.authorize(httplib2.Http(memcache)))
+
+''' settings.DISCOVERY_SERVICE_URL can point build() at a local stand-in for the Calendar API,
+such as benchmarks/calendar_server.py, so that the app can be load tested without the real API.
+'''
+DISCOVERY_SERVICE_URL = getattr(settings, 'DISCOVERY_SERVICE_URL', None)
+
 def showError(self, message):
 	template_values = {
 		'message': message
@@ -132,20 +145,24 @@ class MainPage(webapp2.RequestHandler):
 		
 		# If the nickname is 'test', then use the fake events instead of requesting Google Calendar Service
 		# Because requesting to Google Calendar doesn't work when this app is running in the AppEngine SDK environment
-		if self.request.host[0:9] == 'localhost':
-			events = self.getFakeEvents(year)
+		# Unless a stand-in for the Calendar API has been configured.
+		if self.request.host[0:9] == 'localhost' and not DISCOVERY_SERVICE_URL:
+			pages = [self.getFakeEvents(year)]
 		else:
 			if http:
-				service = build('calendar', 'v3', http=http)
+				service = build('calendar', 'v3', http=http,
+					discoveryServiceUrl=DISCOVERY_SERVICE_URL or DISCOVERY_URI)
 				timeMin = str(year) + '-01-01T00:00:00Z'
 				timeMax = str(year + 1) + '-01-01T00:00:00Z'
 				request = service.events().list(calendarId = settings.CALENDAR_ID, timeMin = timeMin, timeMax = timeMax)
-				events = request.execute(http=http)
+				# When there are too many events in Google Calendar, the events are returned in several pages.
+				# The next page is requested in the background while the current page is analyzed.
+				pages = service.events().list_iter_pages(request, pool=page_pool)
 			else:
 				service = None
-				events = None
+				pages = []
 
-		while 1:
+		for events in pages:
 			if events == None or 'items' not in events:
 				break
 
@@ -228,15 +245,6 @@ class MainPage(webapp2.RequestHandler):
 						week_calendar[w][2] += timedelta.total_seconds() / 3600.0	# Increase the actual working hour for that week (by unit of hour)
 						if sdt.hour <= 12 and edt.hour >= 14 and location != 'nolunch':
 							week_calendar[w][2] -= 1.0
-						
-			""" When there are too many events in Google Calendar, then Google Calendar service will send the
-			'nextPageToken' field. We should ask REST request again with the 'pageToken' field. """
-			if 'nextPageToken' in events:
-				pageToken = events['nextPageToken']
-				request = service.events().list(calendarId = settings.CALENDAR_ID, timeMin = timeMin, timeMax = timeMax, pageToken = pageToken)
-				events = request.execute(http=http)
-				continue
-			break
 			
 		self.roundWorkingHours(week_calendar)
 		return week_calendar
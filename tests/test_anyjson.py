@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the JSON codecs of oauth2client.anyjson."""
+
+import pickle
+import unittest
+
+from apiclient.model import JsonModel
+from oauth2client import anyjson
+
+BODY = '{"kind": "calendar#event", "summary": "caf\\u00e9", "n": [1, 2.5]}'
+
+
+class CodecTest(unittest.TestCase):
+
+  def test_codecs_return_unicode(self):
+    for name in anyjson.available_codecs():
+      codec = anyjson.get_codec(name)
+      for content in (BODY, BODY.decode('utf-8')):
+        value = codec.loads(content)
+        self.assertTrue(isinstance(value.keys()[0], unicode), name)
+        self.assertTrue(isinstance(value['kind'], unicode), name)
+        if codec.hooked_loads is not None:
+          value = codec.hooked_loads(dict)(content)
+          self.assertTrue(isinstance(value['kind'], unicode), name)
+
+  def test_no_codecs_without_python2_support(self):
+    self.assertRaises(KeyError, anyjson.get_codec, 'orjson')
+    self.assertRaises(KeyError, anyjson.get_codec, 'ujson')
+
+  def test_model_with_named_codec_pickles(self):
+    model = pickle.loads(pickle.dumps(JsonModel(codec='json')))
+    self.assertEqual(u'caf\xe9', model.deserialize(BODY)['summary'])
+
+
+if __name__ == '__main__':
+  unittest.main()
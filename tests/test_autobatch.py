@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for apiclient.autobatch."""
+
+import socket
+import threading
+import traceback
+import unittest
+
+import httplib2
+
+from apiclient import batchcodec
+from apiclient.autobatch import AutoBatcher
+from apiclient.errors import HttpError
+from apiclient.futures import WorkerPool
+from apiclient.http import HttpRequest
+
+
+class _BatchHttp(object):
+  """Answers each part of a batch with its path, or 404 for /missing."""
+
+  def __init__(self, error=None):
+    self._error = error
+    self._lock = threading.Lock()
+    self.sizes = []
+
+  def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+    if self._error is not None:
+      raise self._error
+    parts = []
+    for content_id, payload in batchcodec.iter_mixed(
+        body, headers['content-type']):
+      path = payload.split(' ', 2)[1]
+      status = 404 if path == '/missing' else 200
+      parts.append(('<response-%s>' % content_id[1:-1],
+                    'HTTP/1.1 %d Status\nContent-Type: application/json\n\n'
+                    '{"path": "%s"}' % (status, path)))
+    with self._lock:
+      self.sizes.append(len(parts))
+    content, boundary = batchcodec.write_mixed(parts)
+    return httplib2.Response({
+        'status': '200',
+        'content-type': 'multipart/mixed; boundary="%s"' % boundary,
+        }), content
+
+
+def _request(http, path):
+  return HttpRequest(http, lambda resp, content: content,
+                     'https://example.com%s' % path, headers={})
+
+
+class AutoBatcherTest(unittest.TestCase):
+
+  def setUp(self):
+    self.pool = WorkerPool(max_workers=2)
+
+  def tearDown(self):
+    self.pool.shutdown()
+
+  def test_flushed_when_full(self):
+    http = _BatchHttp()
+    batcher = AutoBatcher(http=http, window=60.0, max_batch_size=2,
+                          batch_uri='https://example.com/batch',
+                          pool=self.pool)
+    futures = [batcher.submit(_request(http, '/items/%d' % i))
+               for i in xrange(2)]
+    self.assertEqual('{"path": "/items/1"}', futures[1].result(timeout=5))
+    self.assertEqual('{"path": "/items/0"}', futures[0].result(timeout=5))
+    self.assertEqual([2], http.sizes)
+
+  def test_flushed_after_window(self):
+    http = _BatchHttp()
+    batcher = AutoBatcher(http=http, window=0.01,
+                          batch_uri='https://example.com/batch',
+                          pool=self.pool)
+    futures = [batcher.submit(_request(http, '/items/%d' % i))
+               for i in xrange(3)]
+    for i, future in enumerate(futures):
+      self.assertEqual('{"path": "/items/%d"}' % i,
+                       future.result(timeout=5))
+    self.assertEqual([3], http.sizes)
+
+  def test_part_error_given_to_its_request(self):
+    http = _BatchHttp()
+    batcher = AutoBatcher(http=http, batch_uri='https://example.com/batch',
+                          pool=self.pool)
+    found = batcher.submit(_request(http, '/items/0'))
+    missing = batcher.submit(_request(http, '/missing'))
+    batcher.close()
+    self.assertTrue(isinstance(missing.exception(timeout=5), HttpError))
+    self.assertEqual('{"path": "/items/0"}', found.result(timeout=5))
+
+  def test_batch_error_given_to_every_request(self):
+    http = _BatchHttp(error=socket.error('reset'))
+    batcher = AutoBatcher(http=http, batch_uri='https://example.com/batch',
+                          pool=self.pool)
+    futures = [batcher.submit(_request(http, '/items/%d' % i))
+               for i in xrange(3)]
+    batcher.flush()
+    for future in futures:
+      exception, tb = future.exception_info(timeout=5)
+      self.assertTrue(isinstance(exception, socket.error))
+      # The traceback reaches back to where the transport raised it.
+      self.assertEqual('request', traceback.extract_tb(tb)[-1][2])
+
+  def test_pool_shut_down(self):
+    http = _BatchHttp()
+    self.pool.shutdown()
+    batcher = AutoBatcher(http=http, batch_uri='https://example.com/batch',
+                          pool=self.pool)
+    futures = [batcher.submit(_request(http, '/items/%d' % i))
+               for i in xrange(2)]
+    batcher.flush()
+    for future in futures:
+      self.assertTrue(isinstance(future.exception(timeout=5), RuntimeError))
+
+
+if __name__ == '__main__':
+  unittest.main()
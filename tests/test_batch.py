@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for splitting and retrying batches in apiclient.http."""
+
+import unittest
+
+import httplib2
+
+from apiclient import batchcodec
+from apiclient import http as apiclient_http
+from apiclient.futures import WorkerPool
+from apiclient.retry import RetryPolicy
+
+
+class _BatchHttp(object):
+  """Answers every part of a batch with the next status for its path.
+
+  A path with a single status left answers with it every time.
+  """
+
+  def __init__(self, statuses):
+    self._statuses = statuses
+    self.batches = []
+
+  def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+    paths = []
+    parts = []
+    for content_id, payload in batchcodec.iter_mixed(
+        body, headers['content-type']):
+      path = payload.split(' ', 2)[1]
+      paths.append(path)
+      statuses = self._statuses.get(path, [200])
+      status = statuses.pop(0) if len(statuses) > 1 else statuses[0]
+      parts.append(('<response-%s>' % content_id[1:-1],
+                    'HTTP/1.1 %d Status\nContent-Type: application/json\n\n'
+                    '"%s"' % (status, path)))
+    self.batches.append(paths)
+    content, boundary = batchcodec.write_mixed(parts)
+    return httplib2.Response({
+        'status': '200',
+        'content-type': 'multipart/mixed; boundary="%s"' % boundary,
+        }), content
+
+
+class BatchTest(unittest.TestCase):
+
+  def setUp(self):
+    self.old_policy = apiclient_http.retry_policy
+    apiclient_http.retry_policy = RetryPolicy()
+    self.delivered = []
+    self.sleeps = []
+
+  def tearDown(self):
+    apiclient_http.retry_policy = self.old_policy
+
+  def _callback(self, request_id, response, exception):
+    status = exception.resp.status if exception is not None else 200
+    self.delivered.append((request_id, status))
+
+  def _batch(self, http, count, max_batch_size=apiclient_http.MAX_BATCH_SIZE):
+    batch = apiclient_http.BatchHttpRequest(
+        callback=self._callback, batch_uri='https://example.com/batch',
+        max_batch_size=max_batch_size)
+    batch._sleep = self.sleeps.append
+    batch._rand = lambda: 0.0
+    for i in xrange(count):
+      batch.add(apiclient_http.HttpRequest(
+          http, lambda resp, content: content,
+          'https://example.com/items/%d' % i, headers={}),
+                request_id=str(i))
+    return batch
+
+  def test_split_into_batches_of_max_size(self):
+    http = _BatchHttp({})
+    self._batch(http, 5, max_batch_size=2).execute(http=http)
+    self.assertEqual([['/items/0', '/items/1'], ['/items/2', '/items/3'],
+                      ['/items/4']], http.batches)
+    self.assertEqual([(str(i), 200) for i in xrange(5)], self.delivered)
+
+  def test_split_batches_sent_on_pool(self):
+    http = _BatchHttp({})
+    pool = WorkerPool(max_workers=2)
+    try:
+      self._batch(http, 5, max_batch_size=2).execute(http=http, pool=pool)
+    finally:
+      pool.shutdown()
+    self.assertEqual(3, len(http.batches))
+    self.assertEqual(sorted((str(i), 200) for i in xrange(5)),
+                     sorted(self.delivered))
+
+  def test_only_retryable_parts_sent_again(self):
+    http = _BatchHttp({
+        '/items/0': [503, 200],
+        '/items/1': [429, 200],
+        '/items/2': [404],
+        })
+    self._batch(http, 4, max_batch_size=3).execute(http=http, num_retries=2)
+    self.assertEqual([['/items/0', '/items/1', '/items/2'], ['/items/3'],
+                      ['/items/0', '/items/1']], http.batches)
+    self.assertEqual(1, len(self.sleeps))
+    # Final responses are delivered as they arrive, retried ones once the
+    # retry has answered them, in the order they were added.
+    self.assertEqual([('2', 404), ('3', 200), ('0', 200), ('1', 200)],
+                     self.delivered)
+
+  def test_retries_capped_by_num_retries(self):
+    http = _BatchHttp({'/items/0': [503]})
+    self._batch(http, 2).execute(http=http, num_retries=2)
+    self.assertEqual([['/items/0', '/items/1'], ['/items/0'], ['/items/0']],
+                     http.batches)
+    self.assertEqual([('1', 200), ('0', 503)], self.delivered)
+
+  def test_not_retried_without_num_retries(self):
+    http = _BatchHttp({'/items/0': [503, 200]})
+    self._batch(http, 2).execute(http=http)
+    self.assertEqual(1, len(http.batches))
+    self.assertEqual([('0', 503), ('1', 200)], self.delivered)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for apiclient.batchcodec, against the email package it replaced."""
+
+import StringIO
+import unittest
+import urlparse
+
+from email.generator import Generator
+from email.mime.multipart import MIMEMultipart
+from email.mime.nonmultipart import MIMENonMultipart
+from email.parser import FeedParser
+
+from apiclient import batchcodec
+from apiclient.errors import BatchError
+
+
+def _email_serialize_request(method, uri, headers, body):
+  """The request serialization BatchHttpRequest did with the email package."""
+  parsed = urlparse.urlparse(uri)
+  request_line = urlparse.urlunparse(
+      (None, None, parsed.path, parsed.params, parsed.query, None))
+  status_line = method + ' ' + request_line + ' HTTP/1.1\n'
+  major, minor = headers.get('content-type', 'application/json').split('/')
+  msg = MIMENonMultipart(major, minor)
+  headers = headers.copy()
+  if 'content-type' in headers:
+    del headers['content-type']
+  for key, value in headers.iteritems():
+    msg[key] = value
+  msg['Host'] = parsed.netloc
+  msg.set_unixfrom(None)
+  if body is not None:
+    msg.set_payload(body)
+    msg['content-length'] = str(len(body))
+  fp = StringIO.StringIO()
+  Generator(fp, maxheaderlen=0).flatten(msg, unixfrom=False)
+  body_text = fp.getvalue()
+  if body is None:
+    body_text = body_text[:-2]
+  return status_line.encode('utf-8') + body_text
+
+
+def _email_write_mixed(parts, boundary):
+  """The batch body BatchHttpRequest built with the email package."""
+  message = MIMEMultipart('mixed')
+  setattr(message, '_write_headers', lambda self: None)
+  for content_id, payload in parts:
+    msg = MIMENonMultipart('application', 'http')
+    msg['Content-Transfer-Encoding'] = 'binary'
+    msg['Content-ID'] = content_id
+    msg.set_payload(payload)
+    message.attach(msg)
+  message.set_boundary(boundary)
+  return message.as_string()
+
+
+def _email_iter_mixed(content, content_type):
+  """The parts FeedParser found in a batch response."""
+  parser = FeedParser()
+  parser.feed('content-type: %s\r\n\r\n' % content_type + content)
+  return [(part['Content-ID'], part.get_payload())
+          for part in parser.close().get_payload()]
+
+
+def _response(parts, boundary, newline='\r\n', preamble='', epilogue=''):
+  texts = [preamble]
+  for content_id, payload in parts:
+    texts.append('--%s%sContent-Type: application/http%s'
+                 'Content-ID: %s%s%s%s%s' % (
+                     boundary, newline, newline, content_id, newline,
+                     newline, payload, newline))
+  texts.append('--%s--%s%s' % (boundary, newline, epilogue))
+  return ''.join(texts)
+
+
+_PAYLOADS = [
+    'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+    'Content-Length: 14\r\n\r\n{"answer": 42}',
+    'HTTP/1.1 404 Not Found\r\nContent-Type: application/json\r\n\r\n'
+    '{"error": {"message": "Not Found"}}',
+    'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n'
+    '{"text": "first\\nFrom here\\n--not-a-boundary"}',
+    ]
+
+
+class SerializeRequestTest(unittest.TestCase):
+
+  def _check(self, method, uri, headers, body):
+    self.assertEqual(
+        _email_serialize_request(method, uri, headers, body),
+        batchcodec.serialize_request(method, uri, headers, body))
+
+  def test_without_body(self):
+    self._check('GET', 'https://www.googleapis.com/calendar/v3/events?a=1',
+                {'accept': 'application/json'}, None)
+
+  def test_with_body(self):
+    self._check('POST', 'https://www.googleapis.com/calendar/v3/events',
+                {'content-type': 'application/json'}, '{"summary": "work"}')
+
+  def test_body_with_from_line(self):
+    self._check('PUT', 'https://www.googleapis.com/upload/files/1',
+                {'content-type': 'text/plain'}, 'Hello\nFrom me\n')
+
+
+class WriteMixedTest(unittest.TestCase):
+
+  def test_same_bytes_as_email(self):
+    parts = [
+        ('<batch+1>', batchcodec.serialize_request(
+            'GET', 'https://www.googleapis.com/items/1', {}, None)),
+        ('<batch+2>', batchcodec.serialize_request(
+            'POST', 'https://www.googleapis.com/items', {},
+            'line\nFrom a body\n')),
+        ]
+    body, boundary = batchcodec.write_mixed(parts)
+    self.assertEqual(_email_write_mixed(parts, boundary), body)
+
+  def test_boundary_not_in_parts(self):
+    payload = batchcodec.serialize_request(
+        'POST', 'https://www.googleapis.com/items', {}, 'x')
+    body, boundary = batchcodec.write_mixed([('<batch+1>', payload)])
+    self.assertEqual(
+        [('<batch+1>', payload)],
+        _email_iter_mixed(body, 'multipart/mixed; boundary="%s"' % boundary))
+
+
+class IterMixedTest(unittest.TestCase):
+
+  def _check(self, content, content_type):
+    self.assertEqual(_email_iter_mixed(content, content_type),
+                     list(batchcodec.iter_mixed(content, content_type)))
+
+  def test_crlf_response(self):
+    parts = [('<response-%d>' % i, p) for i, p in enumerate(_PAYLOADS)]
+    self._check(_response(parts, 'batch_abc'),
+                'multipart/mixed; boundary=batch_abc')
+
+  def test_lf_response_with_preamble_and_epilogue(self):
+    parts = [('<response-%d>' % i, p.replace('\r\n', '\n'))
+             for i, p in enumerate(_PAYLOADS)]
+    self._check(_response(parts, 'b', newline='\n', preamble='ignored\n',
+                          epilogue='also ignored\n'),
+                'multipart/mixed; boundary="b"')
+
+  def test_boundary_prefix_inside_part(self):
+    parts = [('<response-0>', 'HTTP/1.1 200 OK\r\n\r\n--bx is text')]
+    self._check(_response(parts, 'b'), 'multipart/mixed; boundary=b')
+
+  def test_not_multipart(self):
+    self.assertRaises(BatchError, list,
+                      batchcodec.iter_mixed('{}', 'application/json'))
+
+
+class ParseResponseTest(unittest.TestCase):
+
+  def test_status_headers_and_content(self):
+    resp, content = batchcodec.parse_response(_PAYLOADS[1])
+    self.assertEqual(404, resp.status)
+    self.assertEqual('Not Found', resp.reason)
+    self.assertEqual(11, resp.version)
+    self.assertEqual('application/json', resp['content-type'])
+    self.assertEqual('{"error": {"message": "Not Found"}}', content)
+
+
+if __name__ == '__main__':
+  unittest.main()
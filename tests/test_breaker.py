@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for apiclient.breaker."""
+
+import httplib
+import unittest
+
+import httplib2
+
+from apiclient.breaker import CLOSED
+from apiclient.breaker import CircuitBreaker
+from apiclient.breaker import HALF_OPEN
+from apiclient.breaker import OPEN
+
+URI = 'https://www.googleapis.com/calendar/v3/calendars/primary/events'
+
+
+def _raise(exception):
+  def send():
+    raise exception
+  return send
+
+
+def _ok():
+  return httplib2.Response({'status': '200'}), '{}'
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.now = 1000.0
+    self.breaker = CircuitBreaker(min_calls=5, window=5, open_seconds=10.0)
+    self.breaker._clock = lambda: self.now
+
+  def _open(self):
+    for _ in xrange(5):
+      self.assertRaises(httplib.BadStatusLine, self.breaker.call, URI,
+                        _raise(httplib.BadStatusLine('')))
+    self.assertEqual(OPEN, self.breaker.state(URI))
+    self.now += 10.0
+
+  def test_httplib_errors_counted_as_failures(self):
+    self._open()
+    stats = self.breaker.stats().values()[0]
+    self.assertEqual(5, stats['failures'])
+
+  def test_failed_probe_reopens(self):
+    self._open()
+    self.assertRaises(httplib.IncompleteRead, self.breaker.call, URI,
+                      _raise(httplib.IncompleteRead('')))
+    self.assertEqual(OPEN, self.breaker.state(URI))
+
+  def test_other_error_releases_probe(self):
+    self._open()
+    self.assertRaises(ValueError, self.breaker.call, URI,
+                      _raise(ValueError()))
+    # Neither closed nor left waiting on a probe that never returns.
+    self.assertEqual(HALF_OPEN, self.breaker.state(URI))
+    self.breaker.call(URI, _ok)
+    self.assertEqual(CLOSED, self.breaker.state(URI))
+
+
+if __name__ == '__main__':
+  unittest.main()
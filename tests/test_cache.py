@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for apiclient.cache."""
+
+import json
+import sys
+import unittest
+
+from apiclient.cache import ResponseCache
+from apiclient.cache import object_size
+
+
+def _page(n):
+  return {'items': [{'id': 'e%d' % i, 'summary': 'event %d' % i}
+                    for i in xrange(n)]}
+
+
+class ObjectSizeTest(unittest.TestCase):
+
+  def test_larger_than_body(self):
+    value = _page(100)
+    self.assertTrue(object_size(value) > len(json.dumps(value)))
+
+  def test_shared_objects_counted_once(self):
+    shared = u'x' * 1000
+    value = {'a': shared, 'b': shared}
+    self.assertTrue(object_size(value) <
+                    sys.getsizeof(value) + 2 * sys.getsizeof(shared))
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+  def test_measures_stored_objects(self):
+    value = _page(10)
+    cache = ResponseCache(max_bytes=10**6)
+    cache.put('k', 'etag', value)
+    self.assertEqual(object_size(value), cache.stats()['bytes'])
+
+  def test_cap_bounds_stored_objects(self):
+    value = _page(100)
+    body_size = len(json.dumps(value))
+    cache = ResponseCache(max_bytes=2 * body_size)
+    cache.put('k', 'etag', value)
+    self.assertEqual(None, cache.get('k'))
+    self.assertEqual(0, cache.stats()['bytes'])
+
+  def test_evicts_least_recently_used(self):
+    size = object_size(_page(10))
+    cache = ResponseCache(max_bytes=2 * size)
+    cache.put('a', 'etag', _page(10))
+    cache.put('b', 'etag', _page(10))
+    cache.get('a')
+    cache.put('c', 'etag', _page(10))
+    self.assertNotEqual(None, cache.get('a'))
+    self.assertEqual(None, cache.get('b'))
+    self.assertEqual(1, cache.stats()['evictions'])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for apiclient.cassette."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import httplib2
+
+from apiclient.cassette import CassettePlayer
+from apiclient.cassette import CassetteRecorder
+from apiclient.errors import UnrecordedRequestError
+
+EVENTS = 'https://www.googleapis.com/calendar/v3/calendars/primary/events'
+
+
+class _CountingHttp(object):
+  """Answers every request with its method, URI and a count."""
+
+  def __init__(self):
+    self.requests = 0
+
+  def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+    self.requests += 1
+    if method == 'PUT':
+      return httplib2.Response({'status': '200'}), body[::-1]
+    resp = httplib2.Response({'status': '200', 'etag': '"%d"' % self.requests})
+    return resp, '{"request": %d}' % self.requests
+
+
+class CassetteTest(unittest.TestCase):
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.filename = os.path.join(self.dir, 'cassette.json')
+    self.http = _CountingHttp()
+    recorder = CassetteRecorder(self.http)
+    recorder.request(EVENTS + '?maxResults=5&orderBy=startTime',
+                     headers={'authorization': 'Bearer secret'})
+    recorder.request(EVENTS + '?maxResults=5&orderBy=startTime')
+    recorder.request(EVENTS + '/e1', method='PUT', body='\xff\x00binary')
+    recorder.save(self.filename)
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def _player(self, **kwargs):
+    player = CassettePlayer(self.filename, **kwargs)
+    self.slept = []
+    player._sleep = self.slept.append
+    return player
+
+  def test_replayed_without_network(self):
+    player = self._player(latency=0)
+    uri = EVENTS + '?orderBy=startTime&maxResults=5'
+    resp, content = player.request(uri)
+    self.assertEqual('"1"', resp['etag'])
+    self.assertEqual('{"request": 1}', content)
+    resp, content = player.request(uri)
+    self.assertEqual('{"request": 2}', content)
+    resp, content = player.request(EVENTS + '/e1', method='PUT')
+    self.assertEqual('yranib\x00\xff', content)
+    self.assertEqual(3, player.requests)
+    self.assertEqual(3, self.http.requests)
+    self.assertEqual([], self.slept)
+
+  def test_authorization_not_recorded(self):
+    self.assertFalse('secret' in open(self.filename).read())
+
+  def test_unmatched_request(self):
+    player = self._player()
+    self.assertRaises(UnrecordedRequestError, player.request,
+                      EVENTS + '?maxResults=10&orderBy=startTime')
+    self.assertRaises(UnrecordedRequestError, player.request,
+                      EVENTS + '?maxResults=5&orderBy=startTime',
+                      method='DELETE')
+
+  def test_repeat(self):
+    uri = EVENTS + '?maxResults=5&orderBy=startTime'
+    player = self._player(latency=0)
+    contents = [player.request(uri)[1] for _ in xrange(3)]
+    self.assertEqual('{"request": 1}', contents[2])
+    player = self._player(latency=0, repeat=False)
+    player.request(uri)
+    player.request(uri)
+    self.assertRaises(UnrecordedRequestError, player.request, uri)
+
+  def test_match_body(self):
+    player = self._player(latency=0, match_body=True)
+    self.assertRaises(UnrecordedRequestError, player.request,
+                      EVENTS + '/e1', method='PUT', body='other')
+    _, content = player.request(EVENTS + '/e1', method='PUT',
+                                body='\xff\x00binary')
+    self.assertEqual('yranib\x00\xff', content)
+
+  def test_latency(self):
+    uri = EVENTS + '/e1'
+    self._player().request(uri, method='PUT')
+    self.assertEqual(1, len(self.slept))
+    self._player(latency=0.25).request(uri, method='PUT')
+    self.assertEqual([0.25], self.slept)
+    self._player(latency=lambda recorded: 0.5).request(uri, method='PUT')
+    self.assertEqual([0.5], self.slept)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for apiclient.coalesce."""
+
+import copy
+import threading
+import time
+import unittest
+
+from apiclient.coalesce import RequestCoalescer
+from apiclient.coalesce import coalesce_key
+from apiclient.deadline import Deadline
+from apiclient.errors import DeadlineExceededError
+
+
+class CoalesceKeyTest(unittest.TestCase):
+
+  def test_headers_are_part_of_the_key(self):
+    uri = 'http://example.com/items'
+    base = coalesce_key('GET', uri, None, {'accept': 'application/json'})
+    self.assertEqual(base, coalesce_key('GET', uri, None,
+                                        {'Accept': 'application/json'}))
+    self.assertNotEqual(base, coalesce_key('GET', uri, None,
+                                           {'accept': 'text/plain'}))
+    self.assertNotEqual(
+        coalesce_key('GET', uri, None, {'authorization': 'Bearer a'}),
+        coalesce_key('GET', uri, None, {'authorization': 'Bearer b'}))
+
+
+class RequestCoalescerTest(unittest.TestCase):
+
+  def test_waiters_get_their_own_copy(self):
+    coalescer = RequestCoalescer()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+      calls.append(1)
+      release.wait()
+      return {'status': '200'}
+
+    results = []
+    leader = threading.Thread(
+        target=lambda: results.append(coalescer.do('k', fn, copy.copy)))
+    leader.start()
+    while coalescer.stats()['in_flight'] == 0:
+      time.sleep(0.001)
+    follower = threading.Thread(
+        target=lambda: results.append(coalescer.do('k', fn, copy.copy)))
+    follower.start()
+    while coalescer.stats()['coalesced'] == 0:
+      time.sleep(0.001)
+    release.set()
+    leader.join()
+    follower.join()
+
+    self.assertEqual(1, len(calls))
+    self.assertEqual(results[0], results[1])
+    self.assertFalse(results[0] is results[1])
+
+  def _start_leader(self, coalescer, fn):
+    errors = []
+
+    def run():
+      try:
+        coalescer.do('k', fn)
+      except DeadlineExceededError, e:
+        errors.append(e)
+
+    leader = threading.Thread(target=run)
+    leader.start()
+    while coalescer.stats()['in_flight'] == 0:
+      time.sleep(0.001)
+    return leader, errors
+
+  def test_follower_gives_up_at_its_deadline(self):
+    coalescer = RequestCoalescer()
+    release = threading.Event()
+    leader, _ = self._start_leader(coalescer, release.wait)
+    start = time.time()
+    try:
+      self.assertRaises(DeadlineExceededError, coalescer.do, 'k',
+                        lambda: 'follower', deadline=Deadline(0.05))
+      self.assertTrue(time.time() - start < 0.5)
+    finally:
+      release.set()
+      leader.join()
+
+  def test_leader_deadline_not_spread(self):
+    coalescer = RequestCoalescer()
+    release = threading.Event()
+
+    def fn():
+      release.wait()
+      raise DeadlineExceededError('leader ran out of time')
+
+    leader, errors = self._start_leader(coalescer, fn)
+    results = []
+    follower = threading.Thread(
+        target=lambda: results.append(coalescer.do('k', lambda: 'follower')))
+    follower.start()
+    while coalescer.stats()['coalesced'] == 0:
+      time.sleep(0.001)
+    release.set()
+    leader.join()
+    follower.join()
+    self.assertEqual(1, len(errors))
+    self.assertEqual(['follower'], results)
+
+
+if __name__ == '__main__':
+  unittest.main()
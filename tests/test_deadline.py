@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for apiclient.deadline."""
+
+import threading
+import time
+import unittest
+
+from apiclient.deadline import Deadline
+
+
+class _Http(object):
+
+  def __init__(self, timeout=None):
+    self.timeout = timeout
+    self.connections = {}
+
+
+class DeadlineCallTest(unittest.TestCase):
+
+  def test_caps_and_restores_timeout(self):
+    http = _Http(timeout=60)
+    seen = []
+    Deadline(5).call(http, lambda: seen.append(http.timeout))
+    self.assertTrue(seen[0] <= 5)
+    self.assertEqual(60, http.timeout)
+
+  def test_threads_do_not_see_each_others_timeouts(self):
+    http = _Http()
+    errors = []
+
+    def run(seconds):
+      deadline = Deadline(seconds)
+
+      def fn():
+        timeout = http.timeout
+        time.sleep(0.02)
+        if http.timeout != timeout or timeout > seconds:
+          errors.append((seconds, timeout, http.timeout))
+
+      for _ in xrange(5):
+        deadline.call(http, fn)
+
+    threads = [threading.Thread(target=run, args=(seconds,))
+               for seconds in (10, 20, 30)]
+    for t in threads:
+      t.start()
+    for t in threads:
+      t.join()
+    self.assertEqual([], errors)
+    self.assertEqual(None, http.timeout)
+
+
+if __name__ == '__main__':
+  unittest.main()
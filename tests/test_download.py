@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for MediaIoBaseDownload.download_parallel."""
+
+import StringIO
+import threading
+import time
+import unittest
+
+import httplib2
+
+from apiclient.errors import HttpError
+from apiclient.futures import WorkerPool
+from apiclient.http import HttpRequest
+from apiclient.http import MediaIoBaseDownload
+
+MEDIA = ''.join(chr(ord('a') + i % 26) for i in xrange(1000))
+
+
+class _RangeHttp(object):
+  """Serves MEDIA in ranges, noting requests made on it at the same time."""
+
+  def __init__(self, shift=0):
+    self._shift = shift
+    self._lock = threading.Lock()
+    self.active = 0
+    self.overlapped = False
+
+  def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+    with self._lock:
+      self.active += 1
+      if self.active > 1:
+        self.overlapped = True
+    try:
+      time.sleep(0.01)
+      first, last = headers['range'][len('bytes='):].split('-')
+      first = int(first)
+      if first > 0:
+        first += self._shift
+      last = min(int(last), len(MEDIA) - 1)
+      return httplib2.Response({
+          'status': '206',
+          'content-range': 'bytes %d-%d/%d' % (first, last, len(MEDIA)),
+          }), MEDIA[first:last + 1]
+    finally:
+      with self._lock:
+        self.active -= 1
+
+
+def _download(http, fd):
+  request = HttpRequest(http, None, 'https://example.com/media',
+                        headers={}, methodId='media.get')
+  return MediaIoBaseDownload(fd, request, chunksize=100)
+
+
+class DownloadParallelTest(unittest.TestCase):
+
+  def test_pool_without_factory_does_not_share_http(self):
+    http = _RangeHttp()
+    fd = StringIO.StringIO()
+    pool = WorkerPool(max_workers=4)
+    try:
+      _download(http, fd).download_parallel(pool=pool)
+    finally:
+      pool.shutdown()
+    self.assertEqual(MEDIA, fd.getvalue())
+    self.assertFalse(http.overlapped)
+
+  def test_http_factory_gives_each_thread_its_own(self):
+    made = []
+
+    def factory():
+      http = _RangeHttp()
+      made.append(http)
+      return http
+
+    fd = StringIO.StringIO()
+    pool = WorkerPool(max_workers=4)
+    try:
+      _download(_RangeHttp(), fd).download_parallel(pool=pool,
+                                                    http_factory=factory)
+    finally:
+      pool.shutdown()
+    self.assertEqual(MEDIA, fd.getvalue())
+    self.assertTrue(made)
+    self.assertFalse([http for http in made if http.overlapped])
+
+  def test_misplaced_range_is_not_written(self):
+    fd = StringIO.StringIO()
+    self.assertRaises(HttpError,
+                      _download(_RangeHttp(shift=50), fd).download_parallel)
+    # The first chunk, fetched on its own, asks for bytes 0-100.
+    self.assertEqual(MEDIA[:101], fd.getvalue())
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for apiclient.fieldmask."""
+
+import unittest
+
+import httplib2
+
+from apiclient import http as apiclient_http
+from apiclient.cache import ResponseCache
+from apiclient.cache import object_size
+from apiclient.fieldmask import FieldMaskTracker
+from apiclient.fieldmask import TrackedDict
+from apiclient.http import HttpRequest
+from apiclient.model import JsonModel
+
+METHOD_ID = 'calendar.events.list'
+URI = 'https://www.googleapis.com/calendar/v3/calendars/primary/events'
+PAGE = ('{"kind": "calendar#events", "items": [{"id": "a", '
+        '"start": {"date": "2014-06-02"}}], "nextPageToken": "t"}')
+
+
+def _execute(model, content=PAGE):
+  http = httplib2.Http()
+  http.request = lambda *args, **kwargs: (
+      httplib2.Response({'status': '200', 'etag': '"1"'}), content)
+  request = HttpRequest(http, model.response, URI, headers={},
+                        methodId=METHOD_ID)
+  return request.execute()
+
+
+class FieldMaskTrackerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.old_masks = apiclient_http.field_masks
+    self.old_cache = apiclient_http.response_cache
+    apiclient_http.field_masks = self.tracker = FieldMaskTracker(warmup=1)
+    apiclient_http.response_cache = None
+
+  def tearDown(self):
+    apiclient_http.field_masks = self.old_masks
+    apiclient_http.response_cache = self.old_cache
+
+  def test_built_while_parsing(self):
+    built = []
+    model = JsonModel(codec='json')
+    hooked_response = model.hooked_response
+
+    def counting_hooked_response(object_pairs_hook):
+      def hook(pairs):
+        value = object_pairs_hook(pairs)
+        built.append(value)
+        return value
+      return hooked_response(hook)
+
+    model.hooked_response = counting_hooked_response
+    page = _execute(model)
+    # The objects the parser built are the ones handed out.
+    self.assertTrue(page is built[-1])
+    start = page['items'][0]['start']
+    self.assertTrue(start is built[0])
+    self.assertEqual(('items', 'start'), start._path)
+
+  def test_reads_make_mask(self):
+    page = _execute(JsonModel(codec='json'))
+    self.assertTrue(isinstance(page, TrackedDict))
+    self.assertTrue(isinstance(page['items'][0]['start'], TrackedDict))
+    page['items'][0]['start'].get('date')
+    self.assertEqual('items/start/date', self.tracker.mask(METHOD_ID))
+
+  def test_data_wrapper(self):
+    page = _execute(JsonModel(data_wrapper=True, codec='json'),
+                    '{"data": %s}' % PAGE)
+    page['nextPageToken']
+    self.assertEqual('nextPageToken', self.tracker.mask(METHOD_ID))
+
+  def test_copied_without_hook(self):
+    model = JsonModel(codec='json')
+    model.hooked_response = lambda object_pairs_hook: None
+    page = _execute(model)
+    self.assertTrue(isinstance(page['items'][0], TrackedDict))
+    page['items'][0]['id']
+    self.assertEqual('items/id', self.tracker.mask(METHOD_ID))
+
+  def test_caching_is_not_a_read(self):
+    apiclient_http.response_cache = ResponseCache()
+    page = _execute(JsonModel(codec='json'))
+    self.assertTrue(object_size(page) > 0)
+    page['kind']
+    self.assertEqual('kind', self.tracker.mask(METHOD_ID))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for apiclient.futures."""
+
+import sys
+import threading
+import traceback
+import unittest
+
+import httplib2
+
+from apiclient import futures
+from apiclient.errors import CancelledError
+from apiclient.errors import HttpError
+from apiclient.errors import TimeoutError
+from apiclient.futures import Future
+from apiclient.futures import WorkerPool
+from apiclient.futures import run_in_future
+from apiclient.futures import wait_first
+from apiclient.http import HttpRequest
+
+
+def _fail():
+  raise ValueError('failed')
+
+
+class FutureTest(unittest.TestCase):
+
+  def test_result(self):
+    future = Future()
+    self.assertFalse(future.done())
+    self.assertRaises(TimeoutError, future.result, 0)
+    run_in_future(future, lambda x: x * 2, 21)
+    self.assertTrue(future.done())
+    self.assertEqual(42, future.result())
+    self.assertEqual(None, future.exception())
+
+  def test_exception_keeps_traceback(self):
+    future = Future()
+    run_in_future(future, _fail)
+    self.assertTrue(isinstance(future.exception(), ValueError))
+    try:
+      future.result()
+    except ValueError:
+      frames = traceback.extract_tb(sys.exc_info()[2])
+    else:
+      self.fail('result() should raise the exception.')
+    self.assertEqual('_fail', frames[-1][2])
+    exception, tb = future.exception_info()
+    self.assertEqual('_fail', traceback.extract_tb(tb)[-1][2])
+
+  def test_callbacks(self):
+    future = Future()
+    called = []
+    future.add_done_callback(called.append)
+    future.add_done_callback(lambda f: 1 / 0)
+    future.add_done_callback(called.append)
+    self.assertEqual([], called)
+    logged = []
+    futures.logger.exception = lambda *args: logged.append(args)
+    try:
+      future.set_result('done')
+    finally:
+      del futures.logger.exception
+    # A callback that raises is logged and doesn't stop the others.
+    self.assertEqual([future, future], called)
+    self.assertEqual(1, len(logged))
+    # Callbacks added once the future is done are called at once.
+    future.add_done_callback(called.append)
+    self.assertEqual([future] * 3, called)
+
+  def test_cancel(self):
+    future = Future()
+    called = []
+    future.add_done_callback(called.append)
+    self.assertTrue(future.cancel())
+    self.assertTrue(future.cancelled())
+    self.assertEqual([future], called)
+    self.assertRaises(CancelledError, future.result)
+    ran = []
+    run_in_future(future, ran.append, 1)
+    self.assertEqual([], ran)
+
+    running = Future()
+    self.assertTrue(running.set_running_or_notify_cancel())
+    self.assertFalse(running.cancel())
+
+  def test_wait_first(self):
+    pending, done = Future(), Future()
+    self.assertEqual(None, wait_first([pending, done], timeout=0))
+    done.set_result(1)
+    self.assertTrue(wait_first([pending, done]) is done)
+
+
+class WorkerPoolTest(unittest.TestCase):
+
+  def setUp(self):
+    self.pool = WorkerPool(max_workers=2, http_factory=object)
+
+  def tearDown(self):
+    self.pool.shutdown()
+
+  def test_submit(self):
+    submitted = [self.pool.submit(lambda x: x + 1, i) for i in xrange(10)]
+    self.assertEqual(range(1, 11), [f.result(5) for f in submitted])
+    self.assertTrue(isinstance(self.pool.submit(_fail).exception(5),
+                               ValueError))
+    self.assertTrue(len(self.pool._threads) <= 2)
+
+  def test_http_per_thread(self):
+    default = object()
+    self.assertTrue(self.pool.http(default) is default)
+    started = []
+    both_started = threading.Event()
+
+    def http():
+      # Hold each worker until both have a call, so they don't share one.
+      started.append(None)
+      if len(started) == 2:
+        both_started.set()
+      both_started.wait(5)
+      return self.pool.http(), self.pool.http()
+
+    submitted = [self.pool.submit(http) for _ in xrange(2)]
+    (first, again), (second, _) = [f.result(5) for f in submitted]
+    self.assertTrue(first is again)
+    self.assertFalse(first is second)
+
+  def test_shutdown(self):
+    started = threading.Event()
+    release = threading.Event()
+
+    def block():
+      started.set()
+      release.wait(5)
+      return 'ran'
+
+    future = self.pool.submit(block)
+    queued = self.pool.submit(lambda: 'queued')
+    started.wait(5)
+    self.pool.shutdown(wait=False)
+    self.assertRaises(RuntimeError, self.pool.submit, lambda: None)
+    release.set()
+    # Calls submitted before the shutdown still run.
+    self.assertEqual('ran', future.result(5))
+    self.assertEqual('queued', queued.result(5))
+    self.pool.shutdown()
+    for thread in self.pool._threads:
+      self.assertFalse(thread.is_alive())
+
+
+class _ThreadHttp(object):
+  """Answers with the name of the thread, or 404 for /missing."""
+
+  def __init__(self):
+    self.used = []
+
+  def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+    self.used.append(threading.current_thread().name)
+    status = '404' if uri.endswith('/missing') else '200'
+    return httplib2.Response({'status': status}), (
+        threading.current_thread().name)
+
+
+class ExecuteAsyncTest(unittest.TestCase):
+
+  def setUp(self):
+    self.https = []
+    self.pool = WorkerPool(max_workers=1, http_factory=self._http)
+
+  def tearDown(self):
+    self.pool.shutdown()
+
+  def _http(self):
+    http = _ThreadHttp()
+    self.https.append(http)
+    return http
+
+  def _request(self, path):
+    self.http = _ThreadHttp()
+    return HttpRequest(self.http, lambda resp, content: content,
+                       'https://example.com%s' % path, headers={})
+
+  def test_result(self):
+    future = self._request('/item').execute_async(pool=self.pool)
+    name = future.result(5)
+    self.assertNotEqual(threading.current_thread().name, name)
+    # The worker's own http was used rather than the request's.
+    self.assertEqual([], self.http.used)
+    self.assertEqual([[name]], [http.used for http in self.https])
+
+  def test_explicit_http(self):
+    http = _ThreadHttp()
+    self._request('/item').execute_async(http=http, pool=self.pool).result(5)
+    self.assertEqual(1, len(http.used))
+    self.assertEqual([], self.https)
+
+  def test_error(self):
+    future = self._request('/missing').execute_async(pool=self.pool)
+    self.assertRaises(HttpError, future.result, 5)
+    self.assertEqual(404, future.exception().resp.status)
+
+
+if __name__ == '__main__':
+  unittest.main()
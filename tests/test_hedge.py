@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for apiclient.hedge."""
+
+import threading
+import time
+import unittest
+
+from apiclient.hedge import RequestHedger
+
+
+class _AuthorizedHttp(object):
+  """Stands in for an Http wrapped by credentials.authorize()."""
+
+  def __init__(self, credentials):
+
+    def request(*args, **kwargs):
+      raise AssertionError('Not used by the tests.')
+
+    request.credentials = credentials
+    self.request = request
+
+
+class RequestHedgerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.hedger = None
+
+  def tearDown(self):
+    if self.hedger is not None:
+      self.hedger.shutdown()
+
+  def _hedger(self, credentials):
+    self.hedger = RequestHedger(lambda: _AuthorizedHttp(credentials),
+                                delay=0.01)
+    return self.hedger
+
+  def test_other_credentials_sent_on_callers_http(self):
+    hedger = self._hedger(object())
+    caller = _AuthorizedHttp(object())
+    used = []
+
+    def send(http):
+      used.append(http)
+      time.sleep(0.05)
+      return 'resp', 'content'
+
+    self.assertEqual(('resp', 'content'), hedger.request(send, caller))
+    self.assertEqual([caller], used)
+    self.assertEqual(1, hedger.stats()['mismatched'])
+    self.assertEqual(0, hedger.stats()['hedged'])
+
+  def test_authorization_header_mismatch_not_hedged(self):
+    self.hedger = RequestHedger(lambda: object(), delay=0.01)
+    caller = _AuthorizedHttp(object())
+    used = []
+    send = lambda http: used.append(http) or ('resp', 'content')
+    self.hedger.request(send, caller,
+                        headers={'Authorization': 'Bearer token'})
+    self.assertEqual([caller], used)
+
+  def test_same_credentials_hedged(self):
+    credentials = object()
+    hedger = self._hedger(credentials)
+    caller = _AuthorizedHttp(credentials)
+    lock = threading.Lock()
+    calls = []
+
+    def send(http):
+      with lock:
+        calls.append(http)
+        first = len(calls) == 1
+      self.assertTrue(http is not caller)
+      self.assertTrue(http.request.credentials is credentials)
+      if first:
+        time.sleep(0.2)
+        return 'slow', ''
+      return 'fast', ''
+
+    self.assertEqual(('fast', ''), hedger.request(send, caller))
+    self.assertEqual(2, len(calls))
+    self.assertEqual(1, hedger.stats()['hedge_wins'])
+
+
+if __name__ == '__main__':
+  unittest.main()
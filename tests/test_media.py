@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the media uploads of apiclient.http."""
+
+import StringIO
+import mmap
+import os
+import shutil
+import tempfile
+import unittest
+
+import httplib2
+
+from apiclient import http as apiclient_http
+from apiclient.errors import HttpError
+from apiclient.errors import InvalidChunkSizeError
+from apiclient.http import ADAPTIVE_CHUNK_SECONDS
+from apiclient.http import CHUNK_GRANULARITY
+from apiclient.http import HttpRequest
+from apiclient.http import MAX_ADAPTIVE_CHUNK_SIZE
+from apiclient.http import MediaFileUpload
+from apiclient.http import MediaIoBaseUpload
+from apiclient.http import MediaStreamUpload
+from apiclient.http import _adapt_chunksize
+from apiclient.retry import RetryPolicy
+
+UPLOAD_URI = 'https://www.googleapis.com/upload/drive/v2/files?id=1'
+
+
+class _Pipe(object):
+  """A source that can't seek and returns at most 1000 bytes per read."""
+
+  def __init__(self, data):
+    self._data = data
+
+  def read(self, length):
+    data = self._data[:min(length, 1000)]
+    self._data = self._data[len(data):]
+    return data
+
+
+class _UploadHttp(object):
+  """Starts an upload, then acknowledges what each chunk sends.
+
+  acknowledge maps a chunk number to the number of bytes of it the server
+  keeps, for chunks it only takes part of.
+  """
+
+  def __init__(self, acknowledge=None):
+    self._acknowledge = acknowledge or {}
+    self.ranges = []
+    self.received = ''
+
+  def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+    if method == 'POST':
+      return httplib2.Response({'status': '200', 'location': UPLOAD_URI}), ''
+    content_range = headers['Content-Range']
+    self.ranges.append(content_range)
+    if hasattr(body, 'read'):
+      body = body.read()
+    body = str(body or '')
+    body = body[:self._acknowledge.get(len(self.ranges), len(body))]
+    self.received += body
+    total = content_range.rsplit('/', 1)[1]
+    if total != '*' and len(self.received) == int(total):
+      return httplib2.Response({'status': '200'}), '{"id": "f1"}'
+    return httplib2.Response({
+        'status': '308',
+        'range': 'bytes=0-%d' % (len(self.received) - 1)}), ''
+
+
+def _upload(media, http):
+  request = HttpRequest(http, lambda resp, content: content,
+                        'https://example.com/files', method='POST',
+                        body='{}', headers={}, resumable=media)
+  response = None
+  while response is None:
+    _, response = request.next_chunk()
+  return response
+
+
+class MediaStreamUploadTest(unittest.TestCase):
+
+  def test_chunks_sent_with_unknown_size_until_the_last(self):
+    data = 'x' * (2 * CHUNK_GRANULARITY + 1000)
+    http = _UploadHttp()
+    media = MediaStreamUpload(_Pipe(data), 'text/plain',
+                              chunksize=CHUNK_GRANULARITY)
+    self.assertEqual('{"id": "f1"}', _upload(media, http))
+    self.assertEqual(['bytes 0-262143/*', 'bytes 262144-524287/*',
+                      'bytes 524288-525287/525288'], http.ranges)
+    self.assertEqual(data, http.received)
+    self.assertEqual(len(data), media.size())
+
+  def test_last_chunk_of_exactly_chunksize_has_size(self):
+    data = 'x' * (2 * CHUNK_GRANULARITY)
+    http = _UploadHttp()
+    media = MediaStreamUpload(iter([data[:5000], '', data[5000:]]),
+                              'text/plain', chunksize=CHUNK_GRANULARITY)
+    _upload(media, http)
+    self.assertEqual(['bytes 0-262143/*', 'bytes 262144-524287/524288'],
+                     http.ranges)
+    self.assertEqual(data, http.received)
+
+  def test_empty_stream(self):
+    http = _UploadHttp()
+    _upload(MediaStreamUpload(iter([]), 'text/plain'), http)
+    self.assertEqual(['bytes */0'], http.ranges)
+
+  def test_resumes_from_bytes_acknowledged(self):
+    data = ''.join(chr(i % 256) for i in xrange(CHUNK_GRANULARITY + 500))
+    # The server keeps only the first 100000 bytes of the first chunk.
+    http = _UploadHttp(acknowledge={1: 100000})
+    media = MediaStreamUpload(_Pipe(data), 'application/octet-stream',
+                              chunksize=CHUNK_GRANULARITY)
+    _upload(media, http)
+    self.assertEqual(['bytes 0-262143/*', 'bytes 100000-262643/262644'],
+                     http.ranges)
+    self.assertEqual(data, http.received)
+
+  def test_acknowledged_bytes_dropped(self):
+    media = MediaStreamUpload(_Pipe('x' * 5000), 'text/plain',
+                              chunksize=CHUNK_GRANULARITY)
+    self.assertEqual(4000, len(media.getbytes(1000, 4000)))
+    self.assertRaises(ValueError, media.getbytes, 0, 10)
+
+  def test_chunksize_must_be_multiple_of_granularity(self):
+    self.assertRaises(InvalidChunkSizeError, MediaStreamUpload, iter([]),
+                      'text/plain', chunksize=1000)
+
+
+class AdaptChunksizeTest(unittest.TestCase):
+
+  def test_grows_on_fast_chunks(self):
+    self.assertEqual(2 * CHUNK_GRANULARITY,
+                     _adapt_chunksize(CHUNK_GRANULARITY, CHUNK_GRANULARITY,
+                                      0.1, False))
+
+  def test_at_most_doubles(self):
+    self.assertEqual(8 * CHUNK_GRANULARITY,
+                     _adapt_chunksize(4 * CHUNK_GRANULARITY,
+                                      4 * CHUNK_GRANULARITY, 0.0, False))
+
+  def test_short_last_chunk_not_grown(self):
+    self.assertEqual(4 * CHUNK_GRANULARITY,
+                     _adapt_chunksize(4 * CHUNK_GRANULARITY, 1000, 0.1, False))
+
+  def test_kept_when_neither_fast_nor_slow(self):
+    self.assertEqual(4 * CHUNK_GRANULARITY,
+                     _adapt_chunksize(4 * CHUNK_GRANULARITY,
+                                      4 * CHUNK_GRANULARITY,
+                                      ADAPTIVE_CHUNK_SECONDS, False))
+
+  def test_shrinks_on_slow_chunks(self):
+    size = _adapt_chunksize(16 * CHUNK_GRANULARITY, 16 * CHUNK_GRANULARITY,
+                            4 * ADAPTIVE_CHUNK_SECONDS, False)
+    self.assertEqual(4 * CHUNK_GRANULARITY, size)
+
+  def test_halved_on_retry(self):
+    self.assertEqual(4 * CHUNK_GRANULARITY,
+                     _adapt_chunksize(8 * CHUNK_GRANULARITY, 0, 0, True))
+
+  def test_bounds_and_granularity(self):
+    self.assertEqual(CHUNK_GRANULARITY,
+                     _adapt_chunksize(CHUNK_GRANULARITY, 0, 0, True))
+    self.assertEqual(CHUNK_GRANULARITY,
+                     _adapt_chunksize(CHUNK_GRANULARITY, 1000, 100.0, False))
+    self.assertEqual(MAX_ADAPTIVE_CHUNK_SIZE,
+                     _adapt_chunksize(MAX_ADAPTIVE_CHUNK_SIZE,
+                                      MAX_ADAPTIVE_CHUNK_SIZE, 0.0, False))
+    for elapsed in (0.3, 1.1, 1.7, 9.5, 13.0):
+      size = _adapt_chunksize(3 * CHUNK_GRANULARITY, 3 * CHUNK_GRANULARITY,
+                              elapsed, False)
+      self.assertEqual(0, size % CHUNK_GRANULARITY)
+
+
+class _FlakyHttp(_UploadHttp):
+  """Fails the chunks numbered in fail with a 503."""
+
+  def __init__(self, fail):
+    _UploadHttp.__init__(self)
+    self._fail = fail
+    self._puts = 0
+
+  def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+    if method == 'PUT':
+      self._puts += 1
+      if self._puts in self._fail:
+        return httplib2.Response({'status': '503'}), ''
+    return _UploadHttp.request(self, uri, method=method, body=body,
+                               headers=headers)
+
+
+class AdaptiveUploadTest(unittest.TestCase):
+
+  def setUp(self):
+    self.old_policy = apiclient_http.retry_policy
+    apiclient_http.retry_policy = RetryPolicy()
+
+  def tearDown(self):
+    apiclient_http.retry_policy = self.old_policy
+
+  def _request(self, http, chunksize):
+    media = MediaIoBaseUpload(StringIO.StringIO('x' * (40 * CHUNK_GRANULARITY)),
+                              'text/plain', chunksize=chunksize,
+                              resumable=True)
+    request = HttpRequest(http, lambda resp, content: content,
+                          'https://example.com/files', method='POST',
+                          body='{}', headers={}, resumable=media)
+    request._sleep = lambda delay: None
+    return request
+
+  def _chunksizes(self, http, num_retries=0):
+    request = self._request(http, CHUNK_GRANULARITY)
+    sizes = []
+    response = None
+    while response is None:
+      status, response = request.next_chunk(http=http, adaptive=True,
+                                            num_retries=num_retries)
+      if status is not None:
+        sizes.append(status.chunksize // CHUNK_GRANULARITY)
+    return sizes
+
+  def test_chunks_grow_while_fast(self):
+    self.assertEqual([2, 4, 8, 16, 32], self._chunksizes(_UploadHttp()))
+
+  def test_chunks_shrink_after_retry(self):
+    # The third chunk, of four units, is retried once.
+    self.assertEqual([2, 4, 2, 4, 8, 16, 32],
+                     self._chunksizes(_FlakyHttp([3]), num_retries=1))
+
+  def test_chunk_shrinks_after_error(self):
+    http = _FlakyHttp([1])
+    request = self._request(http, 8 * CHUNK_GRANULARITY)
+    self.assertRaises(HttpError, request.next_chunk, http=http, adaptive=True)
+    self.assertEqual(4 * CHUNK_GRANULARITY, request.resumable_chunksize)
+
+
+class MediaFileUploadMmapTest(unittest.TestCase):
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.filename = os.path.join(self.dir, 'data.bin')
+    self.data = ''.join(chr(i % 251) for i in xrange(3 * CHUNK_GRANULARITY
+                                                     + 1234))
+    with open(self.filename, 'wb') as f:
+      f.write(self.data)
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def _media(self, **kwargs):
+    return MediaFileUpload(self.filename, mimetype='application/octet-stream',
+                           use_mmap=True, **kwargs)
+
+  def _mappings(self):
+    with open('/proc/self/maps') as maps:
+      return len([line for line in maps if self.filename in line])
+
+  def test_getbytes(self):
+    media = self._media()
+    granularity = mmap.ALLOCATIONGRANULARITY
+    for begin, length in [(0, 10), (granularity - 3, 7),
+                          (CHUNK_GRANULARITY - 1, CHUNK_GRANULARITY + 2),
+                          (2 * granularity + 1, granularity),
+                          (len(self.data) - 5, 100), (len(self.data), 10),
+                          (100, -1)]:
+      chunk = media.getbytes(begin, length)
+      if length < 0:
+        length = len(self.data)
+      self.assertEqual(self.data[begin:begin + length], str(chunk))
+    self.assertFalse(media.has_stream())
+
+  def test_mapping_closed_with_buffer(self):
+    if not os.path.exists('/proc/self/maps'):
+      return
+    media = self._media()
+    chunk = media.getbytes(5000, CHUNK_GRANULARITY)
+    self.assertEqual(1, self._mappings())
+    self.assertEqual(self.data[5000:5000 + CHUNK_GRANULARITY], chunk[:])
+    del chunk
+    self.assertEqual(0, self._mappings())
+
+  def test_upload(self):
+    http = _UploadHttp()
+    media = self._media(chunksize=CHUNK_GRANULARITY, resumable=True)
+    self.assertEqual('{"id": "f1"}', _upload(media, http))
+    self.assertEqual(self.data, http.received)
+    self.assertEqual(4, len(http.ranges))
+    if os.path.exists('/proc/self/maps'):
+      self.assertEqual(0, self._mappings())
+
+  def test_json_round_trip(self):
+    media = MediaFileUpload.from_json(self._media().to_json())
+    self.assertTrue(media._use_mmap)
+    self.assertEqual(self.data[10:20], str(media.getbytes(10, 10)))
+
+
+if __name__ == '__main__':
+  unittest.main()
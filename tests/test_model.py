@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for apiclient.model."""
+
+import copy
+import json
+import unittest
+
+import httplib2
+
+from apiclient import http as apiclient_http
+from apiclient.cache import ResponseCache
+from apiclient.fieldmask import FieldMaskTracker
+from apiclient.http import HttpRequest
+from apiclient.model import Interner
+from apiclient.model import JsonModel
+from apiclient.model import StreamingListModel
+from apiclient.model import StreamingListResponse
+from apiclient.model import TrackedResource
+from apiclient.model import makepatch
+from oauth2client import anyjson
+
+PAGE = ('{"kind": "calendar#events", "items": [{"id": "a"}, {"id": "b"}], '
+        '"nextPageToken": "t"}')
+
+
+class StreamingListModelTest(unittest.TestCase):
+
+  def test_iterates_over_field_names(self):
+    response = StreamingListModel().deserialize(PAGE)
+    self.assertEqual(['items', 'kind', 'nextPageToken'], sorted(response))
+    self.assertEqual(sorted(response), sorted(response.keys()))
+    self.assertEqual([{'id': 'a'}, {'id': 'b'}], list(response['items']))
+
+  def test_fields_read_with_codec(self):
+    json_codec = anyjson.get_codec('json')
+    calls = []
+
+    def raw_decode(content, idx):
+      calls.append(idx)
+      return json_codec.raw_decode(content, idx)
+
+    codec = anyjson.JsonCodec('counting', json_codec.loads, json_codec.dumps,
+                              raw_decode=raw_decode)
+    response = StreamingListModel(codec=codec).deserialize(PAGE)
+    self.assertEqual('t', response['nextPageToken'])
+    self.assertTrue(calls)
+
+  def test_codec_without_raw_decode_parses_whole_body(self):
+    json_codec = anyjson.get_codec('json')
+    codec = anyjson.JsonCodec('whole', json_codec.loads, json_codec.dumps)
+    response = StreamingListModel(codec=codec).deserialize(PAGE)
+    self.assertEqual(json_codec.loads(PAGE), response)
+
+  def test_not_kept_by_response_cache(self):
+    old_cache = apiclient_http.response_cache
+    apiclient_http.response_cache = cache = ResponseCache()
+    try:
+      http = httplib2.Http()
+      http.request = lambda *args, **kwargs: (
+          httplib2.Response({'status': '200', 'etag': '"1"'}), PAGE)
+      request = HttpRequest(http, StreamingListModel().response,
+                            'https://www.googleapis.com/calendar/v3/events',
+                            headers={}, methodId='calendar.events.list')
+      self.assertTrue(isinstance(request.execute(), StreamingListResponse))
+      self.assertEqual(0, cache.stats()['entries'])
+    finally:
+      apiclient_http.response_cache = old_cache
+
+
+def _event():
+  return {
+      'summary': 'work',
+      'location': 'office',
+      'colorId': None,
+      'reminders': {'useDefault': False, 'overrides': None},
+      'start': {'date': None, 'dateTime': '2014-06-02T09:00:00Z'},
+      'attendees': [{'email': 'a@example.com'}],
+      }
+
+
+class MakepatchTest(unittest.TestCase):
+
+  def test_unchanged_none_left_out(self):
+    original = {'reminders': {'overrides': None},
+                'start': {'date': None, 'dateTime': 't'}}
+    self.assertEqual({}, makepatch(original, copy.deepcopy(original)))
+
+  def test_changes(self):
+    original = _event()
+    modified = copy.deepcopy(original)
+    modified['summary'] = 'leave'
+    del modified['location']
+    del modified['colorId']
+    modified['reminders']['useDefault'] = True
+    modified['start']['date'] = '2014-06-02'
+    modified['attendees'][0]['email'] = 'b@example.com'
+    modified['transparency'] = 'opaque'
+    modified['visibility'] = None
+    self.assertEqual({
+        'summary': 'leave',
+        'location': None,
+        'reminders': {'useDefault': True},
+        'start': {'date': '2014-06-02'},
+        'attendees': [{'email': 'b@example.com'}],
+        'transparency': 'opaque',
+        'visibility': None,
+        }, makepatch(original, modified))
+
+  def test_field_left_out_of_original_cleared(self):
+    self.assertEqual({'location': None}, makepatch({}, {'location': None}))
+
+
+class TrackedResourceTest(unittest.TestCase):
+
+  def assertSamePatch(self, change):
+    """Check that tracking change() makes the patch makepatch() does."""
+    modified = _event()
+    change(modified)
+    expected = makepatch(_event(), modified)
+    tracked = TrackedResource(_event())
+    change(tracked)
+    self.assertEqual(expected, tracked.makepatch())
+    self.assertEqual(modified, tracked)
+    return tracked
+
+  def test_unchanged(self):
+    tracked = TrackedResource(_event())
+    tracked['start']['date']
+    list(tracked['attendees'])
+    self.assertFalse(tracked.changed())
+    self.assertEqual({}, tracked.makepatch())
+
+  def test_none_set_again_left_out(self):
+    def change(event):
+      event['colorId'] = None
+      event['reminders']['overrides'] = None
+      event['start']['date'] = None
+    tracked = self.assertSamePatch(change)
+    self.assertEqual({}, tracked.makepatch())
+
+  def test_changes(self):
+    def change(event):
+      event['summary'] = 'leave'
+      del event['location']
+      event['reminders']['useDefault'] = True
+      event['start']['date'] = '2014-06-02'
+      event['transparency'] = 'opaque'
+      event['visibility'] = None
+    self.assertSamePatch(change)
+
+  def test_field_left_out_cleared(self):
+    tracked = TrackedResource({})
+    tracked['location'] = None
+    tracked['summary'] = 'work'
+    del tracked['summary']
+    self.assertEqual({'location': None}, tracked.makepatch())
+
+  def test_array_sent_whole(self):
+    def change(event):
+      event['attendees'][0]['email'] = 'b@example.com'
+    tracked = self.assertSamePatch(change)
+    self.assertEqual([{'email': 'b@example.com'}],
+                     tracked.makepatch()['attendees'])
+
+  def test_clear_changes(self):
+    tracked = TrackedResource(_event())
+    tracked['reminders']['useDefault'] = True
+    self.assertTrue(tracked.changed())
+    tracked.clear_changes()
+    self.assertFalse(tracked.changed())
+    tracked['attendees'].append({'email': 'b@example.com'})
+    self.assertEqual(['attendees'], tracked.makepatch().keys())
+
+  def test_objects_of_another_resource_copied(self):
+    other = TrackedResource(_event())
+    tracked = TrackedResource(_event())
+    tracked['reminders'] = other['reminders']
+    tracked.clear_changes()
+    tracked['reminders']['useDefault'] = True
+    self.assertEqual({'reminders': {'useDefault': True}},
+                     tracked.makepatch())
+    self.assertFalse(other.changed())
+
+  def test_tracked_response_wrapped(self):
+    tracker = FieldMaskTracker(warmup=1)
+    _, recorder = tracker.prepare('calendar.events.get', 'https://x/e')
+    response = recorder.wrap(_event())
+    response['summary']
+    tracked = TrackedResource(response)
+    tracked['start']['date'] = '2014-06-02'
+    tracked['attendees'][0]['email'] = 'b@example.com'
+    self.assertEqual({'start': {'date': '2014-06-02'},
+                      'attendees': [{'email': 'b@example.com'}]},
+                     tracked.makepatch())
+    self.assertEqual(dict, type(tracked.copy()['start']))
+    # Copying the response into the resource read all of it, so it isn't
+    # masked to the summary.
+    self.assertEqual(None, tracker.mask('calendar.events.get'))
+
+
+EVENTS = ('{"items": ['
+          '{"id": "a", "creator": {"email": "a@example.com"}, '
+          '"start": {"timeZone": "Europe/Zurich"}, "tags": ["work"]}, '
+          '{"id": "b", "creator": {"email": "a@example.com"}, '
+          '"start": {"timeZone": "Europe/Zurich"}, "tags": ["work"], '
+          '"description": "%s"}]}' % ('x' * 40))
+
+
+class InternerTest(unittest.TestCase):
+
+  def _check_shared(self, codec):
+    interner = Interner(max_length=32)
+    page = JsonModel(codec=codec, interner=interner).deserialize(EVENTS)
+    self.assertEqual(JsonModel(codec=codec).deserialize(EVENTS), page)
+    first, second = page['items']
+    for key in ('creator', 'start', 'tags'):
+      self.assertTrue([k for k in first if k == key][0] is
+                      [k for k in second if k == key][0])
+    self.assertTrue(first['creator']['email'] is second['creator']['email'])
+    self.assertTrue(first['start']['timeZone'] is
+                    second['start']['timeZone'])
+    self.assertTrue(first['tags'][0] is second['tags'][0])
+    stats = interner.stats()
+    self.assertTrue(stats['shared'] >= 8)
+    self.assertTrue(stats['bytes_saved'] > 0)
+    # The description is longer than max_length, so it isn't held.
+    self.assertFalse(second['description'] in interner._table)
+    return interner
+
+  def test_hooked_codec(self):
+    self.assertTrue(anyjson.get_codec('json').hooked_loads is not None)
+    self._check_shared('json')
+
+  def test_copied_without_hook(self):
+    codec = anyjson.JsonCodec('plain', json.loads, json.dumps)
+    self._check_shared(codec)
+
+  def test_shared_between_responses(self):
+    interner = Interner()
+    model = JsonModel(codec='json', interner=interner)
+    first = model.deserialize(EVENTS)['items'][0]
+    second = model.deserialize(EVENTS)['items'][0]
+    self.assertTrue(first['creator']['email'] is second['creator']['email'])
+    interner.clear()
+    self.assertEqual(0, interner.stats()['entries'])
+    third = model.deserialize(EVENTS)['items'][0]
+    self.assertEqual(first, third)
+    self.assertFalse(first['creator']['email'] is third['creator']['email'])
+
+  def test_max_entries(self):
+    interner = Interner(max_entries=3)
+    page = JsonModel(codec='json', interner=interner).deserialize(EVENTS)
+    self.assertEqual(3, interner.stats()['entries'])
+    self.assertEqual(JsonModel(codec='json').deserialize(EVENTS), page)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for requests made through the rate limiter and circuit breaker."""
+
+import time
+import unittest
+
+import httplib2
+
+from apiclient import http as apiclient_http
+from apiclient.breaker import CLOSED
+from apiclient.breaker import CircuitBreaker
+from apiclient.deadline import Deadline
+from apiclient.errors import DeadlineExceededError
+from apiclient.ratelimit import QuotaScheduler
+
+URI = 'https://www.googleapis.com/calendar/v3/calendars/primary/events'
+
+
+class _SlowLimiter(object):
+  """A rate limiter that makes every request wait."""
+
+  def __init__(self, wait):
+    self._wait = wait
+    self.feedback_calls = 0
+
+  def acquire(self, key):
+    time.sleep(self._wait)
+
+  def feedback(self, key, resp, content):
+    self.feedback_calls += 1
+
+
+class _FastHttp(object):
+
+  def request(self, uri, method='GET', body=None, headers=None):
+    return httplib2.Response({'status': '200'}), '{}'
+
+
+class PacedRequestTest(unittest.TestCase):
+
+  def setUp(self):
+    self.old = (apiclient_http.rate_limiter, apiclient_http.circuit_breaker)
+
+  def tearDown(self):
+    apiclient_http.rate_limiter, apiclient_http.circuit_breaker = self.old
+
+  def test_rate_limit_wait_not_timed_by_breaker(self):
+    limiter = _SlowLimiter(0.05)
+    breaker = CircuitBreaker(slow_call_seconds=0.02, slow_call_rate=0.5,
+                             window=2, min_calls=2)
+    apiclient_http.rate_limiter = limiter
+    apiclient_http.circuit_breaker = breaker
+    for _ in xrange(4):
+      resp, _ = apiclient_http._paced_request(_FastHttp(), 'calendar.get',
+                                              URI)
+      self.assertEqual(200, resp.status)
+    self.assertEqual(CLOSED, breaker.state(URI))
+    self.assertEqual(4, limiter.feedback_calls)
+
+  def test_rate_limit_wait_capped_by_deadline(self):
+    limiter = QuotaScheduler(rate=1.0)
+    slept = []
+    limiter._sleep = slept.append
+    apiclient_http.rate_limiter = limiter
+    apiclient_http.circuit_breaker = None
+    apiclient_http._paced_request(_FastHttp(), 'calendar.get', URI,
+                                  deadline=Deadline(0.5))
+    # The next token is a second away, past the deadline.
+    self.assertRaises(DeadlineExceededError, apiclient_http._paced_request,
+                      _FastHttp(), 'calendar.get', URI, deadline=Deadline(0.5))
+    self.assertEqual([], slept)
+    stats = limiter.stats().values()[0]
+    self.assertEqual(1, stats['requests'])
+    self.assertEqual(1, stats['refused'])
+    apiclient_http._paced_request(_FastHttp(), 'calendar.get', URI,
+                                  deadline=Deadline(5.0))
+    self.assertEqual(1, len(slept))
+
+
+def _response(status, reason=None):
+  content = '{}'
+  if reason is not None:
+    content = ('{"error": {"errors": [{"reason": "%s"}], "code": %d}}'
+               % (reason, status))
+  return httplib2.Response({'status': str(status)}), content
+
+
+class QuotaSchedulerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.now = 1000.0
+    self.slept = []
+    self.limiter = QuotaScheduler(rate=10.0, min_rate=1.0, increase=0.5,
+                                  cooldown=1.0)
+    self.limiter._clock = lambda: self.now
+    self.limiter._sleep = self.slept.append
+    self.limiter.acquire('k')
+
+  def _rate(self):
+    return self.limiter.stats()['k']['rate']
+
+  def _feedback(self, status, reason=None):
+    resp, content = _response(status, reason)
+    self.limiter.feedback('k', resp, content)
+
+  def test_halved_on_rate_limit_error(self):
+    self._feedback(429)
+    self.assertEqual(5.0, self._rate())
+    self.now += 1.0
+    self._feedback(403, 'userRateLimitExceeded')
+    self.assertEqual(2.5, self._rate())
+    self.assertEqual(2, self.limiter.stats()['k']['rate_limited'])
+
+  def test_other_403_leaves_rate(self):
+    self._feedback(403, 'forbidden')
+    self.assertEqual(10.0, self._rate())
+
+  def test_errors_in_flight_halve_once(self):
+    self._feedback(429)
+    self.now += 0.5
+    self._feedback(429)
+    self.assertEqual(5.0, self._rate())
+
+  def test_recovers_additively(self):
+    self._feedback(429)
+    for expected in (5.5, 6.0, 6.5):
+      self._feedback(200)
+      self.assertEqual(expected, self._rate())
+    # Server errors say nothing about the quota.
+    self._feedback(503)
+    self.assertEqual(6.5, self._rate())
+
+  def test_floor_and_ceiling(self):
+    for _ in xrange(10):
+      self.now += 1.0
+      self._feedback(429)
+    self.assertEqual(1.0, self._rate())
+    for _ in xrange(100):
+      self._feedback(200)
+    self.assertEqual(10.0, self._rate())
+
+  def test_requests_paced_at_rate(self):
+    self._feedback(429)
+    self.now += 1.0
+    self._feedback(429)
+    # The burst is spent, so requests wait for tokens at 2.5 per second.
+    for _ in xrange(20):
+      self.limiter.acquire('k')
+    self.assertEqual(0.4, round(self.slept[-1] - self.slept[-2], 6))
+
+
+if __name__ == '__main__':
+  unittest.main()
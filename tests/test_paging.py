@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for apiclient.paging."""
+
+import unittest
+import urlparse
+
+from apiclient import futures
+from apiclient import paging
+
+
+class _LateCallbackFuture(futures.Future):
+  """A future that finishes when waited on, without running its callbacks.
+
+  Waiters are woken before done callbacks run, so this is what pages() sees
+  when it gets to a response before the prefetcher's callback does.
+  """
+
+  def __init__(self, page):
+    futures.Future.__init__(self)
+    self._page = page
+    self._late = []
+
+  def _invoke_callbacks(self):
+    self._late.extend(self._callbacks)
+
+  def _wait(self, timeout):
+    if not self.done():
+      self.set_result(self._page)
+    futures.Future._wait(self, timeout)
+
+  def run_late_callbacks(self):
+    for callback in self._late:
+      callback(self)
+
+
+class _FakeRequest(object):
+  """A list request for pages keyed by their pageToken."""
+
+  def __init__(self, pages, sent):
+    self.uri = 'http://example.com/items'
+    self._pages = pages
+    self._sent = sent
+
+  def execute_async(self, http=None, num_retries=0, pool=None,
+                    deadline=None):
+    query = dict(urlparse.parse_qsl(urlparse.urlparse(self.uri).query))
+    future = _LateCallbackFuture(self._pages[query.get('pageToken')])
+    self._sent.append(future)
+    return future
+
+
+def _pages(count):
+  pages = {}
+  token = None
+  for i in xrange(count):
+    next_token = 'p%d' % (i + 1) if i + 1 < count else None
+    page = {'items': [i]}
+    if next_token:
+      page['nextPageToken'] = next_token
+    pages[token] = page
+    token = next_token
+  return pages
+
+
+class PrefetcherTest(unittest.TestCase):
+
+  def test_callback_after_result_keeps_paging(self):
+    sent = []
+    request = _FakeRequest(_pages(3), sent)
+    items = list(paging.iter_items(request, prefetch=1))
+    self.assertEqual([0, 1, 2], items)
+    self.assertEqual(3, len(sent))
+
+  def test_late_callbacks_send_nothing_more(self):
+    sent = []
+    request = _FakeRequest(_pages(3), sent)
+    pages = paging.iter_pages(request, prefetch=2)
+    self.assertEqual([0], pages.next()['items'])
+    for future in list(sent):
+      future.run_late_callbacks()
+    self.assertEqual([[1], [2]], [page['items'] for page in pages])
+    self.assertEqual(3, len(sent))
+
+
+if __name__ == '__main__':
+  unittest.main()
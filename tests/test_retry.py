@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for apiclient.retry and its use by BatchHttpRequest."""
+
+import httplib
+import logging
+import unittest
+
+import httplib2
+
+from apiclient import batchcodec
+from apiclient import http as apiclient_http
+from apiclient.retry import RetryBudget
+from apiclient.retry import RetryPolicy
+from apiclient.retry import RetryRule
+from apiclient.retry import TRANSPORT_ERROR
+
+
+class _RecordingHandler(logging.Handler):
+
+  def __init__(self):
+    logging.Handler.__init__(self)
+    self.records = []
+
+  def emit(self, record):
+    self.records.append(record)
+
+
+class _BatchHttp(object):
+  """Answers every part of a batch with the next status for its path."""
+
+  def __init__(self, statuses):
+    self._statuses = statuses
+    self.posts = 0
+
+  def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+    self.posts += 1
+    parts = []
+    for content_id, payload in batchcodec.iter_mixed(
+        body, headers['content-type']):
+      path = payload.split(' ', 2)[1]
+      status = self._statuses[path].pop(0)
+      parts.append(('<response-%s>' % content_id[1:-1],
+                    'HTTP/1.1 %d Status\nContent-Type: application/json\n\n{}'
+                    % status))
+    content, boundary = batchcodec.write_mixed(parts)
+    return httplib2.Response({
+        'status': '200',
+        'content-type': 'multipart/mixed; boundary="%s"' % boundary,
+        }), content
+
+
+class RetryPolicyTest(unittest.TestCase):
+
+  def setUp(self):
+    self.handler = _RecordingHandler()
+    logging.getLogger('apiclient.retry').addHandler(self.handler)
+    self.root_handler = _RecordingHandler()
+    logging.getLogger().addHandler(self.root_handler)
+    self.old_policy = apiclient_http.retry_policy
+
+  def tearDown(self):
+    logging.getLogger('apiclient.retry').removeHandler(self.handler)
+    logging.getLogger().removeHandler(self.root_handler)
+    apiclient_http.retry_policy = self.old_policy
+
+  def _failing_send(self, failures):
+    responses = ([httplib2.Response({'status': '503'})] * failures +
+                 [httplib2.Response({'status': '200'})])
+    return lambda: (responses.pop(0), '{}')
+
+  def test_num_retries_uncapped_without_budget(self):
+    policy = RetryPolicy()
+    resp, _ = policy.run(self._failing_send(20), 20, lambda delay: None,
+                         lambda: 0.0)
+    self.assertEqual(200, resp.status)
+
+  def test_budget_caps_retries(self):
+    policy = RetryPolicy(budget=RetryBudget(ratio=0.1, min_retries=2))
+    resp, _ = policy.run(self._failing_send(20), 20, lambda delay: None,
+                         lambda: 0.0)
+    self.assertEqual(503, resp.status)
+    self.assertEqual(2, policy.budget.stats()['retries'])
+
+  def test_httplib_errors_retried_as_transport_errors(self):
+    policy = RetryPolicy(rules={TRANSPORT_ERROR: RetryRule(retry=True)})
+    errors = [httplib.BadStatusLine(''), httplib.IncompleteRead('')]
+
+    def send():
+      if errors:
+        raise errors.pop(0)
+      return httplib2.Response({'status': '200'}), '{}'
+
+    resp, _ = policy.run(send, 2, lambda delay: None, lambda: 0.0)
+    self.assertEqual(200, resp.status)
+
+  def test_httplib_errors_raised_when_not_retried(self):
+    policy = RetryPolicy()
+
+    def send():
+      raise httplib.BadStatusLine('')
+
+    self.assertRaises(httplib.BadStatusLine, policy.run, send, 2,
+                      lambda delay: None, lambda: 0.0)
+
+  def _batch(self, http):
+    batch = apiclient_http.BatchHttpRequest(
+        batch_uri='https://example.com/batch')
+    batch._sleep = lambda delay: None
+    for i in xrange(3):
+      batch.add(apiclient_http.HttpRequest(
+          http, lambda resp, content: content,
+          'https://example.com/items/%d' % i, headers={}))
+    return batch
+
+  def test_batch_credits_budget_once_per_request(self):
+    budget = RetryBudget(ratio=0.5, min_retries=0, max_tokens=10)
+    apiclient_http.retry_policy = RetryPolicy(budget=budget)
+    http = _BatchHttp({
+        '/items/0': [503, 200],
+        '/items/1': [200],
+        '/items/2': [200],
+        })
+    self._batch(http).execute(http=http, num_retries=1)
+    self.assertEqual(2, http.posts)
+    # Three requests deposit 1.5 tokens, and the retry spends one.
+    self.assertEqual(0.5, budget.stats()['tokens'])
+
+  def test_retries_logged_to_module_logger(self):
+    apiclient_http.retry_policy = RetryPolicy()
+    http = _BatchHttp({
+        '/items/0': [503, 200],
+        '/items/1': [200],
+        '/items/2': [200],
+        })
+    self._batch(http).execute(http=http, num_retries=1)
+    self.assertEqual(1, len(self.handler.records))
+    self.assertEqual('apiclient.retry', self.handler.records[0].name)
+    self.assertEqual([], [r for r in self.root_handler.records
+                          if r.name == 'root'])
+
+
+if __name__ == '__main__':
+  unittest.main()
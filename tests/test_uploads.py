@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for apiclient.uploads."""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import httplib2
+
+from apiclient.http import HttpRequest
+from apiclient.http import MediaFileUpload
+from apiclient.uploads import UploadJournal
+from apiclient.uploads import UploadManager
+
+UPLOAD_URI = 'https://www.googleapis.com/upload/drive/v2/files?id=1'
+SIZE = 1000
+
+
+class _UploadHttp(object):
+  """Answers a status query with the bytes received, then completes."""
+
+  def __init__(self, received):
+    self._received = received
+    self.ranges = []
+    self.threads = set()
+
+  def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+    self.threads.add(threading.current_thread())
+    self.ranges.append(headers['Content-Range'])
+    if headers['Content-Range'].startswith('bytes */'):
+      if not self._received:
+        return httplib2.Response({'status': '308'}), ''
+      return httplib2.Response({
+          'status': '308', 'range': 'bytes=0-%d' % (self._received - 1)}), ''
+    return httplib2.Response({'status': '200'}), '{"id": "f1"}'
+
+
+class UploadTest(unittest.TestCase):
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.journal_name = os.path.join(self.dir, 'uploads.journal')
+    self.media_name = os.path.join(self.dir, 'media.bin')
+    f = open(self.media_name, 'wb')
+    f.write('x' * SIZE)
+    f.close()
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def _request(self, progress):
+    media = MediaFileUpload(self.media_name, mimetype='text/plain',
+                            chunksize=-1, resumable=True)
+    request = HttpRequest(None, None, 'https://example.com/files',
+                          method='POST', body='{}', headers={},
+                          resumable=media)
+    request.resumable_uri = UPLOAD_URI
+    request.resumable_progress = progress
+    return request
+
+  def test_journal_round_trip(self):
+    journal = UploadJournal(self.journal_name)
+    journal.record('a', 'first')
+    journal.record('b', 'second')
+    journal.record('a', 'third')
+    journal.remove('b')
+    journal.close()
+    # A line cut short by a crash is skipped.
+    f = open(self.journal_name, 'ab')
+    f.write('{"id": "c", "req')
+    f.close()
+    journal = UploadJournal(self.journal_name)
+    self.assertEqual({'a': 'third'}, journal.entries())
+    journal.close()
+    # Reopening compacted the file to the live entries.
+    self.assertEqual(1, len(open(self.journal_name).readlines()))
+
+  def test_resume_asks_for_status_first(self):
+    journal = UploadJournal(self.journal_name)
+    journal.record('f1', self._request(200).to_json())
+    journal.close()
+    http = _UploadHttp(600)
+    manager = UploadManager(self.journal_name, http_factory=lambda: http)
+    try:
+      futures = manager.resume()
+      self.assertEqual({'id': 'f1'}, futures['f1'].result(timeout=5))
+    finally:
+      manager.shutdown()
+    # The journal was behind the server, which had 600 bytes.
+    self.assertEqual(['bytes */%d' % SIZE, 'bytes 600-999/%d' % SIZE],
+                     http.ranges)
+    self.assertEqual({}, UploadJournal(self.journal_name).entries())
+
+  def test_resume_needs_http_factory(self):
+    manager = UploadManager(self.journal_name)
+    try:
+      self.assertRaises(ValueError, manager.resume)
+    finally:
+      manager.shutdown()
+
+  def test_resumed_uploads_get_own_http(self):
+    journal = UploadJournal(self.journal_name)
+    for upload_id in ('f1', 'f2', 'f3'):
+      journal.record(upload_id, self._request(0).to_json())
+    journal.close()
+    made = []
+
+    def factory():
+      made.append(_UploadHttp(0))
+      return made[-1]
+
+    manager = UploadManager(self.journal_name, http_factory=factory,
+                            max_workers=3)
+    try:
+      for future in manager.resume().values():
+        future.result(timeout=5)
+    finally:
+      manager.shutdown()
+    self.assertTrue(made)
+    for http in made:
+      self.assertEqual(1, len(http.threads))
+
+
+if __name__ == '__main__':
+  unittest.main()
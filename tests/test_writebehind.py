@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for apiclient.writebehind."""
+
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+
+import httplib2
+
+from apiclient import batchcodec
+from apiclient import http as apiclient_http
+from apiclient.errors import HttpError
+from apiclient.http import HttpRequest
+from apiclient.retry import RetryPolicy
+from apiclient.writebehind import WriteBehindQueue
+from apiclient.writebehind import WriteSpool
+
+BATCH_URI = 'https://www.googleapis.com/batch'
+
+
+class _BatchHttp(object):
+  """Answers each batch POST as the next of a list of outcomes.
+
+  An outcome is an exception to raise, the status of the whole batch
+  response, or a dict from the path of a part to the status of its response.
+  The last outcome is repeated.
+  """
+
+  def __init__(self, outcomes):
+    self._outcomes = outcomes
+    self.posts = 0
+
+  def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+    self.posts += 1
+    outcome = self._outcomes[min(self.posts, len(self._outcomes)) - 1]
+    if isinstance(outcome, Exception):
+      raise outcome
+    if isinstance(outcome, int):
+      return httplib2.Response({'status': str(outcome)}), '{}'
+    parts = []
+    for content_id, payload in batchcodec.iter_mixed(
+        body, headers['content-type']):
+      path = payload.split(' ', 2)[1]
+      parts.append(('<response-%s>' % content_id[1:-1],
+                    'HTTP/1.1 %d Status\nContent-Type: application/json\n\n{}'
+                    % outcome[path]))
+    content, boundary = batchcodec.write_mixed(parts)
+    return httplib2.Response({
+        'status': '200',
+        'content-type': 'multipart/mixed; boundary="%s"' % boundary,
+        }), content
+
+
+def _insert(http, name):
+  return HttpRequest(http, lambda resp, content: content,
+                     'https://www.googleapis.com/%s' % name, method='POST',
+                     body='{}', headers={'content-type': 'application/json'})
+
+
+class WriteBehindQueueTest(unittest.TestCase):
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.spool = os.path.join(self.dir, 'spool')
+    self.old_policy = apiclient_http.retry_policy
+    apiclient_http.retry_policy = RetryPolicy(base_delay=0.001,
+                                              max_delay=0.001)
+    self.queue = None
+
+  def tearDown(self):
+    if self.queue is not None:
+      self.queue.close(timeout=0)
+    apiclient_http.retry_policy = self.old_policy
+    shutil.rmtree(self.dir)
+
+  def _queue(self, http, **kwargs):
+    self.queue = WriteBehindQueue(self.spool, http, batch_uri=BATCH_URI,
+                                  window=0, **kwargs)
+    return self.queue
+
+  def test_refused_batch_not_retried(self):
+    http = _BatchHttp([400])
+    future = self._queue(http).enqueue(_insert(http, 'a'))
+    self.assertEqual(400, future.exception(5).resp.status)
+    self.assertEqual(1, http.posts)
+
+  def test_transport_errors_capped(self):
+    http = _BatchHttp([socket.error('reset')])
+    future = self._queue(http, max_attempts=3).enqueue(_insert(http, 'a'))
+    self.assertTrue(isinstance(future.exception(5), socket.error))
+    self.assertEqual(3, http.posts)
+
+  def test_server_error_of_batch_retried(self):
+    http = _BatchHttp([503, {'/a': 200}])
+    future = self._queue(http).enqueue(_insert(http, 'a'))
+    self.assertEqual('{}', future.result(5))
+    self.assertEqual(2, http.posts)
+
+  def test_conflict_on_first_attempt_reported(self):
+    http = _BatchHttp([{'/a': 409}])
+    future = self._queue(http).enqueue(_insert(http, 'a'))
+    self.assertTrue(isinstance(future.exception(5), HttpError))
+
+  def test_conflict_after_refused_batch_reported(self):
+    http = _BatchHttp([503, {'/a': 409}])
+    future = self._queue(http).enqueue(_insert(http, 'a'))
+    self.assertTrue(isinstance(future.exception(5), HttpError))
+
+  def test_conflict_after_lost_response_delivered(self):
+    http = _BatchHttp([socket.error('reset'), {'/a': 409}])
+    future = self._queue(http).enqueue(_insert(http, 'a'))
+    self.assertEqual(None, future.exception(5))
+
+  def _spooled(self, sent):
+    http = _BatchHttp([{'/a': 409}])
+    spool = WriteSpool(self.spool)
+    spool.add('a', None, _insert(http, 'a').to_json())
+    if sent:
+      spool.mark_sent(['a'])
+    spool.close()
+    outcomes = []
+    queue = self._queue(http, callback=lambda entry_id, response, exception:
+                        outcomes.append(exception))
+    queue.flush(5)
+    return outcomes
+
+  def test_conflict_of_spooled_request_never_sent_reported(self):
+    outcomes = self._spooled(False)
+    self.assertEqual(1, len(outcomes))
+    self.assertTrue(isinstance(outcomes[0], HttpError))
+
+  def test_conflict_of_spooled_request_sent_delivered(self):
+    self.assertEqual([None], self._spooled(True))
+
+
+if __name__ == '__main__':
+  unittest.main()